@@ -0,0 +1,31 @@
+import json
+import random
+from batch import BatchQuery, BatchWriter, load_queries
+from io_utils import find_hits_in_file
+
+
+def test_split_same_as_each_query_alone(tmp_path):
+    rand = random.Random(5)
+    path = tmp_path / "a.txt"
+    queries = {"a": ["ab", "b"], "b": ["b", "ca"], "c": ["ab"]}
+    batch = BatchQuery(queries)
+    for _ in range(50):
+        path.write_text("".join(rand.choice("abc \n") for _ in range(rand.randint(0, 100))))
+        split = batch.split(find_hits_in_file(str(path), batch.patterns))
+        assert split == [find_hits_in_file(str(path), words) for words in queries.values()]
+
+
+def test_writer_per_query(tmp_path):
+    queries_path = tmp_path / "queries.json"
+    queries_path.write_text(json.dumps({"one": ["LFM"], "two": ["Server", "LFM"]}))
+    (tmp_path / "a.txt").write_text("LFM\nServer\n")
+    batch = BatchQuery(load_queries(str(queries_path)))
+
+    out = tmp_path / "out"
+    writer = BatchWriter(batch, str(out), "ndjson")
+    writer.write(str(tmp_path / "a.txt"), find_hits_in_file(str(tmp_path / "a.txt"), batch.patterns))
+    writer.close()
+
+    assert [n for _, _, n, _ in writer.summary()] == [1, 2]
+    lines = (out / "two.ndjson").read_text().splitlines()
+    assert [json.loads(l)["s"] for l in lines] == ["LFM\n", "Server\n"]
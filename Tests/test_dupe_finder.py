@@ -0,0 +1,90 @@
+import os
+import pytest
+import dupe_finder
+from dupe_finder import DupeFinder, find_blob
+
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_find_stages(tmp_path):
+    blob = os.urandom(10000)
+    a = _write(tmp_path / "a.bin", blob)
+    b = _write(tmp_path / "b.bin", blob)
+    # Same size and head, different tail
+    _write(tmp_path / "c.bin", blob[:-1] + bytes([blob[-1] ^ 1]))
+    # Same head and tail, different middle
+    d = _write(tmp_path / "d.bin", blob[:5000] + bytes([blob[5000] ^ 1]) + blob[5001:])
+    _write(tmp_path / "unique.txt", b"only one of this size")
+    os.link(d, str(tmp_path / "d_link.bin"))
+
+    finder = DupeFinder(sample=1024)
+    groups = finder.find(os.scandir(str(tmp_path)))
+
+    assert groups == [[a, b], [d, str(tmp_path / "d_link.bin")]]
+    size, sample, full = finder.stages
+    assert (size.files_in, size.files_out, size.bytes_read) == (6, 4, 0)
+    assert (sample.files_in, sample.files_out, sample.bytes_read) == (4, 3, 4 * 2048)
+    assert sample.bytes_avoided == 10000 - 2048
+    assert (full.files_in, full.files_out, full.bytes_read) == (3, 2, 30000)
+
+
+def test_find_copies_and_blob(tmp_path):
+    blob = os.urandom(3000)
+    target = _write(tmp_path / "asset.bin", blob)
+    copy = _write(tmp_path / "copy.bin", blob)
+    _write(tmp_path / "other.bin", os.urandom(3000))
+    big = _write(tmp_path / "big.bin", os.urandom(100) + blob + b"x" + blob)
+    _write(tmp_path / "small.bin", blob[:10])
+
+    finder = DupeFinder(sample=512)
+    files = [str(p) for p in sorted(tmp_path.iterdir())]
+    assert finder.find_copies(target, files) == [copy]
+    assert [s.files_out for s in finder.stages] == [2, 1, 1]
+
+    stages = []
+    hits = list(find_blob(blob, files, stages, bigger_only=True))
+    assert [(h.path, h.offset) for h in hits] == [(big, 100), (big, 3101)]
+    assert (stages[0].files_out, stages[0].bytes_read) == (1, 6101)
+
+
+def test_find_copies_unreadable_files(tmp_path, monkeypatch):
+    blob = os.urandom(3000)
+    target = _write(tmp_path / "asset.bin", blob)
+    copy = _write(tmp_path / "copy.bin", blob)
+    locked = _write(tmp_path / "locked.bin", os.urandom(3000))
+    unreadable = {locked}
+    real_hash = dupe_finder.sample_hash
+
+    def sample_hash(path, size, sample):
+        if path in unreadable:
+            raise PermissionError(path)
+        return real_hash(path, size, sample)
+
+    monkeypatch.setattr(dupe_finder, "sample_hash", sample_hash)
+    files = [target, copy, locked]
+    assert DupeFinder(sample=512).find_copies(target, files) == [copy]
+
+    # An unreadable asset is an error, not a match for every unreadable file
+    unreadable.add(target)
+    with pytest.raises(OSError):
+        DupeFinder(sample=512).find_copies(target, files)
+
+
+@pytest.mark.parametrize("kind", ["empty", "folder"])
+def test_copies_of_an_empty_or_folder_asset(tmp_path, capsys, kind):
+    from finder import run_dupes
+    asset = tmp_path / "asset"
+    if kind == "empty":
+        asset.write_bytes(b"")
+    else:
+        asset.mkdir()
+    other = _write(tmp_path / "other.bin", b"data")
+    save_path = str(tmp_path / "dupes.json")
+
+    run_dupes(iter([other]), str(asset), 512, True, save_path)
+
+    assert "The asset must be a file that isn't empty" in capsys.readouterr().out
+    assert not os.path.exists(save_path)
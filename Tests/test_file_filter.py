@@ -0,0 +1,42 @@
+import os
+import folder_utils
+from file_filter import FileFilter, parse_time, split_list
+from file_tree import Node, FolderNode
+from finder import get_all_file_nodes
+
+
+def _make_tree(root):
+    (root / "src").mkdir()
+    (root / "src" / "main.py").write_text("x" * 10)
+    (root / "src" / "test_main.py").write_text("x" * 10)
+    (root / "big.txt").write_text("x" * 5000)
+    (root / "pic.png").write_text("x")
+    (root / "old.txt").write_text("x")
+    os.utime(root / "old.txt", (1000000000, 1000000000))
+
+
+def _names(paths):
+    return sorted(os.path.basename(p) for p in paths)
+
+
+def test_filter_in_walk_and_tree(tmp_path):
+    _make_tree(tmp_path)
+    file_filter = FileFilter(exclude_extensions=["png"], exclude=["test_*"], max_size=1000,
+                             newer_than=parse_time("2010-01-01"))
+
+    walked = [e.path for e in folder_utils.walk_files(str(tmp_path), file_filter=file_filter)]
+    assert _names(walked) == ["main.py"]
+    assert file_filter.rejected == {"extension": 1, "glob": 1, "size": 1, "mtime": 1}
+
+    tree = Node.from_path(str(tmp_path), FolderNode, file_filter=FileFilter(include=["*.py"]))
+    assert _names(get_all_file_nodes(tree)) == ["main.py", "test_main.py"]
+
+
+def test_path_globs_and_extensions(tmp_path):
+    _make_tree(tmp_path)
+    file_filter = FileFilter(extensions=["py", "txt"], include=["*/src/*"], min_size=5)
+    walked = [e.path for e in folder_utils.walk_files(str(tmp_path), file_filter=file_filter)]
+
+    assert _names(walked) == ["main.py", "test_main.py"]
+    assert file_filter.accepts(str(tmp_path / "src" / "main.py"))
+    assert split_list("png, jpg,,") == ["png", "jpg"]
@@ -0,0 +1,107 @@
+import os
+import sys
+import pytest
+from file_tree import Node, FileNode, FolderNode
+
+
+def _names(node: Node):
+    if node.__class__ == FileNode:
+        return node.name
+    return (node.name, sorted((_names(c) for c in node), key=str))
+
+
+def test_from_path_builds_tree(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "b").mkdir()
+    (tmp_path / "top.txt").write_text("x")
+    (tmp_path / "a" / "mid.txt").write_text("x")
+    (tmp_path / "a" / "b" / "low.txt").write_text("x")
+
+    root = Node.from_path(str(tmp_path), FolderNode)
+
+    assert root.path == str(tmp_path)
+    assert _names(root) == (tmp_path.name, sorted([
+        "top.txt", ("a", sorted(["mid.txt", ("b", ["low.txt"])], key=str))
+    ], key=str))
+
+
+def test_from_path_files_before_folders(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "file.txt").write_text("x")
+
+    root = Node.from_path(str(tmp_path), FolderNode)
+
+    assert [c.__class__ for c in root] == [FileNode, FolderNode]
+    assert root[0].path == os.path.join(str(tmp_path), "file.txt")
+
+
+@pytest.fixture
+def deep_dir(tmp_path):
+    yield tmp_path
+
+    # shutil.rmtree can't remove a tree this deep, so it is removed
+    # here even when the test fails half way
+    path = str(tmp_path)
+    while os.path.isdir(os.path.join(path, "d")):
+        path = os.path.join(path, "d")
+    while path != str(tmp_path):
+        os.rmdir(path)
+        path = os.path.dirname(path)
+
+
+def test_from_path_deeper_than_recursion_limit(deep_dir):
+    depth = sys.getrecursionlimit() + 100
+    path = str(deep_dir)
+    for _ in range(depth):
+        path = os.path.join(path, "d")
+        os.mkdir(path)
+
+    node = Node.from_path(str(deep_dir), FolderNode)
+    levels = 0
+    while len(node):
+        node = node[0]
+        levels += 1
+
+    assert levels == depth
+
+
+def test_from_path_symlink_loop(tmp_path):
+    (tmp_path / "a").mkdir()
+    os.symlink(str(tmp_path), str(tmp_path / "a" / "loop"))
+
+    root = Node.from_path(str(tmp_path), FolderNode)
+
+    assert root[0].name == "a"
+
+
+def test_nodes_are_views(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.txt").write_text("x")
+    (tmp_path / "b.txt").write_text("x")
+
+    root = Node.from_path(str(tmp_path), FolderNode)
+    sub = root[1]
+
+    assert sub == root.children[1] and sub is not root.children[1]
+    assert sub[0].path == os.path.join(str(tmp_path), "sub", "a.txt")
+    assert list(root.iter_files()) == [str(tmp_path / "b.txt"), str(tmp_path / "sub" / "a.txt")]
+    assert not hasattr(sub[0], "add_child")
+    assert not hasattr(sub[0], "__dict__")
+
+    # A node of another tree is copied in, and follows its copy
+    other = FolderNode.get_node_from_path(str(tmp_path / "sub"))
+    root.add_child(other)
+    assert other.tree is root.tree
+    assert other[0].path == os.path.join(str(tmp_path), "sub", "a.txt")
+    assert len(root) == 3
+
+
+def test_console_view(tmp_path):
+    from file_tree_view import console_view
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.txt").write_text("x")
+
+    lines = []
+    console_view(Node.from_path(str(tmp_path), FolderNode), lines.append)
+
+    assert lines == ["|" + tmp_path.name, "|-sub", "|--a.txt"]
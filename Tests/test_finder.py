@@ -0,0 +1,75 @@
+import folder_utils
+from file_tree import Node, FolderNode
+from finder import analyse_files, filter_files, get_all_file_nodes, match_files
+
+
+def _make_tree(root):
+    (root / "a" / "b").mkdir(parents=True)
+    (root / "one.txt").write_text("hello world\nnothing\n")
+    (root / "a" / "two.txt").write_text("world\n")
+    (root / "a" / "b" / "three.txt").write_text("hello\n")
+    (root / "a" / "pic.png").write_text("hello\n")
+
+
+def test_walk_files_same_order_as_tree(tmp_path):
+    _make_tree(tmp_path)
+    tree_files = get_all_file_nodes(Node.from_path(str(tmp_path), FolderNode))
+    walked = [e.path for e in folder_utils.walk_files(str(tmp_path))]
+
+    assert walked == tree_files
+
+
+def test_streaming_pipeline_matches_analyse_files(tmp_path):
+    _make_tree(tmp_path)
+    params = {"extensions": ["png"], "ignore": True, "max_size": 1000}
+    files = get_all_file_nodes(Node.from_path(str(tmp_path), FolderNode))
+    occurrences, n = analyse_files(files, ["hello"], **params)
+
+    walked = (e.path for e in folder_utils.walk_files(str(tmp_path)))
+    streamed = list(match_files(filter_files(walked, **params), ["hello"]))
+
+    assert n == len(streamed) == 3
+    assert {f: r for f, r in streamed if r} == occurrences
+    assert sorted(occurrences) == sorted([str(tmp_path / "one.txt"), str(tmp_path / "a" / "b" / "three.txt")])
+
+
+def test_analyse_files_parallel_same_as_serial(tmp_path, monkeypatch):
+    import parallel
+    monkeypatch.setattr(parallel, "SERIAL_LIMIT", 1)
+    _make_tree(tmp_path)
+    for i in range(10):
+        (tmp_path / "extra{:d}.txt".format(i)).write_text("hello\n" * i)
+
+    files = get_all_file_nodes(Node.from_path(str(tmp_path), FolderNode))
+    params = {"extensions": ["png"], "ignore": True, "max_size": 1000}
+    serial, n_serial = analyse_files(files, ["hello"], **params)
+    par, n_par = analyse_files(files, ["hello"], jobs=3, **params)
+
+    assert n_par == n_serial == 13
+    assert list(par) == sorted(serial)
+    assert par == serial
+
+
+def test_make_batches_by_size():
+    from parallel import make_batches
+    files = [("a", 10), ("big", 500), ("b", 60), ("c", 50), ("d", 1)]
+
+    assert list(make_batches(files, batch_bytes=100)) == [["big"], ["a", "b", "c"], ["d"]]
+
+
+def test_limit_leaves_files_early(tmp_path, monkeypatch):
+    import parallel
+    from finder import search_files
+    from io_utils import find_in_file
+    monkeypatch.setattr(parallel, "SERIAL_LIMIT", 1)
+    big = tmp_path / "big.txt"
+    big.write_text("hello 1\nnope\n" + "hello\n" * 100000)
+
+    assert find_in_file(str(big), ["hello"], limit=2) == [(0, "hello 1\n"), (2, "hello\n")]
+    assert len(find_in_file(str(big), ["hello", "1"], limit=2)) == 3
+
+    files = [str(big)] * 20
+    searched = search_files(files, ["hello"], jobs=2, limit=1)
+    file, results = next(searched)
+    searched.close()
+    assert file == str(big) and len(results) == 1
@@ -0,0 +1,48 @@
+import os
+import pytest
+import folder_utils
+from finder import count_pruned
+from ignore_rules import IgnoreRules
+from run_stats import RunStats
+
+
+def _walk(root, ignore):
+    return sorted(os.path.relpath(e.path, str(root)) for e in folder_utils.walk_files(str(root), ignore))
+
+
+def test_walk_honours_gitignore_files(tmp_path):
+    for d in [".git/info", "node_modules/pkg", "src/build", "src/keep", "docs"]:
+        (tmp_path / d).mkdir(parents=True)
+    (tmp_path / ".git" / "HEAD").write_text("ref")
+    (tmp_path / ".git" / "info" / "exclude").write_text("*.tmp\n")
+    (tmp_path / ".gitignore").write_text("node_modules/\n/docs\n*.log\n!keep.log\n")
+    (tmp_path / "src" / ".gitignore").write_text("build/\n**/gen_*.py\n")
+    for f in ["a.py", "a.log", "keep.log", "x.tmp", "node_modules/pkg/i.js", "docs/d.md",
+              "src/b.py", "src/build/out.o", "src/keep/gen_x.py", "src/keep/c.py"]:
+        (tmp_path / f).write_text("x")
+
+    ignore = IgnoreRules.for_root(str(tmp_path))
+    assert _walk(tmp_path, ignore) == sorted([
+        ".gitignore", "a.py", "keep.log", os.path.join("src", ".gitignore"),
+        os.path.join("src", "b.py"), os.path.join("src", "keep", "c.py")])
+    assert ignore.stats == {"folders": 4, "files": 3}
+    assert sorted(os.path.relpath(p, str(tmp_path)) for p in ignore.pruned) == sorted([
+        ".git", "docs", "node_modules", os.path.join("src", "build")])
+    stats = RunStats()
+    count_pruned(stats, ignore)
+    assert stats.counters == {"entries_pruned_by_ignore": 5}
+
+    assert len(_walk(tmp_path, None)) == 14
+
+
+def test_user_ignore_file(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.txt").write_text("x")
+    (tmp_path / "b.txt").write_text("x")
+    rules = tmp_path / "rules"
+    rules.write_text("sub/*.txt\nrules\n")
+
+    assert _walk(tmp_path, IgnoreRules.for_root(str(tmp_path), str(rules))) == ["b.txt"]
+    assert _walk(tmp_path, IgnoreRules.for_root(str(tmp_path), "rules")) == ["b.txt"]
+    with pytest.raises(OSError):
+        IgnoreRules.for_root(str(tmp_path), "missing")
@@ -0,0 +1,83 @@
+import math
+import struct
+import zlib
+import pytest
+from image_hash import PNG_SIGNATURE, ImageError, decode_png, hamming, hash_image
+from image_index import ImageIndex
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def _png(rows, color=2, depth=8, filters=(0,), palette=None):
+    width = len(rows[0]) * 8 // depth // {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[color]
+    bpp = max(1, len(rows[0]) // width) if depth >= 8 else 1
+    raw = b""
+    prev = bytes(len(rows[0]))
+    for y, row in enumerate(rows):
+        kind = filters[y % len(filters)]
+        if kind == 1:
+            data = bytes((row[i] - (row[i - bpp] if i >= bpp else 0)) & 255 for i in range(len(row)))
+        elif kind == 2:
+            data = bytes((row[i] - prev[i]) & 255 for i in range(len(row)))
+        elif kind == 3:
+            data = bytes((row[i] - (((row[i - bpp] if i >= bpp else 0) + prev[i]) >> 1)) & 255
+                         for i in range(len(row)))
+        else:
+            data = row
+        raw += bytes([kind]) + data
+        prev = row
+    png = PNG_SIGNATURE + _chunk(b"IHDR", struct.pack(">IIBBBBB", width, len(rows), depth, color, 0, 0, 0))
+    if palette:
+        png += _chunk(b"PLTE", palette)
+    return png + _chunk(b"IDAT", zlib.compress(raw)) + _chunk(b"IEND", b"")
+
+
+def _logo(size):
+    # Smooth bright and dark waves, as RGB rows
+    rows = []
+    for y in range(size):
+        v = y / size
+        rows.append(b"".join(bytes([int(127 + 120 * math.sin(7 * x / size) * math.cos(5 * v))] * 3)
+                             for x in range(size)))
+    return rows
+
+
+def test_decode_filters(tmp_path):
+    rows = [bytes((x * 7 + y * 13) % 256 for x in range(30)) for y in range(6)]
+    path = tmp_path / "f.png"
+    path.write_bytes(_png(rows, filters=(0, 1, 2, 3)))
+    with open(str(path), "rb") as f:
+        width, height, decoded, stride, _ = decode_png(f)
+        assert (width, height, stride) == (10, 6, 3)
+        assert list(decoded) == rows
+
+    # Two bit palette, four pixels per byte
+    path.write_bytes(_png([b"\x1b"], color=3, depth=2, palette=b"\0\0\0\xff\xff\xff\x80\x80\x80\x10\x10\x10"))
+    assert hash_image(str(path)).width == 4
+
+    path.write_bytes(b"not a png")
+    with pytest.raises(ImageError):
+        hash_image(str(path))
+
+
+def test_resized_images_are_close(tmp_path):
+    small = tmp_path / "logo.png"
+    small.write_bytes(_png(_logo(32)))
+    big = tmp_path / "logo_big.png"
+    big.write_bytes(_png(_logo(96), filters=(1, 2)))
+    other = tmp_path / "other.png"
+    # Darker to the right
+    other.write_bytes(_png([b"".join(bytes([255 - x * 8] * 3) for x in range(32))] * 32))
+
+    a, b, c = (hash_image(str(p)) for p in (small, big, other))
+    assert hamming(a.dhash, b.dhash) <= 4
+    assert hamming(a.ahash, b.ahash) <= 4
+    assert hamming(a.dhash, c.dhash) > 10
+
+    with ImageIndex(str(tmp_path / "index.sqlite")) as index:
+        files = [str(small), str(big), str(other)]
+        assert index.update(files) == (3, 0, 0, 0)
+        assert index.update(files[:2]) == (0, 0, 1, 2)
+        assert [p for p, _ in index.query(a, 4)] == [str(small), str(big)]
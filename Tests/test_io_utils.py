@@ -0,0 +1,105 @@
+import random
+import pytest
+import io_utils
+
+
+def _text_search(path, matches):
+    with open(path, "r", errors="ignore") as f:
+        lines = enumerate(list(f))
+    return [(n, s) for n, s in lines for match in matches if match in s]
+
+
+@pytest.mark.parametrize("mmap_min_size", [0, 1 << 30])
+@pytest.mark.parametrize("alphabet", [b"ab \n", b"ab \r\n", b"ab \n\xc3\xa9\xff"])
+def test_find_in_file_same_as_text_search(tmp_path, monkeypatch, mmap_min_size, alphabet):
+    monkeypatch.setattr(io_utils, "MMAP_MIN_SIZE", mmap_min_size)
+    rand = random.Random(alphabet)
+    path = str(tmp_path / "file.txt")
+    for _ in range(50):
+        with open(path, "wb") as f:
+            f.write(bytes(rand.choice(alphabet) for _ in range(rand.randint(0, 200))))
+        matches = ["".join(rand.choice("ab \né") for _ in range(rand.randint(1, 3))) for _ in range(3)]
+
+        assert io_utils.find_in_file(path, matches) == _text_search(path, matches)
+
+
+def test_is_binary_data():
+    assert not io_utils.is_binary_data(b"")
+    assert not io_utils.is_binary_data(b"plain text\n")
+    assert not io_utils.is_binary_data("café".encode("utf-8")[:-1])
+    assert not io_utils.is_binary_data("très bien, café au lait".encode("latin-1"))
+    assert io_utils.is_binary_data(b"ELF\x00\x01")
+    assert io_utils.is_binary_data(bytes(range(128, 256)))
+
+
+def test_find_offsets_in_file(tmp_path):
+    path = tmp_path / "blob.bin"
+    path.write_bytes(b"\x00abcab\x00\xffcaf\xc3\xa9")
+
+    assert io_utils.find_offsets_in_file(str(path), ["ab", "bca", "café"]) == [
+        (1, "ab"), (2, "bca"), (4, "ab"), (8, "café")]
+
+
+def test_chunked_search_same_as_whole_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(io_utils, "CHUNKED_MIN_SIZE", 0)
+    monkeypatch.setattr(io_utils, "CHUNK_SIZE", 7)
+    rand = random.Random(3)
+    path = str(tmp_path / "file.txt")
+    for _ in range(50):
+        with open(path, "wb") as f:
+            f.write(bytes(rand.choice(b"ab \r\n\xc3\xa9") for _ in range(rand.randint(0, 300))))
+        matches = ["ab", "b a", "\xe9"]
+
+        assert io_utils.find_in_file(path, matches) == _text_search(path, matches)
+        assert io_utils.find_in_file(path, matches, limit=2) == io_utils.find_in_data(open(path, "rb").read(), matches, 2)
+        text = io_utils.read_text(path)
+        assert [text[h.start:h.end] for h in io_utils.find_hits_in_file(path, matches)] == \
+            [s for _, s in _text_search(path, matches)]
+
+
+def test_chunked_offsets_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(io_utils, "MMAP_MIN_SIZE", 0)
+    monkeypatch.setattr(io_utils, "CHUNKED_MIN_SIZE", 0)
+    monkeypatch.setattr(io_utils, "CHUNK_SIZE", 5)
+    rand = random.Random(4)
+    path = str(tmp_path / "file.bin")
+    for _ in range(50):
+        data = bytes(rand.choice(b"ab\0") for _ in range(rand.randint(1, 100)))
+        with open(path, "wb") as f:
+            f.write(data)
+        matches = ["ab", "bab\0", "a"]
+
+        chunked = io_utils.find_offsets_in_file(path, matches)
+        assert sorted(chunked) == sorted(io_utils.compile_patterns(matches).find_offsets(data))
+
+
+def test_text_blocks_without_new_lines(tmp_path):
+    path = tmp_path / "long.txt"
+    text = "café ab " * 500 + "\nlast"
+    path.write_text(text, encoding="utf-8")
+
+    blocks = list(io_utils.iter_text_blocks(str(path), chunk_size=100))
+
+    assert max(len(b) for _, _, b in blocks) <= 200
+    assert "".join(b for _, _, b in blocks) == io_utils.read_text(str(path))
+    assert [offset for _, offset, _ in blocks] == [sum(len(b) for _, _, b in blocks[:i]) for i in range(len(blocks))]
+    assert blocks[-1][0] == 1
+
+
+def test_hit_across_a_cut_line(tmp_path, monkeypatch):
+    monkeypatch.setattr(io_utils, "CHUNKED_MIN_SIZE", 0)
+    monkeypatch.setattr(io_utils, "CHUNK_SIZE", 1000)
+    path = tmp_path / "long.txt"
+    # The line is cut 2000 characters in, through the first NEEDLE
+    text = "first\n" + "café " * 398 + " NEEDLE" + "é" * 3000 + " NEEDLE end\nlast NEEDLE\n"
+    path.write_text(text, encoding="utf-8")
+    blocks = [b for _, _, b in io_utils.iter_text_blocks(str(path), 1000)]
+    assert sum(b.count("NEEDLE") for b in blocks) == 2
+
+    start = text.index("\n") + 1
+    end = text.index("\n", start) + 1
+    line = text[start:end]
+    hits = io_utils.find_hits_in_file(str(path), ["NEEDLE", "end"])
+    assert hits == [(1, start, end, 1991, 0), (1, start, end, line.index("end"), 1), (2, end, len(text), 5, 0)]
+    assert io_utils.find_in_file(str(path), ["NEEDLE", "end"], limit=1) == [(1, line)] * 2
+    assert io_utils.read_spans(str(path), [(h.start, h.end) for h in hits]) == [line, line, "last NEEDLE\n"]
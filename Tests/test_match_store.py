@@ -0,0 +1,23 @@
+import io_utils
+from match_store import MatchStore
+
+
+def test_store_gives_same_entries_as_find_in_file(tmp_path):
+    a = tmp_path / "a.txt"
+    b = tmp_path / "b.txt"
+    a.write_text("one LFM\ntwo\nServer LFM three\n")
+    b.write_bytes("caf\xc3\xa9 LFM\r\nServer\r\n".encode("latin-1"))
+    matches = ["LFM", "Server", "LFM"]
+
+    store = MatchStore(matches)
+    for path in [str(a), str(b)]:
+        store.add(path, io_utils.find_hits_in_file(path, matches))
+
+    by_file = dict(store.by_file())
+    for path in [str(a), str(b)]:
+        assert by_file[path] == io_utils.find_in_file(path, matches)
+    assert len(store) == sum(len(v) for v in by_file.values())
+
+    third = by_file[str(a)][3]
+    assert (third.line, third.column, third.pattern, third.path) == (2, 0, "Server", str(a))
+    assert third._asdict() == {"line": 2, "s": "Server LFM three\n"}
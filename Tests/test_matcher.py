@@ -0,0 +1,69 @@
+import random
+import re
+from matcher import Entry, Hit, Match, PatternMatcher, RegexMatcher, compile_patterns, required_literal
+
+
+def _legacy(text, matches):
+    lines = text.split("\n")
+    lines = [l + "\n" for l in lines[:-1]] + ([lines[-1]] if lines[-1] else [])
+    return [Entry(n, s) for n, s in enumerate(lines) for match in matches if match in s]
+
+
+def test_find_lines_same_as_substring_loop():
+    rand = random.Random(1)
+    for _ in range(300):
+        text = "".join(rand.choice("ab c\n") for _ in range(rand.randint(0, 80)))
+        matches = ["".join(rand.choice("abc \n") for _ in range(rand.randint(0, 3)))
+                   for _ in range(rand.randint(1, 5))]
+        assert PatternMatcher(matches).find_lines(text) == _legacy(text, matches), (text, matches)
+
+
+def test_find_all_reports_pattern_and_column():
+    matcher = PatternMatcher(["he", "she", "hers"])
+    text = "ushers\nnothing\nshe\n"
+
+    assert matcher.find_all(text) == [
+        Match(0, 1, "she", "ushers\n"),
+        Match(0, 2, "he", "ushers\n"),
+        Match(0, 2, "hers", "ushers\n"),
+        Match(2, 0, "she", "she\n"),
+        Match(2, 1, "he", "she\n"),
+    ]
+
+
+def test_regex_modes_same_as_line_loop():
+    rand = random.Random(2)
+    modes = [(True, False, False), (False, True, False), (False, False, True), (True, True, True)]
+    for regex, ignore_case, word in modes:
+        for _ in range(100):
+            text = "".join(rand.choice("aB c1.\n") for _ in range(rand.randint(0, 60)))
+            patterns = [rand.choice(["ab", "c", r"\d", "b c", r"a\w", "x?"]) for _ in range(rand.randint(1, 3))]
+            matcher = RegexMatcher(patterns, regex, ignore_case, word)
+
+            flags = re.IGNORECASE if ignore_case else 0
+            sources = [p if regex else re.escape(p) for p in patterns]
+            if word:
+                sources = [r"(?<!\w)(?:" + p + r")(?!\w)" for p in sources]
+            expected = [Entry(n, s) for n, s in enumerate(text.splitlines(keepends=True))
+                        for p in sources if re.search(p, s, flags)]
+
+            assert matcher.find_lines(text) == expected, (text, patterns)
+            if not matcher.has_empty:
+                assert matcher.find_lines_ascii(text.encode()) == expected
+                assert matcher.find_line_hits(text.encode()) == matcher.find_line_hits(text)
+
+
+def test_word_and_case_find_what_spaces_missed():
+    matcher = compile_patterns(["LFM"], ignore_case=True, word=True)
+    text = "LFM first\nsee (lfm).\nLFMx\n"
+
+    assert isinstance(compile_patterns(["LFM"]), PatternMatcher)
+    assert matcher.find_line_hits(text) == [Hit(0, 0, 10, 0, 0), Hit(1, 10, 21, 5, 0)]
+    assert matcher._prefilter is not None
+
+
+def test_required_literal():
+    assert required_literal(r"\bServer\d+") == "Server"
+    assert required_literal(r"ab?cdef") == "cdef"
+    assert required_literal(r"a|b") == ""
+    assert required_literal(r"(?i)abc") == ""
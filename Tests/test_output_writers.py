@@ -0,0 +1,56 @@
+import io_utils
+import json
+from matcher import Entry
+from output_writers import open_writer, output_path
+
+
+def _write(path, out_format, sort=False):
+    writer = open_writer(path, out_format, sort)
+    writer.write("b.txt", [Entry(1, "x\n"), Entry(3, "y\n")])
+    writer.write("a.txt", [Entry(0, "z\n")])
+    writer.close()
+    with open(path) as f:
+        return f.read()
+
+
+def test_json_document(tmp_path):
+    out = json.loads(_write(str(tmp_path / "out.json"), "json", sort=True))
+
+    assert list(out) == ["a.txt", "b.txt"]
+    assert out["b.txt"] == [{"line": 1, "s": "x\n"}, {"line": 3, "s": "y\n"}]
+
+
+def test_ndjson_records(tmp_path):
+    per_match = [json.loads(l) for l in _write(str(tmp_path / "m"), "ndjson").splitlines()]
+    per_file = [json.loads(l) for l in _write(str(tmp_path / "f"), "ndjson-files").splitlines()]
+
+    assert per_match == [{"path": "b.txt", "line": 1, "s": "x\n"}, {"path": "b.txt", "line": 3, "s": "y\n"},
+                         {"path": "a.txt", "line": 0, "s": "z\n"}]
+    assert per_file[1] == {"path": "a.txt", "matches": [{"line": 0, "s": "z\n"}]}
+
+
+def test_output_path(tmp_path):
+    assert output_path(None, "json") == "output.json"
+    assert output_path(str(tmp_path), "ndjson") == str(tmp_path / "output.ndjson")
+    assert output_path(str(tmp_path / "res.json"), "json") == str(tmp_path / "res.json")
+
+
+def test_json_same_lines_as_ndjson_for_a_long_line(tmp_path):
+    path = tmp_path / "long.txt"
+    line = "x" * io_utils.CHUNK_SIZE + " match\n"
+    path.write_text(line + "last\n")
+    matches = ["match"]
+
+    json_writer = open_writer(str(tmp_path / "out.json"), "json", patterns=matches)
+    json_writer.write(str(path), io_utils.find_hits_in_file(str(path), matches))
+    json_writer.close()
+    ndjson_writer = open_writer(str(tmp_path / "out.ndjson"), "ndjson")
+    ndjson_writer.write(str(path), io_utils.find_in_file(str(path), matches))
+    ndjson_writer.close()
+
+    with open(str(tmp_path / "out.json")) as f:
+        document = json.load(f)
+    with open(str(tmp_path / "out.ndjson")) as f:
+        records = [json.loads(l) for l in f]
+    assert document[str(path)] == [{"line": 0, "s": line}]
+    assert [{"line": r["line"], "s": r["s"]} for r in records] == document[str(path)]
@@ -0,0 +1,31 @@
+import read_ahead
+from finder import match_files
+from read_ahead import match_files_read_ahead
+
+
+def _make_files(root):
+    contents = ["hello world\n", "", "café hello\r\nhello\r\n", "nothing\n", "hello\n" * 500]
+    paths = []
+    for i, text in enumerate(contents):
+        path = root / "f{:d}.txt".format(i)
+        path.write_bytes(text.encode("utf-8"))
+        paths.append(str(path))
+    return paths
+
+
+def test_same_results_as_serial(tmp_path, monkeypatch):
+    monkeypatch.setattr(read_ahead, "READ_AHEAD_MAX_FILE", 1000)
+    files = _make_files(tmp_path)
+    for compact in (False, True):
+        serial = list(match_files(files, ["hello"], compact))
+        ahead = list(match_files_read_ahead(files, ["hello"], threads=3, compact=compact, budget=40))
+        assert ahead == serial
+
+
+def test_budget_and_big_files(tmp_path):
+    files = _make_files(tmp_path)
+    read = list(read_ahead.read_ahead(files, threads=2, budget=20, max_file=1000))
+
+    assert [p for p, _ in read] == files
+    assert read[0][1] == b"hello world\n"
+    assert read[4][1] is None
@@ -0,0 +1,39 @@
+import os
+import stat
+import pytest
+from replacer import Replacer, parse_replacement, replace_files
+
+
+def test_replace_keeps_bytes_and_mode(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"old \xff\r\nold-x\r\nfold\n")
+    os.chmod(path, 0o751)
+
+    results = list(replace_files([str(path)], Replacer("old", "new", word=True)))
+
+    assert [(r.count, r.old_size, r.new_size) for r in results] == [(2, 19, 19)]
+    assert path.read_bytes() == b"new \xff\r\nnew-x\r\nfold\n"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o751
+    assert os.listdir(tmp_path) == ["a.txt"]
+
+
+def test_dry_run_and_parallel(tmp_path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / "f{:d}.txt".format(i)
+        path.write_text("v1.{:d} and V1.0\n".format(i))
+        paths.append(str(path))
+    replacer = Replacer(r"v1\.(\d)", r"v2.\1", regex=True, ignore_case=True)
+
+    dry = list(replace_files(paths, replacer, dry_run=True))
+    assert "+v2.0 and v2.0\n" in dry[0].diff
+    assert open(paths[0]).read() == "v1.0 and V1.0\n"
+
+    assert [r.count for r in replace_files(paths, replacer, jobs=2)] == [2] * 6
+    assert open(paths[3]).read() == "v2.3 and v2.0\n"
+
+
+def test_parse_replacement():
+    assert parse_replacement("a=b=c") == ("a", "b=c")
+    with pytest.raises(ValueError):
+        parse_replacement("=b")
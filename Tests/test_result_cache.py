@@ -0,0 +1,95 @@
+import os
+from finder import match_files
+from result_cache import ResultCache, match_files_cached
+
+
+def _run(files, cache):
+    return dict(match_files_cached(files, cache, lambda fs: match_files(fs, ["hello"])))
+
+
+def test_cache_hits_and_invalidation(tmp_path):
+    db = str(tmp_path / "cache.sqlite")
+    a = tmp_path / "a.txt"
+    b = tmp_path / "b.txt"
+    a.write_text("hello\n")
+    b.write_text("nothing\n")
+    files = [str(a), str(b)]
+
+    with ResultCache(db, ["hello"]) as cache:
+        first = _run(files, cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    a.write_text("x\nhello again\n")
+    with ResultCache(db, ["hello"]) as cache:
+        second = _run(files, cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert second[str(a)] == [(1, "hello again\n")]
+    assert second[str(b)] == first[str(b)] == []
+
+    with ResultCache(db, ["other"]) as cache:
+        _run(files, cache)
+    assert cache.misses == 2
+
+    with ResultCache(db, ["hello"], rebuild=True) as cache:
+        _run(files, cache)
+    assert cache.hits == 0
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    db = str(tmp_path / "cache.sqlite")
+    files = []
+    for i in range(5):
+        path = tmp_path / "f{:d}.txt".format(i)
+        path.write_text("hello\n")
+        files.append(str(path))
+
+    with ResultCache(db, ["hello"], max_bytes=60) as cache:
+        _run(files, cache)
+    with ResultCache(db, ["hello"]) as cache:
+        _run(files, cache)
+
+    assert 0 < cache.hits < 5
+
+
+def test_warm_cache_streams_hits(tmp_path):
+    db = str(tmp_path / "cache.sqlite")
+    files = []
+    for i in range(50):
+        path = tmp_path / "f{:d}.txt".format(i)
+        path.write_text("hello\n")
+        files.append(str(path))
+    with ResultCache(db, ["hello"]) as cache:
+        _run(files, cache)
+
+    walked = []
+
+    def walk():
+        for file in files:
+            walked.append(file)
+            yield file
+
+    with ResultCache(db, ["hello"]) as cache:
+        searched = match_files_cached(walk(), cache, lambda fs: match_files(fs, ["hello"]))
+        assert next(searched)[1] == [(0, "hello\n")]
+        assert len(walked) < len(files)
+        searched.close()
+    assert cache.hits < len(files)
+
+
+def test_binary_checks_evicted(tmp_path):
+    db = str(tmp_path / "cache.sqlite")
+    files = []
+    for i in range(5):
+        path = tmp_path / "f{:d}.bin".format(i)
+        path.write_bytes(b"\0")
+        files.append((str(path), os.stat(str(path))))
+
+    with ResultCache(db, ["hello"], max_binary_rows=3) as cache:
+        for path, st in files:
+            cache.put_binary(path, st, True)
+        cache.flush()
+        # The first file is used again, so it is kept
+        assert cache.get_binary(*files[0]) is True
+    with ResultCache(db, ["hello"]) as cache:
+        kept = [cache.get_binary(path, st) for path, st in files]
+    assert kept == [True, None, None, True, True]
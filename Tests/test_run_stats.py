@@ -0,0 +1,30 @@
+import time
+from run_stats import NullStats, RunStats
+
+
+def _slow(n, delay):
+    for i in range(n):
+        time.sleep(delay)
+        yield i
+
+
+def test_nested_stages_are_charged_separately():
+    stats = RunStats()
+    inner = stats.timed("inner", _slow(3, 0.01))
+    outer = stats.timed("outer", (time.sleep(0.02) or i for i in inner))
+    assert list(outer) == [0, 1, 2]
+
+    data = stats.to_dict()["phases"]
+    assert 0.03 <= data["inner"]["wall"] < 0.06
+    assert 0.06 <= data["outer"]["wall"] < 0.09
+
+
+def test_counters_and_null_stats(tmp_path):
+    stats = RunStats()
+    (tmp_path / "a.txt").write_text("12345")
+    assert list(stats.count_bytes([str(tmp_path / "a.txt")])) == [str(tmp_path / "a.txt")]
+    stats.add("matches", 2)
+    assert stats.to_dict()["counters"] == {"bytes_read": 5, "matches": 2}
+
+    items = [1, 2]
+    assert NullStats().timed("walk", items) is items
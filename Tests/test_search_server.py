@@ -0,0 +1,82 @@
+import os
+import threading
+from search_server import ContentCache, WarmTree, request, serve
+
+
+def test_content_cache_budget():
+    cache = ContentCache(10)
+    cache.put("a", b"1234")
+    cache.put("b", b"5678")
+    assert cache.get("a") == b"1234"
+    cache.put("c", b"90ab")
+    # b was the least recently used
+    assert cache.get("b") is None
+    assert (len(cache), cache.nbytes, cache.evictions) == (2, 8, 1)
+
+
+def test_tree_follows_changes(tmp_path):
+    (tmp_path / "a.txt").write_text("one LFM\n")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "b.txt").write_text("two\nLFM two\n")
+    tree = WarmTree(str(tmp_path), budget=1000)
+    try:
+        assert tree.warm() == 2
+        found = dict(tree.search(["LFM"]))
+        assert sorted(found) == [str(tmp_path / "a.txt"), str(tmp_path / "sub" / "b.txt")]
+        assert tree.cache.hits == 2
+
+        (tmp_path / "a.txt").write_text("none\n")
+        os.makedirs(str(tmp_path / "sub" / "new"))
+        (tmp_path / "sub" / "new" / "c.txt").write_text("LFM\n")
+        os.remove(str(tmp_path / "sub" / "b.txt"))
+        tree.update(timeout=1)
+        assert [p for p, _ in tree.search(["LFM"])] == [str(tmp_path / "sub" / "new" / "c.txt")]
+
+        # Files written inside the new folder are watched too
+        (tmp_path / "sub" / "new" / "d.txt").write_text("LFM\n")
+        tree.update(timeout=1)
+        assert len(list(tree.search(["LFM"]))) == 2
+    finally:
+        tree.close()
+
+
+def test_serve_and_request(tmp_path):
+    (tmp_path / "a.txt").write_text("x LFM y\n")
+    tree = WarmTree(str(tmp_path))
+    socket_path = str(tmp_path / "s.sock")
+    thread = threading.Thread(target=serve, args=(tree, socket_path))
+    thread.start()
+    try:
+        while not os.path.exists(socket_path):
+            thread.join(0.01)
+        replies = list(request(socket_path, {"words": ["lfm"], "ignore_case": True}))
+        assert replies[0] == {"path": str(tmp_path / "a.txt"), "matches": [[0, "x LFM y\n"]]}
+        assert replies[-1]["done"] and replies[-1]["files"] == 1
+        assert "error" in list(request(socket_path, {"words": ["("], "regex": True}))[-1]
+    finally:
+        list(request(socket_path, {"command": "stop"}))
+        thread.join()
+        tree.close()
+    assert not os.path.exists(socket_path)
+
+
+def test_tree_drops_removed_nodes(tmp_path):
+    (tmp_path / "keep.txt").write_text("LFM\n")
+    tree = WarmTree(str(tmp_path))
+    try:
+        for i in range(20):
+            os.makedirs(str(tmp_path / "tmp" / "sub"))
+            (tmp_path / "tmp" / "sub" / "a.txt").write_text("x\n")
+            tree.update(timeout=1)
+            os.remove(str(tmp_path / "tmp" / "sub" / "a.txt"))
+            os.rmdir(str(tmp_path / "tmp" / "sub"))
+            os.rmdir(str(tmp_path / "tmp"))
+            tree.update(timeout=1)
+        # Each round adds and drops 3 nodes, the tree is compacted
+        assert len(tree.root.tree) <= 8
+        assert [p for p, _ in tree.search(["LFM"])] == [str(tmp_path / "keep.txt")]
+        (tmp_path / "new.txt").write_text("LFM\n")
+        tree.update(timeout=1)
+        assert len(list(tree.search(["LFM"]))) == 2
+    finally:
+        tree.close()
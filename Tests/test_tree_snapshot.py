@@ -0,0 +1,90 @@
+import json
+import os
+import pytest
+from file_tree import FileNode, FolderNode, Node
+from file_tree_view import json_view
+from ignore_rules import IgnoreRules
+from tree_snapshot import SnapshotError, load, open_tree, revalidate, save
+
+
+def _make(tmp_path):
+    root = tmp_path / "root"
+    (root / "a" / "b").mkdir(parents=True)
+    (root / "c").mkdir()
+    (root / "top.txt").write_text("x")
+    (root / "a" / "mid.txt").write_text("x")
+    (root / "a" / "b" / "low.txt").write_text("x")
+    (root / "c" / "café.txt").write_text("x")
+    return root
+
+
+def test_save_and_load(tmp_path):
+    root = _make(tmp_path)
+    tree = Node.from_path(str(root), FolderNode)
+    snapshot = str(tmp_path / "tree.snap")
+
+    assert save(tree, snapshot) == 8
+    loaded = load(snapshot)
+
+    assert loaded.path == str(root)
+    assert list(loaded.iter_files()) == list(tree.iter_files())
+    assert [c.__class__ for c in loaded] == [FileNode, FolderNode, FolderNode]
+    folder = next(c for c in loaded if c.name == "a")
+    assert folder[0].path == str(root / "a" / "mid.txt")
+
+    with open(snapshot, "r+b") as f:
+        f.truncate(20)
+    with pytest.raises(SnapshotError):
+        load(snapshot)
+
+
+def test_revalidate_lists_changed_folders(tmp_path):
+    root = _make(tmp_path)
+    snapshot = str(tmp_path / "tree.snap")
+    save(Node.from_path(str(root), FolderNode), snapshot)
+
+    loaded = load(snapshot)
+    assert revalidate(loaded) == (4, 0)
+
+    (root / "a" / "new.txt").write_text("x")
+    (root / "c" / "café.txt").unlink()
+    (root / "c" / "d").mkdir()
+    (root / "c" / "d" / "deep.txt").write_text("x")
+    os.rename(str(root / "a" / "b"), str(root / "b"))
+
+    loaded = load(snapshot)
+    # The new folders are walked, the one moved away is not checked
+    assert revalidate(loaded) == (3, 3)
+    fresh = Node.from_path(str(root), FolderNode)
+    assert sorted(loaded.iter_files()) == sorted(fresh.iter_files())
+
+    save(loaded, snapshot)
+    assert revalidate(load(snapshot)) == (5, 0)
+
+
+def test_open_tree_keeps_ignore_rules(tmp_path):
+    root = _make(tmp_path)
+    (root / ".gitignore").write_text("*.log\n")
+    (root / "a" / "b" / "skip.log").write_text("x")
+    snapshot = str(tmp_path / "tree.snap")
+
+    first = open_tree(str(root), snapshot, IgnoreRules.for_root(str(root)))
+    (root / "a" / "b" / "more.log").write_text("x")
+    (root / "a" / "b" / "more.txt").write_text("x")
+    second = open_tree(str(root), snapshot, IgnoreRules.for_root(str(root)))
+
+    assert not any(p.endswith(".log") for p in second.iter_files())
+    assert len(list(second.iter_files())) == len(list(first.iter_files())) + 1
+
+
+def test_json_view(tmp_path):
+    root = _make(tmp_path)
+    path = str(tmp_path / "tree.json")
+
+    json_view(Node.from_path(str(root), FolderNode), path)
+
+    with open(path) as f:
+        view = json.load(f)
+    assert view["path"] == str(root)
+    assert view["children"][0] == "top.txt"
+    assert {"name": "c", "children": ["café.txt"]} in view["children"]
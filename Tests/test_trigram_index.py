@@ -0,0 +1,24 @@
+import os
+from trigram_index import TrigramIndex
+
+
+def test_candidates_and_incremental_update(tmp_path):
+    a = tmp_path / "a.txt"
+    b = tmp_path / "b.txt"
+    a.write_text("the NetView server\n")
+    b.write_text("nothing here\n")
+    files = [str(a), str(b)]
+
+    with TrigramIndex(str(tmp_path / "index.sqlite")) as index:
+        assert index.update(files) == (2, 0, 0)
+        assert index.candidates(["NetView"]) == [str(a)]
+        assert index.candidates(["LFM"]) == []
+        assert index.candidates(["ab"]) == sorted(files)
+
+        b.write_text("LFM\n")
+        os.utime(str(b), ns=(1, 1))
+        assert index.update(files) == (1, 0, 1)
+        assert index.candidates(["LFM", "NetView"]) == sorted(files)
+
+        assert index.update([str(b)]) == (0, 1, 1)
+        assert index.candidates(["NetView", "LFM"]) == [str(b)]
@@ -0,0 +1,105 @@
+# batch.py - Several named queries searched in a single pass
+from typing import Dict, List, NamedTuple, NoReturn, Tuple
+import json
+import os
+import io_utils
+from matcher import ByteEntry, Entry
+from output_writers import open_writer, output_path
+
+
+def load_queries(path: str) -> Dict[str, List[str]]:
+    """
+    Reads the queries of a batch from a JSON file mapping each
+    query name to its list of words, E.g.
+    {"product_a": ["LFM", "Server"], "product_b": ["NetView"]}.
+    :param path: String representing the queries file path.
+    :return: Dict of query name to its words, in file order.
+    """
+    with open(path) as f:
+        queries = json.load(f)
+
+    if not isinstance(queries, dict) or not queries:
+        raise ValueError("The queries file must hold an object of name -> list of words")
+    for name, words in queries.items():
+        # The name is the output file name
+        if not name or os.sep in name or name.startswith("."):
+            raise ValueError("Invalid query name: {!r}".format(name))
+        if not isinstance(words, list) or not words or not all(isinstance(w, str) for w in words):
+            raise ValueError("Query {:s} must be a non empty list of words".format(name))
+    return queries
+
+
+class BatchQuery(object):
+    """
+    The words of all the queries as one pattern list, so they
+    are compiled into one matcher and each file is searched once.
+    The Hit records of a file are then split back per query.
+    """
+
+    def __init__(self, queries: Dict[str, List[str]]):
+        self.names = list(queries)
+        self.queries = [list(queries[name]) for name in self.names]
+        self.patterns = [w for words in self.queries for w in words]
+        # Query and position in it of each pattern
+        self._owners = [(q, i) for q, words in enumerate(self.queries) for i in range(len(words))]
+
+    def split(self, hits: List[NamedTuple]) -> List[List[NamedTuple]]:
+        """
+        Splits the results of a file searched for all the patterns.
+        :param hits: List of Hit records, from find_hits_in_file, or
+        ByteEntry records of a binary file.
+        :return: List with the records of each query, Hits numbered
+        like the query's own words, so they match a search for
+        that query alone.
+        """
+        per_query = [[] for _ in self.queries]
+        for h in hits:
+            if isinstance(h, ByteEntry):
+                for q, words in enumerate(self.queries):
+                    if h.pattern in words:
+                        per_query[q].append(h)
+                continue
+            q, i = self._owners[h.pattern]
+            per_query[q].append(h._replace(pattern=i))
+        return per_query
+
+
+class BatchWriter(object):
+    """
+    Writes the results of each query of a batch to its own output
+    (<name>.json or <name>.ndjson in the save folder), like the
+    writer of a single query would.
+    """
+
+    def __init__(self, batch: BatchQuery, save: str, out_format: str, sort: bool = False):
+        if save:
+            os.makedirs(save, exist_ok=True)
+        self.batch = batch
+        self.entries = out_format != "json"
+        self.paths = [output_path(save, out_format, name) for name in batch.names]
+        self.writers = [open_writer(path, out_format, sort, patterns)
+                        for path, patterns in zip(self.paths, batch.queries)]
+        self.files = [0] * len(self.writers)
+        self.matches = [0] * len(self.writers)
+
+    def write(self, file: str, results: List[NamedTuple]) -> NoReturn:
+        for q, hits in enumerate(self.batch.split(results)):
+            if not hits:
+                continue
+            if self.entries and not isinstance(hits[0], ByteEntry):
+                # The streaming formats are given the lines
+                lines = io_utils.read_spans(file, [(h.start, h.end) for h in hits])
+                hits = [Entry(h.line, s) for h, s in zip(hits, lines)]
+            self.writers[q].write(file, hits)
+            self.files[q] += 1
+            self.matches[q] += len(hits)
+
+    def close(self) -> NoReturn:
+        for writer in self.writers:
+            writer.close()
+
+    def summary(self) -> List[Tuple[str, int, int, str]]:
+        """
+        :return: List of (name, files matched, matches, output path).
+        """
+        return list(zip(self.batch.names, self.files, self.matches, self.paths))
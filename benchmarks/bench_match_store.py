@@ -0,0 +1,66 @@
+""" bench_match_store.py - Compares the memory used by the
+results kept as Entry lists and kept in a MatchStore.
+
+Usage:
+    python benchmarks/bench_match_store.py [n_files]
+"""
+
+from typing import Callable, NoReturn
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from match_store import MatchStore  # noqa: E402
+import io_utils  # noqa: E402
+
+
+def measure(func: Callable[[], object]):
+    # Timed apart from tracemalloc, which slows everything down
+    start = time.perf_counter()
+    func()
+    wall = time.perf_counter() - start
+
+    tracemalloc.start()
+    kept = func()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return kept, size, wall
+
+
+def main() -> NoReturn:
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    matches = [" Server ", " LFM "]
+
+    with tempfile.TemporaryDirectory() as root:
+        files = []
+        for i in range(n_files):
+            path = os.path.join(root, "file{:d}.txt".format(i))
+            with open(path, "w") as f:
+                for n in range(100):
+                    f.write("line {:d} of the Server config, used by the LFM service\n".format(n))
+            files.append(path)
+
+        def as_lists():
+            return {f: io_utils.find_in_file(f, matches) for f in files}
+
+        def as_store():
+            store = MatchStore(matches)
+            for f in files:
+                store.add(f, io_utils.find_hits_in_file(f, matches))
+            return store
+
+        lists, lists_size, lists_wall = measure(as_lists)
+        store, store_size, store_wall = measure(as_store)
+
+        n_matches = sum(len(r) for r in lists.values())
+        print("{:d} matches in {:d} files".format(n_matches, n_files))
+        print("Entry lists: {:8.2f} MB  {:6.3f}s".format(lists_size / 1e6, lists_wall))
+        print("MatchStore:  {:8.2f} MB  {:6.3f}s".format(store_size / 1e6, store_wall))
+
+
+if __name__ == "__main__":
+    main()
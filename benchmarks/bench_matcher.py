@@ -0,0 +1,70 @@
+""" bench_matcher.py - Compares the PatternMatcher with the
+original `match in s` loop for a growing number of patterns.
+
+Usage:
+    python benchmarks/bench_matcher.py [n_lines]
+"""
+
+from collections import namedtuple
+from typing import Callable, List, NoReturn
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matcher import PatternMatcher  # noqa: E402
+
+
+def legacy_find(text: str, matches: List[str]) -> list:
+    """
+    The original line by line search, kept here as the baseline.
+    """
+    lines = enumerate(text.splitlines(keepends=True))
+    Entry = namedtuple("Entry", ["line", "s"])
+    return [Entry(n, s) for n, s in lines for match in matches if match in s]
+
+
+def random_word(rand: random.Random) -> str:
+    return "".join(rand.choice(string.ascii_letters) for _ in range(rand.randint(5, 10)))
+
+
+def make_text(rand: random.Random, n_lines: int, words: List[str]) -> str:
+    # Roughly one line in a thousand holds one of the words
+    lines = []
+    for _ in range(n_lines):
+        line = " ".join(random_word(rand) for _ in range(8))
+        if rand.random() < 0.001:
+            line += " " + rand.choice(words)
+        lines.append(line + "\n")
+    return "".join(lines)
+
+
+def time_it(func: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main() -> NoReturn:
+    n_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rand = random.Random(0)
+
+    print("{:>9s} {:>10s} {:>10s} {:>10s}".format("patterns", "legacy", "compile", "matcher"))
+    for n_patterns in [1, 10, 100, 1000]:
+        words = [" " + random_word(rand) + " " for _ in range(n_patterns)]
+        text = make_text(rand, n_lines, words)
+
+        legacy = time_it(lambda: legacy_find(text, words))
+        compile_time = time_it(lambda: PatternMatcher(words))
+        matcher = PatternMatcher(words)
+        new = time_it(lambda: matcher.find_lines(text))
+
+        assert matcher.find_lines(text) == legacy_find(text, words)
+        print("{:>9d} {:>9.3f}s {:>9.3f}s {:>9.3f}s".format(n_patterns, legacy, compile_time, new))
+
+
+if __name__ == "__main__":
+    main()
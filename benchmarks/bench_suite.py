@@ -0,0 +1,203 @@
+""" bench_suite.py - Times each phase of a search over a synthetic
+tree and compares the results with a saved baseline.
+
+Usage:
+    bench_suite.py [options]
+    bench_suite.py (-h | --help)
+
+Options:
+    -h --help                  Show this help page.
+    --files=<n>                Number of files in the tree [default: 5000].
+    --depth=<n>                Folder levels of the tree [default: 4].
+    --median-size=<bytes>      Median file size [default: 4096].
+    --binary-ratio=<ratio>     Fraction of binary files [default: 0.05].
+    --hit-density=<ratio>      Fraction of lines with a match [default: 0.01].
+    --repeat=<n>               Runs of each phase, the best is kept [default: 3].
+    --baseline=<path>          Baseline JSON file [default: benchmarks/baseline.json].
+    --threshold=<ratio>        Slowdown over the baseline that fails the run [default: 0.2].
+    --save                     Write the results as the new baseline.
+"""
+
+from docopt import docopt
+from typing import Callable, Dict, List, NoReturn, Tuple
+import contextlib
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_filter import FileFilter  # noqa: E402
+from file_tree import Node, FolderNode  # noqa: E402
+from finder import analyse_files, get_all_file_nodes, search_files, skip_binary_files  # noqa: E402
+from ignore_rules import IgnoreRules  # noqa: E402
+from output_writers import JsonWriter  # noqa: E402
+from synth_tree import HIT_WORD, make_tree  # noqa: E402
+import folder_utils  # noqa: E402
+import io_utils  # noqa: E402
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def time_phase(func: Callable[[], object], repeat: int) -> Tuple[float, object]:
+    """
+    Runs the phase given a few times, silencing its output.
+    :return: Tuple with the best wall time and the last result.
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_phases(root: str, tree_stats: Dict[str, int], repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    Times each phase of a search over the tree, feeding each
+    phase the output of the previous one.
+    :param root: String representing the tree root.
+    :param tree_stats: Dict given by make_tree.
+    :param repeat: Runs of each phase.
+    :return: Dict of phase name to its seconds, files/s, MB/s and
+    the peak RSS of the process once it ran.
+    """
+    n_files = tree_stats["files"]
+    mb = tree_stats["bytes"] / 1e6
+    words = [HIT_WORD]
+    results = {}
+
+    def record(name: str, seconds: float, files: int, size_mb: float):
+        results[name] = {
+            "seconds": seconds,
+            "files_per_s": files / seconds if seconds else 0.0,
+            "mb_per_s": size_mb / seconds if seconds else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    # The walk and the streaming pipeline are run the way
+    # finder.main runs them, with its default rules and filter
+    file_filter = FileFilter(exclude_extensions=["png", "jpg", "jpeg"])
+
+    def walk() -> List[str]:
+        return [e.path for e in folder_utils.walk_files(root, IgnoreRules.for_root(root), file_filter)]
+
+    seconds, _ = time_phase(walk, repeat)
+    record("walk_files", seconds, n_files, 0.0)
+
+    def pipeline() -> Dict[str, List]:
+        walked = (e.path for e in folder_utils.walk_files(root, IgnoreRules.for_root(root), file_filter))
+        return {f: r for f, r in search_files(skip_binary_files(walked), words, compact=True) if r}
+
+    seconds, _ = time_phase(pipeline, repeat)
+    record("pipeline", seconds, n_files, mb)
+
+    seconds, tree = time_phase(lambda: Node.from_path(root, FolderNode), repeat)
+    record("from_path", seconds, n_files, 0.0)
+
+    seconds, files = time_phase(lambda: get_all_file_nodes(tree), repeat)
+    record("get_all_file_nodes", seconds, n_files, 0.0)
+
+    seconds, (occurrences, _) = time_phase(
+        lambda: analyse_files(files, words, [], True, tree_stats["bytes"]), repeat)
+    record("analyse_files", seconds, n_files, mb)
+
+    text_files = [f for f in files if not f.endswith(".bin")]
+    text_mb = sum(os.path.getsize(f) for f in text_files) / 1e6
+    seconds, _ = time_phase(lambda: [io_utils.find_in_file(f, words) for f in text_files], repeat)
+    record("find_in_file", seconds, len(text_files), text_mb)
+
+    def write_json():
+        writer = JsonWriter(os.path.join(root, "output.json"))
+        for file, found in occurrences.items():
+            writer.write(file, found)
+        writer.close()
+
+    seconds, _ = time_phase(write_json, repeat)
+    out_mb = os.path.getsize(os.path.join(root, "output.json")) / 1e6
+    record("json_output", seconds, len(occurrences), out_mb)
+
+    return results
+
+
+def compare(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """
+    Finds the phases slower than the baseline by more than
+    the threshold given.
+    :param current: Phases of this run.
+    :param baseline: Phases of the baseline run.
+    :param threshold: Allowed slowdown, E.g. 0.2 for 20%.
+    :return: List of messages, one per regression.
+    """
+    regressions = []
+    for name, phase in current.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["seconds"]
+        after = phase["seconds"]
+        if before > 0 and after > before * (1 + threshold):
+            regressions.append("{:s}: {:.3f}s -> {:.3f}s (+{:.0f}%)".format(
+                name, before, after, 100 * (after / before - 1)))
+    return regressions
+
+
+def main() -> NoReturn:
+    arguments = docopt(__doc__)
+    config = {
+        "files": int(arguments["--files"]),
+        "depth": int(arguments["--depth"]),
+        "median_size": int(arguments["--median-size"]),
+        "binary_ratio": float(arguments["--binary-ratio"]),
+        "hit_density": float(arguments["--hit-density"]),
+    }
+    repeat = int(arguments["--repeat"])
+
+    with tempfile.TemporaryDirectory() as root:
+        tree_stats = make_tree(root, config["files"], depth=config["depth"], median_size=config["median_size"],
+                               binary_ratio=config["binary_ratio"], hit_density=config["hit_density"])
+        print("Tree: {:d} files ({:d} binary), {:.1f} MB".format(
+            tree_stats["files"], tree_stats["binaries"], tree_stats["bytes"] / 1e6))
+        phases = run_phases(root, tree_stats, repeat)
+
+    for name, phase in phases.items():
+        print("{:>20s}: {:8.3f}s  {:10.0f} files/s  {:8.1f} MB/s  peak RSS {:.1f} MB".format(
+            name, phase["seconds"], phase["files_per_s"], phase["mb_per_s"], phase["peak_rss_mb"]))
+
+    baseline_path = arguments["--baseline"]
+    if arguments["--save"]:
+        with open(baseline_path, "w") as f:
+            json.dump({"config": config, "phases": phases}, f, indent=2)
+        print("Baseline saved to {:s}".format(baseline_path))
+        return
+
+    if not os.path.exists(baseline_path):
+        print("No baseline at {:s}, run with --save to make one".format(baseline_path))
+        return
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline["config"] != config:
+        print("The baseline was run with another tree: {:s}".format(json.dumps(baseline["config"])))
+        return
+
+    regressions = compare(phases, baseline["phases"], float(arguments["--threshold"]))
+    if regressions:
+        print("Regressions over the baseline:")
+        for message in regressions:
+            print("    " + message)
+        sys.exit(1)
+    print("No regressions over the baseline")
+
+
+if __name__ == "__main__":
+    main()
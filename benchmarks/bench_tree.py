@@ -0,0 +1,95 @@
+""" bench_tree.py - Compares the scandir tree builder with the
+original listdir + is_file/is_folder one.
+
+Usage:
+    python benchmarks/bench_tree.py [n_files]
+"""
+
+from typing import Callable, Dict, NoReturn
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_tree import Node, FileNode, FolderNode  # noqa: E402
+from synth_tree import make_tree  # noqa: E402
+import file_utils  # noqa: E402
+import folder_utils  # noqa: E402
+
+
+def legacy_get_node_from_path(path: str) -> FolderNode:
+    """
+    The original recursive builder, kept here as the baseline.
+    """
+    abs_path = file_utils.get_abs_path(path)
+    curr_node = FolderNode(abs_path)
+    child_names = [folder_utils.join_path(abs_path, f) for f in folder_utils.get_files(path)]
+    files = [f for f in child_names if file_utils.is_file(f)]
+    folders = [f for f in child_names if folder_utils.is_folder(f)]
+
+    for f in files:
+        curr_node.add_child(FileNode(f))
+    for f in folders:
+        curr_node.add_child(legacy_get_node_from_path(f))
+
+    return curr_node
+
+
+def count_syscalls(func: Callable[[], object]) -> Dict[str, int]:
+    """
+    Runs the function given while counting the calls made
+    to the os functions that hit the file system.
+    """
+    names = ["stat", "lstat", "listdir", "scandir"]
+    counts = {name: 0 for name in names}
+    originals = {name: getattr(os, name) for name in names}
+
+    def wrap(name):
+        def counted(*args, **kwargs):
+            counts[name] += 1
+            return originals[name](*args, **kwargs)
+        return counted
+
+    for name in names:
+        setattr(os, name, wrap(name))
+    try:
+        func()
+    finally:
+        for name in names:
+            setattr(os, name, originals[name])
+
+    return counts
+
+
+def time_it(func: Callable[[], object], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> NoReturn:
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    with tempfile.TemporaryDirectory() as root:
+        make_tree(root, n_files)
+
+        builders = [
+            ("legacy", lambda: legacy_get_node_from_path(root)),
+            ("scandir", lambda: Node.from_path(root, FolderNode)),
+        ]
+
+        print("Tree with {:d} files".format(n_files))
+        for name, func in builders:
+            calls = count_syscalls(func)
+            wall = time_it(func)
+            print("{:>8s}: {:8.3f}s  {:s}".format(name, wall, ", ".join(
+                "{:s}={:d}".format(k, v) for k, v in calls.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+""" synth_tree.py - Generates synthetic directory trees to
+run the benchmarks against.
+"""
+
+from typing import Dict
+import math
+import os
+import random
+
+# Word planted in the lines that should match
+HIT_WORD = "NEEDLE"
+
+_WORDS = ["alpha", "beta", "gamma", "delta", "server", "client", "value", "index",
+          "return", "import", "class", "def", "self", "print", "data", "node"]
+
+
+def _text(rand: random.Random, size: int, hit_density: float) -> str:
+    lines = []
+    total = 0
+    while total < size:
+        words = [rand.choice(_WORDS) for _ in range(rand.randint(3, 12))]
+        if hit_density and rand.random() < hit_density:
+            words.insert(rand.randrange(len(words) + 1), HIT_WORD)
+        line = " ".join(words) + "\n"
+        lines.append(line)
+        total += len(line)
+    return "".join(lines)
+
+
+def make_tree(root: str, n_files: int, depth: int = 4, fan_out: int = 4, seed: int = 0,
+              median_size: int = None, size_sigma: float = 1.0, binary_ratio: float = 0.0,
+              hit_density: float = 0.0) -> Dict[str, int]:
+    """
+    Creates a deterministic tree of files under the given root
+    directory. By default the files are a few short lines each,
+    otherwise their sizes follow a log-normal distribution.
+    :param root: String representing the directory to create.
+    :param n_files: Number of files to spread over the tree.
+    :param depth: How many folder levels the tree has.
+    :param fan_out: Number of sub folders per folder.
+    :param seed: Seed for the random generator.
+    :param median_size: Median file size in bytes, or None for
+    the small files of the original generator.
+    :param size_sigma: Spread of the log-normal file sizes.
+    :param binary_ratio: Fraction of the files that are binary.
+    :param hit_density: Fraction of the text lines holding HIT_WORD.
+    :return: Dict with the number of files, binaries and bytes written.
+    """
+    rand = random.Random(seed)
+    folders = [root]
+    level = [root]
+    for _ in range(depth):
+        level = [os.path.join(p, "dir{:d}".format(i)) for p in level for i in range(fan_out)]
+        folders.extend(level)
+
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+
+    stats = {"files": n_files, "binaries": 0, "bytes": 0}
+    for i in range(n_files):
+        folder = folders[rand.randrange(len(folders))]
+        if median_size is None:
+            with open(os.path.join(folder, "file{:d}.txt".format(i)), "w") as f:
+                stats["bytes"] += f.write("line {:d}\n".format(i) * rand.randint(1, 20))
+            continue
+
+        size = max(1, int(rand.lognormvariate(math.log(median_size), size_sigma)))
+        if binary_ratio and rand.random() < binary_ratio:
+            data = rand.getrandbits(8 * size).to_bytes(size, "little")
+            with open(os.path.join(folder, "file{:d}.bin".format(i)), "wb") as f:
+                stats["bytes"] += f.write(b"\0" + data)
+            stats["binaries"] += 1
+        else:
+            with open(os.path.join(folder, "file{:d}.txt".format(i)), "w") as f:
+                stats["bytes"] += f.write(_text(rand, size, hit_density))
+
+    return stats
@@ -0,0 +1 @@
+# conftest.py - Puts the repository root on sys.path, so plain pytest finds the modules
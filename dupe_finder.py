@@ -0,0 +1,287 @@
+# dupe_finder.py - Finds identical files and copies of a blob in stages
+from collections import defaultdict, namedtuple
+from typing import Iterable, Iterator, List, NoReturn, Tuple, Union
+import hashlib
+import mmap
+import os
+from io_utils import MMAP_MIN_SIZE
+
+# Bytes hashed from each end of a file in the sample stage
+SAMPLE_SIZE = 4096
+
+# Bytes read per block when a file is hashed whole
+HASH_BLOCK = 1048576
+
+# What one stage did: the files it was given and kept, the bytes
+# it read and the bytes it saved reading, against hashing every
+# one of its files whole
+Stage = namedtuple("Stage", ["name", "files_in", "files_out", "bytes_read", "bytes_avoided"])
+
+# Where a blob was found inside a bigger file
+BlobHit = namedtuple("BlobHit", ["path", "offset"])
+
+
+def _sized(files: Iterable[Union[str, os.DirEntry]]) -> Iterator[Tuple[str, os.stat_result]]:
+    # The walk's DirEntry objects already hold their stat
+    for f in files:
+        try:
+            if isinstance(f, os.DirEntry):
+                yield f.path, f.stat()
+            else:
+                yield f, os.stat(f)
+        except OSError:
+            continue
+
+
+def sample_hash(path: str, size: int, sample: int = SAMPLE_SIZE) -> bytes:
+    """
+    Hashes the first and last bytes of the file given. Files of
+    up to two samples are hashed whole.
+    :param path: String representing the file path.
+    :param size: Size of the file, in bytes.
+    :param sample: Bytes read from each end.
+    :return: The digest.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if size <= 2 * sample:
+            h.update(f.read())
+        else:
+            h.update(f.read(sample))
+            f.seek(size - sample)
+            h.update(f.read(sample))
+    return h.digest()
+
+
+def full_hash(path: str) -> bytes:
+    """
+    Hashes the whole file, memory mapped when it's big enough
+    and read a block at a time otherwise.
+    :param path: String representing the file path.
+    :return: The digest.
+    """
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_MIN_SIZE:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                h.update(data)
+        else:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                h.update(block)
+    return h.digest()
+
+
+def _split_groups(groups: List[List[Tuple[str, int]]], name: str, key, read) -> Tuple[List[List[Tuple[str, int]]], Stage]:
+    """
+    Splits each group on the key of its files, keeping the groups
+    still holding more than one file.
+    :param key: Function of (path, size) giving the key, or None
+    if the file can't be read.
+    :param read: Function of the size giving the bytes read for it.
+    """
+    files_in = sum(len(g) for g in groups)
+    kept = []
+    n_read = 0
+    n_avoided = 0
+    for group in groups:
+        split = defaultdict(list)
+        for path, size in group:
+            k = key(path, size)
+            n_read += read(size)
+            if k is not None:
+                split[k].append((path, size))
+        for sub in split.values():
+            if len(sub) > 1:
+                kept.append(sub)
+            else:
+                # Never hashed whole
+                n_avoided += sub[0][1] - read(sub[0][1])
+    files_out = sum(len(g) for g in kept)
+    return kept, Stage(name, files_in, files_out, n_read, n_avoided)
+
+
+def _safe(hash_func):
+    def key(path: str, size: int):
+        try:
+            return hash_func(path, size)
+        except OSError:
+            return None
+    return key
+
+
+class DupeFinder(object):
+    """
+    Finds the files with the same contents without hashing every
+    file whole: the files are bucketed by size (no reads), the
+    buckets split on a hash of the head and tail of each file, and
+    only the files still alike after that are hashed whole. Hard
+    links to the same file are grouped without being read. The
+    work of each stage is kept in stages.
+    """
+
+    def __init__(self, sample: int = SAMPLE_SIZE):
+        self.sample = sample
+        self.stages = []
+
+    def _sample_read(self, size: int) -> int:
+        return min(size, 2 * self.sample)
+
+    def _bucket(self, files: Iterable[Union[str, os.DirEntry]]) -> List[List[Tuple[str, int]]]:
+        by_size = defaultdict(list)
+        links = {}
+        self._link_sizes = {}
+        n_files = 0
+        n_bytes = 0
+        for path, st in _sized(files):
+            n_files += 1
+            n_bytes += st.st_size
+            # The other paths of a hard link are the same file
+            inode = (st.st_dev, st.st_ino)
+            if inode in links:
+                links[inode].append(path)
+                self._link_sizes[links[inode][0]] = st.st_size
+                continue
+            links[inode] = [path]
+            by_size[st.st_size].append((path, st.st_size))
+
+        self._links = {paths[0]: paths for paths in links.values() if len(paths) > 1}
+        groups = [g for g in by_size.values() if len(g) > 1]
+        kept = sum(size for g in groups for _, size in g)
+        self.stages.append(Stage("size", n_files, sum(len(g) for g in groups), 0, n_bytes - kept))
+        return groups
+
+    def find(self, files: Iterable[Union[str, os.DirEntry]]) -> List[List[str]]:
+        """
+        Finds the groups of identical files.
+        :param files: Iterable of file paths or DirEntry objects,
+        like the ones of folder_utils.walk_files.
+        :return: List of the groups (lists of paths) of files with
+        the same contents, biggest files first.
+        """
+        self.stages = []
+        groups = self._bucket(files)
+
+        # Empty files are all the same
+        empty = [g for g in groups if g[0][1] == 0]
+        groups = [g for g in groups if g[0][1] > 0]
+
+        groups, stage = _split_groups(groups, "sample", _safe(lambda p, s: sample_hash(p, s, self.sample)),
+                                      self._sample_read)
+        self.stages.append(stage)
+
+        # Files no bigger than the samples were already hashed whole
+        small = [g for g in groups if g[0][1] <= 2 * self.sample]
+        groups = [g for g in groups if g[0][1] > 2 * self.sample]
+        groups, stage = _split_groups(groups, "full", _safe(lambda p, s: full_hash(p)), lambda s: s)
+        self.stages.append(stage)
+
+        found = []
+        for group in empty + small + groups:
+            paths = []
+            for path, _ in group:
+                paths.extend(self._links.pop(path, [path]))
+            found.append((group[0][1], sorted(paths)))
+        # Hard links of a file that has no other copy
+        for paths in self._links.values():
+            found.append((self._link_sizes[paths[0]], sorted(paths)))
+        found.sort(key=lambda g: (-g[0], g[1]))
+        return [paths for _, paths in found]
+
+    def find_copies(self, target: str, files: Iterable[Union[str, os.DirEntry]]) -> List[str]:
+        """
+        Finds the files with the same contents as the one given,
+        going through the same stages against its size and hashes.
+        :param target: String representing the path of the asset.
+        :param files: Iterable of file paths or DirEntry objects.
+        :return: List of the paths of the copies (the target and
+        its hard links left out).
+        """
+        self.stages = []
+        st = os.stat(target)
+        size = st.st_size
+        n_files = 0
+        n_bytes = 0
+        candidates = []
+        for path, f_st in _sized(files):
+            if (f_st.st_dev, f_st.st_ino) == (st.st_dev, st.st_ino):
+                continue
+            n_files += 1
+            n_bytes += f_st.st_size
+            if f_st.st_size == size:
+                candidates.append(path)
+        self.stages.append(Stage("size", n_files, len(candidates), 0, n_bytes - size * len(candidates)))
+        if size == 0:
+            return sorted(candidates)
+
+        candidates = self._keep_equal("sample", target, candidates, size,
+                                      lambda p, s: sample_hash(p, s, self.sample), self._sample_read(size))
+        # Files no bigger than the samples were already hashed whole
+        if size > 2 * self.sample:
+            candidates = self._keep_equal("full", target, candidates, size, lambda p, s: full_hash(p), size)
+        return sorted(candidates)
+
+    def _keep_equal(self, name: str, target: str, candidates: List[str], size: int, hash_func, read: int) -> List[str]:
+        # All the candidates are the size of the target. A target
+        # that can't be read raises, unreadable candidates are dropped
+        wanted = hash_func(target, size)
+        key = _safe(hash_func)
+        kept = [path for path in candidates if key(path, size) == wanted]
+        self.stages.append(Stage(name, len(candidates), len(kept), read * (len(candidates) + 1),
+                                 (size - read) * (len(candidates) - len(kept))))
+        return kept
+
+    def summary(self) -> str:
+        lines = ["{:<8s} {:>9s} {:>9s} {:>14s} {:>14s}".format("stage", "files in", "kept", "bytes read", "bytes avoided")]
+        for s in self.stages:
+            lines.append("{:<8s} {:>9d} {:>9d} {:>14d} {:>14d}".format(*s))
+        return "\n".join(lines)
+
+
+def find_blob(blob: bytes, files: Iterable[Union[str, os.DirEntry]], stages: List[Stage] = None,
+              bigger_only: bool = False) -> Iterator[BlobHit]:
+    """
+    Finds every occurrence of a byte sequence inside the files
+    given. Files smaller than the blob are never opened, and the
+    others are memory mapped and searched in place.
+    :param blob: The bytes to look for (not empty).
+    :param files: Iterable of file paths or DirEntry objects.
+    :param stages: List the Stage of the search is appended to,
+    once the files are all searched, if given.
+    :param bigger_only: Whether to skip the files of the same size
+    as the blob too, when find_copies already told those apart.
+    :return: Iterator of BlobHit(path, offset), in walk order.
+    """
+    if not blob:
+        raise ValueError("The blob to find is empty")
+    n_files = 0
+    n_kept = 0
+    n_read = 0
+    n_avoided = 0
+    for path, st in _sized(files):
+        n_files += 1
+        if st.st_size < len(blob) or (bigger_only and st.st_size == len(blob)):
+            n_avoided += st.st_size
+            continue
+        n_kept += 1
+        n_read += st.st_size
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                offset = data.find(blob)
+                while offset >= 0:
+                    yield BlobHit(path, offset)
+                    offset = data.find(blob, offset + 1)
+        except (OSError, ValueError):
+            continue
+    if stages is not None:
+        stages.append(Stage("blob", n_files, n_kept, n_read, n_avoided))
+
+
+def main() -> NoReturn:
+    finder = DupeFinder()
+    for group in finder.find(os.scandir(".")):
+        print(group)
+    print(finder.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# file_filter.py - Filters applied to the files while walking
+from __future__ import annotations
+from datetime import datetime
+from typing import List, Optional, Union
+import fnmatch
+import os
+import re
+
+
+def split_list(value: Optional[str]) -> List[str]:
+    """
+    Splits a comma separated option value.
+    :param value: String like "png,jpg", or None.
+    :return: List of the non empty items.
+    """
+    if not value:
+        return []
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def parse_time(value: str) -> float:
+    """
+    Parses a time given either as a unix timestamp or as an
+    ISO date/datetime (E.g. "2020-01-31").
+    :param value: String representing the time.
+    :return: Float representing the unix timestamp.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _globs_regex(globs: List[str]) -> Optional[re.Pattern]:
+    if not globs:
+        return None
+    return re.compile("|".join("(?:" + fnmatch.translate(g) + ")" for g in globs))
+
+
+class FileFilter(object):
+    """
+    Which files to search: by extension, by glob, by size and by
+    modification time. Everything is compiled once, and the checks
+    run on the scandir entries of the walk, so the size and mtime
+    come from at most one stat per file and rejected files never
+    get any further.
+    """
+
+    def __init__(self, extensions: List[str] = None, exclude_extensions: List[str] = None,
+                 include: List[str] = None, exclude: List[str] = None,
+                 min_size: int = None, max_size: int = None, newer_than: float = None):
+        self.extensions = frozenset(extensions or ())
+        self.exclude_extensions = frozenset(exclude_extensions or ())
+        # Globs with a '/' are matched against the whole path,
+        # the others against the file name only
+        self._include_names = _globs_regex([g for g in include or () if "/" not in g])
+        self._include_paths = _globs_regex([g for g in include or () if "/" in g])
+        self._exclude_names = _globs_regex([g for g in exclude or () if "/" not in g])
+        self._exclude_paths = _globs_regex([g for g in exclude or () if "/" in g])
+        self._has_include = bool(include)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.newer_than_ns = int(newer_than * 1e9) if newer_than is not None else None
+        self.needs_stat = min_size is not None or max_size is not None or newer_than is not None
+        self.rejected = {"extension": 0, "glob": 0, "size": 0, "mtime": 0}
+
+    @classmethod
+    def from_legacy(cls, extensions: List[str], ignore: bool, max_size: int) -> FileFilter:
+        """
+        Creates the filter matching the old analyse_files arguments.
+        :param extensions: List of extensions to ignore or keep.
+        :param ignore: Whether the extensions given are ignored (True)
+        or the only ones kept (False).
+        :param max_size: Files bigger than this (in bytes) are dropped.
+        :return: FileFilter object.
+        """
+        if ignore:
+            return cls(exclude_extensions=extensions, max_size=max_size)
+        return cls(extensions=extensions, max_size=max_size)
+
+    def _accepts_name(self, name: str, path: str) -> bool:
+        # Same as file_utils.get_extension
+        ext = name.rpartition(".")[2]
+        if (self.extensions and ext not in self.extensions) or ext in self.exclude_extensions:
+            self.rejected["extension"] += 1
+            return False
+
+        path = path.replace(os.sep, "/")
+        if self._has_include and not ((self._include_names and self._include_names.match(name)) or
+                                      (self._include_paths and self._include_paths.match(path))):
+            self.rejected["glob"] += 1
+            return False
+        if (self._exclude_names and self._exclude_names.match(name)) or \
+                (self._exclude_paths and self._exclude_paths.match(path)):
+            self.rejected["glob"] += 1
+            return False
+        return True
+
+    def _accepts_stat(self, st: os.stat_result) -> bool:
+        if (self.min_size is not None and st.st_size < self.min_size) or \
+                (self.max_size is not None and st.st_size > self.max_size):
+            self.rejected["size"] += 1
+            return False
+        if self.newer_than_ns is not None and st.st_mtime_ns <= self.newer_than_ns:
+            self.rejected["mtime"] += 1
+            return False
+        return True
+
+    def accepts(self, entry: Union[os.DirEntry, str]) -> bool:
+        """
+        Checks whether the file given should be searched. The
+        cheap name checks go first, and the file is only stat'ed
+        (once, through the DirEntry cache) if size or mtime matter.
+        :param entry: DirEntry object of the file, or its path.
+        :return: True if the file passes the filter.
+        """
+        if isinstance(entry, str):
+            path = entry
+            name = os.path.basename(entry)
+        else:
+            path = entry.path
+            name = entry.name
+
+        if not self._accepts_name(name, path):
+            return False
+        if not self.needs_stat:
+            return True
+
+        try:
+            st = os.stat(entry) if isinstance(entry, str) else entry.stat()
+        except OSError:
+            return False
+        return self._accepts_stat(st)
+
+    def total_rejected(self) -> int:
+        return sum(self.rejected.values())
@@ -1,8 +1,17 @@
 # file_tree.py - Contains the code for the file structure
 from __future__ import annotations
+from array import array
 import folder_utils
 import file_utils
-from typing import NoReturn, Type
+import os
+import sys
+from file_filter import FileFilter
+from ignore_rules import IgnoreRules
+from typing import Callable, Iterator, List, NoReturn, Type
+
+# Kinds of the nodes in a FileTree
+FOLDER = 0
+FILE = 1
 
 
 class NodeError(Exception):
@@ -28,34 +37,194 @@ class FileNodeError(NodeError):
         super().__init__(message)
 
 
+class FileTree(object):
+    """
+    All the nodes of a tree as flat parallel arrays: the parent
+    index, the (interned) name and the kind of each node, plus the
+    child indices of each folder. Nothing is stored per file but
+    those, the paths are rebuilt from the names when asked for.
+    The walk also keeps the mtime of each folder it lists, so a
+    saved tree can tell which folders changed since.
+    Nodes dropped from their folder stay in the arrays until the
+    tree is built again, or grafted into a new tree.
+    """
+
+    def __init__(self, folder_cls: Type[FolderNode] = None, file_cls: Type[FileNode] = None):
+        self.parent = array("i")
+        self.kind = bytearray()
+        self.names = []
+        self.children = {}
+        # mtime_ns of the folders, taken before they were listed
+        self.mtimes = {}
+        # Full path of the nodes without a parent
+        self.root_paths = {}
+        self.folder_cls = folder_cls or FolderNode
+        self.file_cls = file_cls or FileNode
+
+    def add(self, parent: int, name: str, kind: int) -> int:
+        """
+        Adds a node, appending it to the children of its parent.
+        :param parent: Index of the parent folder, or -1 for a node
+        that isn't in a folder yet.
+        :param name: The file or folder name.
+        :param kind: FOLDER or FILE.
+        :return: Index of the new node.
+        """
+        index = len(self.kind)
+        self.parent.append(parent)
+        self.kind.append(kind)
+        self.names.append(sys.intern(name))
+        if kind == FOLDER:
+            self.children[index] = array("i")
+        if parent >= 0:
+            self.children[parent].append(index)
+        return index
+
+    def attach(self, index: int, parent: int) -> NoReturn:
+        """
+        Moves a node of this tree to the end of the children of
+        the folder given.
+        :param index: Index of the node.
+        :param parent: Index of its new parent folder.
+        :return: void
+        """
+        self.root_paths.pop(index, None)
+        self.parent[index] = parent
+        self.children[parent].append(index)
+
+    def clear_children(self, index: int) -> NoReturn:
+        self.children[index] = array("i")
+
+    def path(self, index: int) -> str:
+        names = []
+        while index >= 0 and index not in self.root_paths:
+            names.append(self.names[index])
+            index = self.parent[index]
+        return os.path.join(self.root_paths.get(index, ""), *reversed(names))
+
+    def node(self, index: int) -> Node:
+        """
+        :return: The view of the node, a FolderNode or FileNode.
+        """
+        cls = self.folder_cls if self.kind[index] == FOLDER else self.file_cls
+        node = object.__new__(cls)
+        node.tree = self
+        node.index = index
+        return node
+
+    def iter_file_paths(self, index: int) -> Iterator[str]:
+        """
+        Lazily yields the paths of the files under the node given,
+        depth first in the order of the children, joining each
+        folder path once for all its files.
+        :param index: Index of the node to start from.
+        :return: Iterator over the file paths.
+        """
+        kind = self.kind
+        names = self.names
+        children = self.children
+        pending = [(index, self.path(index))]
+        while pending:
+            curr, path = pending.pop()
+            if kind[curr] == FILE:
+                yield path
+                continue
+            prefix = path if path.endswith(os.sep) else path + os.sep
+            pending.extend((child, prefix + names[child]) for child in reversed(children[curr]))
+
+    def graft(self, other: FileTree, index: int, parent: int) -> int:
+        """
+        Copies a node of another tree, and everything under it,
+        into this tree.
+        :param other: The tree the node is in.
+        :param index: Index of the node in the other tree.
+        :param parent: Index of its new parent here, or -1.
+        :return: Index of the copy.
+        """
+        root = self.add(parent, other.names[index], other.kind[index])
+        pending = [(index, root)]
+        while pending:
+            src, dst = pending.pop()
+            for child in other.children.get(src, ()):
+                pending.append((child, self.add(dst, other.names[child], other.kind[child])))
+        return root
+
+    def __len__(self) -> int:
+        return len(self.kind)
+
+
 class Node(object):
     """
     Parent of all the node objects. This represents a
-    Node in a tree, it may have children.
+    Node in a tree, it may have children. Nodes are views
+    (the tree and an index) over a FileTree, so they are
+    cheap to make and hold nothing of their own.
     """
+    __slots__ = ("tree", "index")
+
+    # Kind of the nodes made by the constructor
+    _kind = FOLDER
 
     @classmethod
-    def from_path(cls, p: str, root_cls: Type[FolderNode]) -> Node:
+    def from_path(cls, p: str, root_cls: Type[FolderNode], ignore: IgnoreRules = None, file_filter: FileFilter = None) -> Node:
         if issubclass(root_cls, FileNode):
             return FileNode.get_node_from_path(p)
         elif issubclass(root_cls, FolderNode):
-            return FolderNode.get_node_from_path(p, FileNode)
+            return FolderNode.get_node_from_path(p, FileNode, ignore, file_filter)
         else:
             raise NodeError("Unsupported class type for the path")
 
+    @classmethod
+    def _new(cls, path: str, name: str, tree: FileTree = None) -> Node:
+        # A node without a parent, in a tree of its own by default
+        if tree is None:
+            tree = FileTree(cls if issubclass(cls, FolderNode) else None, cls if issubclass(cls, FileNode) else None)
+        index = tree.add(-1, name, cls._kind)
+        tree.root_paths[index] = path
+        node = object.__new__(cls)
+        node.tree = tree
+        node.index = index
+        return node
+
     def __init__(self, name: str):
-        self.name = name
-        self.children = []
+        node = self._new(name, name)
+        self.tree = node.tree
+        self.index = node.index
+
+    @property
+    def name(self) -> str:
+        return self.tree.names[self.index]
+
+    @property
+    def path(self) -> str:
+        return self.tree.path(self.index)
+
+    @property
+    def children(self) -> List[Node]:
+        return [self.tree.node(i) for i in self.tree.children.get(self.index, ())]
+
+    @children.setter
+    def children(self, nodes: List[Node]) -> NoReturn:
+        self.tree.clear_children(self.index)
+        for node in nodes:
+            self.add_child(node)
 
     def add_child(self, child: Node) -> NoReturn:
         """
         Function that adds the given child to the
-        list of children of this node.
+        list of children of this node. A node of another
+        tree is copied into this one, and the node given
+        is then a view of the copy.
         :param child: Node object representing the
         child.
         :return: void
         """
-        self.children.append(child)
+        tree = self.tree
+        if child.tree is not tree:
+            child.index = tree.graft(child.tree, child.index, self.index)
+            child.tree = tree
+            return
+        tree.attach(child.index, self.index)
 
     def get_child(self, num: int) -> Node:
         """
@@ -68,85 +237,172 @@ class Node(object):
 
     # So we can iterate through child nodes
     def __len__(self) -> int:
-        return len(self.children)
+        return len(self.tree.children.get(self.index, ()))
 
     # So we can iterate through child nodes
     def __getitem__(self, item: int) -> Node:
         if 0 <= item < len(self):
-            return self.children[item]
+            return self.tree.node(self.tree.children[self.index][item])
         else:
             raise IndexError
 
+    def __iter__(self) -> Iterator[Node]:
+        tree = self.tree
+        return (tree.node(i) for i in tree.children.get(self.index, ()))
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Node) and self.tree is other.tree and self.index == other.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.tree), self.index))
+
     def __repr__(self):
         child_repr = repr(self.children)[0:40] + "...]"
         return "({:s}, Name: {:s}, Children: {:.43s})".format(self.__class__.__name__, self.name, child_repr)
 
     def __str__(self):
-        return "({:s}, Name: {:s}, N Children: {:d})".format(self.__class__.__name__, self.name, len(self.children))
+        return "({:s}, Name: {:s}, N Children: {:d})".format(self.__class__.__name__, self.name, len(self))
 
 
-# TODO : Prevent people from changing the path after creation
 class FileNode(Node):
     """
     This is the representation of a file in the file
     tree. Note that this object cannot have any children,
     so the get/add children objects are deleted.
     """
+    __slots__ = ()
+    _kind = FILE
 
     @classmethod
     def get_node_from_path(cls, path: str):
         return cls(path)
 
+    @classmethod
+    def from_dir_entry(cls, entry: os.DirEntry, tree: FileTree = None) -> FileNode:
+        """
+        Creates the node from a scandir entry that is already
+        known to be a file, so no validation is done.
+        :param entry: DirEntry object for the file.
+        :param tree: FileTree to make the node in (to be added to
+        one of its folders), a new one by default.
+        :return: FileNode representing the file.
+        """
+        return cls._new(entry.path, entry.name, tree)
+
     def __init__(self, path: str):
 
         if not file_utils.is_file(path):
             raise FileNodeError("Path given is not a valid file")
 
-        super().__init__(file_utils.get_filename(path))
-        self.path = path
+        node = self._new(path, file_utils.get_filename(path))
+        self.tree = node.tree
+        self.index = node.index
 
     # Elegantly removing the add/get for children
-    def __getattribute__(self, name):
-        if name in ["add_child", "get_child"]:
-            raise AttributeError("Deleted attribute: " + name)
-        else:
-            return super(FileNode, self).__getattribute__(name)
+    @property
+    def add_child(self):
+        raise AttributeError("Deleted attribute: add_child")
+
+    @property
+    def get_child(self):
+        raise AttributeError("Deleted attribute: get_child")
 
     # Elegantly removing the add/get for children
     def __dir__(self):
-        all_props = {dir(self.__class__)} | {self.__dict__.keys()}
-        filtered = all_props - {"add_child", "get_child"}
-        return filtered
+        return sorted(set(super().__dir__()) - {"add_child", "get_child"})
 
 
-# TODO : Prevent people from changing the path after creation
 class FolderNode(Node):
     """
     This is the representation of a folder in the file
     tree. Note that the children of this object may be
     another folder or a file.
     """
+    __slots__ = ()
+    _kind = FOLDER
 
     # Builder from the path
     @classmethod
-    def get_node_from_path(cls, path: str, file_cls: Type[FileNode] = FileNode) -> FolderNode:
-        abs_path = file_utils.get_abs_path(path)
-        curr_node = cls(abs_path)
-        child_names = [folder_utils.join_path(abs_path, f) for f in folder_utils.get_files(path)]
-        files = [f for f in child_names if file_utils.is_file(f)]
-        folders = [f for f in child_names if folder_utils.is_folder(f)]
+    def get_node_from_path(cls, path: str, file_cls: Type[FileNode] = FileNode, ignore: IgnoreRules = None,
+                           file_filter: FileFilter = None,
+                           visit: Callable[[FolderNode, IgnoreRules], NoReturn] = None,
+                           tree: FileTree = None) -> FolderNode:
+        """
+        Builds the whole tree under the given path. The walk is
+        iterative (so deep trees can't hit the recursion limit) and
+        uses os.scandir, so the type of each child comes from the
+        directory listing itself instead of extra stat calls. The
+        nodes go straight into the arrays of a FileTree, no node
+        object is made for them.
+        :param path: String representing the root directory.
+        :param file_cls: Class of the views of the file nodes.
+        :param ignore: IgnoreRules of the root, to leave ignored
+        files and folders out of the tree. None keeps everything.
+        :param file_filter: FileFilter deciding which files get a
+        node, checked on the listing entries. None keeps all files.
+        :param visit: Function called with each folder node and the
+        IgnoreRules it inherits, before it is listed, if given.
+        :param tree: FileTree to build the nodes in (the root to be
+        added to one of its folders), a new one by default.
+        :return: FolderNode representing the root of the tree.
+        """
+        if not folder_utils.is_folder(path):
+            raise FolderNodeError("Path given is not a valid folder")
 
-        for f in files:
-            curr_node.add_child(file_cls.get_node_from_path(f))
-        for f in folders:
-            curr_node.add_child(cls.get_node_from_path(f, file_cls))
+        abs_path = file_utils.get_abs_path(path)
+        if tree is None:
+            tree = FileTree(cls, file_cls)
+        root_node = cls._new(abs_path, folder_utils.get_dir_name(abs_path), tree)
+        seen_links = set()
+        pending = [(root_node.index, abs_path, ignore)]
+
+        while pending:
+            index, folder, rules = pending.pop()
+            if visit is not None:
+                visit(tree.node(index), rules)
+            try:
+                tree.mtimes[index] = os.stat(folder).st_mtime_ns
+            except OSError:
+                pass
+            files, folders, rules = folder_utils.scan_filtered(folder, rules, file_filter)
+
+            for entry in files:
+                tree.add(index, entry.name, FILE)
+            for entry in folders:
+                # Symlinked folders may point back up the tree,
+                # so each link target is only walked once
+                if folder_utils.is_seen_link(entry, seen_links):
+                    continue
+
+                pending.append((tree.add(index, entry.name, FOLDER), entry.path, rules))
+
+        return root_node
 
-        return curr_node
+    @classmethod
+    def from_dir_entry(cls, entry: os.DirEntry, tree: FileTree = None) -> FolderNode:
+        """
+        Creates the node from a scandir entry that is already
+        known to be a folder, so no validation is done.
+        :param entry: DirEntry object for the folder.
+        :param tree: FileTree to make the node in, a new one by
+        default.
+        :return: FolderNode representing the folder.
+        """
+        return cls._new(entry.path, entry.name, tree)
 
     def __init__(self, path: str):
 
         if not folder_utils.is_folder(path):
             raise FolderNodeError("Path given is not a valid folder")
 
-        super().__init__(folder_utils.get_dir_name(path))
-        self.path = path
+        node = self._new(path, folder_utils.get_dir_name(path))
+        self.tree = node.tree
+        self.index = node.index
+
+    def iter_files(self) -> Iterator[str]:
+        """
+        Lazily yields the paths of all the files under this
+        folder, depth first with the files of a folder first.
+        :return: Iterator over the file paths.
+        """
+        return self.tree.iter_file_paths(self.index)
@@ -1,5 +1,5 @@
 import json
-from file_tree import Node, FolderNode
+from file_tree import FILE, Node, FolderNode
 from typing import NoReturn, Callable
 
 
@@ -23,6 +23,30 @@ def console_view(root_node: Node, print_f: Callable[[str], NoReturn] = print) ->
     _console_view_helper(root_node, print_f, 0)
 
 
-# TODO : Implement this, should save to file
-def json_view(root_node: Node) -> NoReturn:
-    pass
+def json_view(root_node: Node, path: str) -> NoReturn:
+    """
+    Saves the tree as a JSON document: each folder is an object
+    with its name and its children, each file just its name. The
+    root also has its full path.
+    :param root_node: The root node from where to start with.
+    :param path: The JSON file to save to.
+    :return: void
+    """
+    tree = root_node.tree
+    view = {"name": root_node.name, "path": root_node.path}
+    # Built without recursion, like the walk
+    pending = [(root_node.index, view)]
+    while pending:
+        index, folder = pending.pop()
+        if tree.kind[index] == FILE:
+            continue
+        folder["children"] = children = []
+        for child in tree.children[index]:
+            if tree.kind[child] == FILE:
+                children.append(tree.names[child])
+            else:
+                children.append({"name": tree.names[child]})
+                pending.append((child, children[-1]))
+
+    with open(path, "w") as f:
+        json.dump(view, f, indent=1)
@@ -1,74 +1,543 @@
 """ Finder CLI - Script to run through the codebase and find instances of words.
 
 Usage:
-finder.py <dir> [--words <words>...]
-finder.py <dir> (-s <save> | --save=<save>) [--words <words>...]
+finder.py index <dir> [options]
+finder.py query <dir> [options] [--words <words>...]
+finder.py serve <dir> [options]
+finder.py ask <dir> [(-s <save> | --save=<save>)] [options] [--words <words>...]
+finder.py dupes <dir> [(-s <save> | --save=<save>)] [options]
+finder.py copies <dir> <asset> [(-s <save> | --save=<save>)] [options]
+finder.py <dir> [options] [--words <words>...]
+finder.py <dir> (-s <save> | --save=<save>) [options] [--words <words>...]
 finder.py (-h | --help)
 
 Options:
     -h --help                          Show the programs help page.
-    -s<save> --save=<save>             Indicates the output should be saved.
+    -s <save> --save=<save>            Indicates the output should be saved.
+    -j <jobs> --jobs=<jobs>            Number of processes searching the files [default: 1].
+    --read-ahead=<threads>             Threads reading the files ahead of the search, for
+                                       slow or network disks (single process only) [default: 0].
+    --read-budget=<bytes>              Bytes of files read ahead at most [default: 64000000].
+    --no-cache                         Don't use the cache of results from previous runs.
+    --rebuild-cache                    Empty the cache of results before running.
+    --index=<index>                    Path of the trigram index of the directory.
+    --no-ignore                        Walk into the files and folders ignored by git too.
+    --ignore-file=<file>               Extra gitignore style file, relative to <dir>.
+    --snapshot=<file>                  Keep the tree of <dir> in this file: it is loaded and
+                                       only the folders whose mtime changed are listed again,
+                                       instead of walking the whole directory. Made with
+                                       the ignore options of the run that created it.
+    --binary                           Search binary files too, reporting byte offsets.
+    --regex                            The words are regular expressions.
+    -i --ignore-case                   Match ignoring case.
+    -w --word                          Only match whole words (not next to a letter,
+                                       digit or underscore).
+    -l --files-with-matches            Only list the files that match, leaving each
+                                       file at its first match.
+    -c --count                         Print the number of matching lines of each file.
+    -m <num> --max-count=<num>         Leave each file after this many matching lines.
+    --first=<num>                      Stop the whole run (walk included) once this
+                                       many matches are found.
+    --replace=<spec>                   Replace old with new (given as old=new) in the text
+                                       files that match old, with the match modes above.
+    --dry-run                          Show the diff of --replace without writing.
+    --batch=<queries>                  Run all the named queries of a JSON file (name ->
+                                       list of words) in one pass, saving the results of
+                                       each to <name>.json (or .ndjson) in <save>.
+                                       Not with -l, -m or --first, which would stop
+                                       on the matches of the other queries.
+    --sample=<bytes>                   Bytes hashed from each end of the files before
+                                       hashing them whole, for dupes and copies [default: 4096].
+    --inside                           With copies, also find the bytes of the asset
+                                       inside bigger files.
+    --socket=<path>                    Socket of the server, for serve and ask (one per
+                                       directory in $XDG_RUNTIME_DIR by default).
+    --memory=<bytes>                   Bytes of file contents the server keeps in memory
+                                       [default: 256000000].
+    --stop                             With ask, stop the server.
+    --ext=<exts>                       Comma separated extensions, only search these.
+    --exclude-ext=<exts>               Comma separated extensions to skip [default: png,jpg,jpeg].
+    --include=<globs>                  Comma separated globs, only search the files matching
+                                       them (globs with a '/' match the whole path).
+    --exclude=<globs>                  Comma separated globs of the files to skip.
+    --min-size=<bytes>                 Skip the files smaller than this.
+    --max-size=<bytes>                 Skip the files bigger than this (big files are
+                                       otherwise searched a block at a time).
+    --newer-than=<time>                Only search the files modified after this (unix time
+                                       or date, E.g. 2020-01-31).
+    --stats                            Print the time spent in each phase and the counts
+                                       of files skipped, bytes read and matches.
+    --stats-file=<file>                Where --stats writes them as JSON [default: stats.json].
+    --profile=<file>                   Run cProfile on the matching phase, saving it here.
+    --format=<format>                  Output format: json (one document), ndjson (one
+                                       record per match, written as found) or
+                                       ndjson-files (one record per file) [default: json].
     --words                 Passes the words to look for
 
+Commands:
+    index                              Build or update the trigram index of the directory.
+    query                              Search only the files the index says may match,
+                                       without walking the directory.
+    serve                              Keep the tree and the file contents in memory, up to
+                                       date through inotify, answering ask on a socket.
+    ask                                Search through the server of the directory.
+    dupes                              Find the groups of files with the same contents
+                                       (the filters apply, --exclude-ext= to keep images).
+    copies                             Find the copies of the asset file in the directory.
+
 Arguments:
     <dir>                              The string representing the directory.
-    <save>                             The save directory to use.
+    <save>                             The output file, or the directory to save it in.
+    <jobs>                             The number of worker processes.
+    <index>                            The index file to use.
+    <asset>                            The file to find the copies of.
     <words>...                         The words to lookup in the files.
+    <exts>                             Extensions without the dot, E.g. py,txt.
+    <globs>                            File name globs, E.g. *.py,test_*.
+    <spec>                             The replacement, E.g. OldName=NewName.
+    <queries>                          The queries file, E.g. {"a": ["LFM"], "b": ["Server"]}.
 """
 
 from colorama import Fore, Back, Style
 from colorama import init as colour_init
 from docopt import docopt
-from typing import List, Dict, NoReturn, NamedTuple
+from dupe_finder import DupeFinder, find_blob
+from typing import List, Dict, Iterable, Iterator, NoReturn, NamedTuple, Tuple
 from arg_parsing import Argument, ParsedArgument, ArgumentOption
-from file_tree import Node, FileNode, FolderNode, NodeError
+from batch import BatchQuery, BatchWriter, load_queries
+from file_filter import FileFilter, parse_time, split_list
+from file_tree import FileNode, FolderNode, NodeError
+from ignore_rules import IgnoreRules
+from matcher import Entry, Hit, RegexMatcher, compile_patterns
+from parallel import match_files_parallel
+from read_ahead import READ_AHEAD_BYTES, match_files_read_ahead
+from replacer import Replacer, parse_replacement, replace_files
+from run_stats import NullStats, RunStats
+from search_server import WarmTree, default_socket_path, request, serve
+from result_cache import ResultCache, default_cache_path, match_files_cached
+from trigram_index import TrigramIndex, default_index_path
+from tree_snapshot import open_tree
+from output_writers import FORMATS, open_writer, output_path
 import file_utils
 import folder_utils
 import io_utils
 import json
-import itertools
+import os
+import re
+import stat
+import sys
+
+
+def iter_file_nodes(root: FolderNode) -> Iterator[str]:
+    """
+    Lazily yields the paths of all the files in the tree
+    given, depth first with the files of a folder first.
+    :param root: The root node of the tree.
+    :return: Iterator over the file paths.
+    """
+    if root.__class__ == FileNode:
+        return iter([root.path])
+    elif isinstance(root, FolderNode):
+        return root.iter_files()
+    else:
+        raise NodeError("Not a valid node type to parse")
 
 
 def get_all_file_nodes(root: FolderNode) -> List[FileNode]:
+    return list(iter_file_nodes(root))
 
-    def get_all_file_nodes_r(curr_node: Node):
-        if curr_node.__class__ == FileNode:
-            return [curr_node.path]
-        elif curr_node.__class__ == FolderNode:
-            children = [get_all_file_nodes_r(c) for c in curr_node]
-            return list(itertools.chain(*children))
-        else:
-            raise NodeError("Not a valid node type to parse")
 
-    return get_all_file_nodes_r(root)
+def filter_files(files: Iterable[str], extensions: List[str], ignore: bool, max_size: int) -> Iterator[str]:
+    """
+    Lazily filters out the files that should not be analysed.
+    :param files: Iterable of file paths.
+    :param extensions: List of extensions to ignore or keep.
+    :param ignore: Whether the extensions given are ignored (True)
+    or the only ones kept (False).
+    :param max_size: Files bigger than this (in bytes) are dropped.
+    :return: Iterator over the paths to analyse.
+    """
+    file_filter = FileFilter.from_legacy(extensions, ignore, max_size)
+    return (file for file in files if file_filter.accepts(file))
 
 
-def analyse_files(files: List[str], matches: List[str], extensions: List[str], ignore: bool, max_size: int) -> Dict[str, List[NamedTuple]]:
-    occurrences = {}
-    i = 0
-    for file in files:
-        print("Analysing {:.2f}   \r".format(100*i/len(files)), end="")
+class _Counted(object):
+    """
+    Stands for a list of paths that is only ever counted, so
+    the paths aren't kept.
+    """
 
-        if ignore:
-            if not not extensions and file_utils.get_extension(file) in extensions:
-                continue
-        else:
-            # Filter out non source files
-            if not not extensions and file_utils.get_extension(file) not in extensions:
-                continue
+    def __init__(self):
+        self.n = 0
 
-        # Filter out files that are too big
-        if file_utils.get_file_size(file) > max_size:
-            continue
+    def append(self, path: str) -> NoReturn:
+        self.n += 1
+
+    def __len__(self) -> int:
+        return self.n
 
+
+def skip_binary_files(files: Iterable[str], cache: ResultCache = None, binaries: List[str] = None) -> Iterator[str]:
+    """
+    Lazily drops the files that look binary, telling them
+    apart from the first few KB of each file only.
+    :param files: Iterable of file paths.
+    :param cache: ResultCache object keeping the decision for
+    each file, or None to check every file.
+    :param binaries: List the binary paths are appended to, if given.
+    :return: Iterator over the paths of the text files.
+    """
+    for file in files:
+        try:
+            st = os.stat(file)
+            is_binary = cache.get_binary(file, st) if cache is not None else None
+            if is_binary is None:
+                is_binary = io_utils.is_binary_file(file)
+                if cache is not None:
+                    cache.put_binary(file, st, is_binary)
+        except OSError:
+            is_binary = False
+
+        if not is_binary:
+            yield file
+        elif binaries is not None:
+            binaries.append(file)
+
+
+def match_files(files: Iterable[str], matches: List[str], compact: bool = False, limit: int = None) -> Iterator[Tuple[str, List[NamedTuple]]]:
+    """
+    Lazily searches each file for the matches, yielding
+    the results of every file analysed (even the empty ones).
+    :param files: Iterable of file paths to search.
+    :param matches: List of strings to look for.
+    :param compact: Whether to give Hit records (for a MatchStore)
+    instead of Entry(line, s).
+    :param limit: Matching lines after which a file is left, or None.
+    :return: Iterator of (path, results) tuples.
+    """
+    matcher = compile_patterns(matches)
+    search = io_utils.find_hits_in_file if compact else io_utils.find_in_file
+    for file in files:
+        yield file, search(file, matcher, limit)
+
+
+def search_files(files: Iterable[str], matches: List[str], jobs: int = 1, cache: ResultCache = None, compact: bool = False,
+                 stats: NullStats = None, readers: int = 0, read_budget: int = READ_AHEAD_BYTES,
+                 limit: int = None) -> Iterator[Tuple[str, List[NamedTuple]]]:
+    """
+    Searches the files given, over a process pool if more than
+    one job is given, and through the result cache if there is one.
+    :param files: Iterable of file paths to search.
+    :param matches: List of strings to look for.
+    :param jobs: Number of worker processes.
+    :param cache: ResultCache object, or None to read every file.
+    The cache must have been made for the same kind of records.
+    :param compact: Whether to give Hit records (for a MatchStore)
+    instead of Entry(line, s).
+    :param stats: RunStats counting the bytes of the files read
+    (not the cached ones), if given.
+    :param readers: Number of threads reading the files ahead of
+    the search, when there is a single job. 0 reads each file as
+    it is searched.
+    :param read_budget: Bytes of files read ahead at most.
+    :param limit: Matching lines after which a file is left, or
+    None. The cache must have been made with the same limit.
+    :return: Iterator of (path, results) tuples.
+    """
+    def search(to_search: Iterable[str]) -> Iterator[Tuple[str, List[NamedTuple]]]:
+        if stats is not None:
+            to_search = stats.count_bytes(to_search)
+        if jobs > 1:
+            return match_files_parallel(to_search, matches, jobs, compact, limit)
+        if readers > 0:
+            return match_files_read_ahead(to_search, matches, readers, compact, read_budget, limit)
+        return match_files(to_search, matches, compact, limit)
+
+    if cache is not None:
+        return match_files_cached(files, cache, search)
+    return search(files)
+
+
+def analyse_files(files: List[str], matches: List[str], extensions: List[str], ignore: bool, max_size: int, jobs: int = 1,
+                  cache: ResultCache = None, readers: int = 0) -> Dict[str, List[NamedTuple]]:
+    occurrences = {}
+    i = 0
+    to_search = skip_binary_files(filter_files(files, extensions, ignore, max_size), cache)
+    for file, results in search_files(to_search, matches, jobs, cache, readers=readers):
         i += 1
-        results = io_utils.find_in_file(file, matches)
+        print("Analysing {:.2f}   \r".format(100*i/len(files)), end="")
         if len(results) > 0:
             occurrences[file] = results
 
+    # Workers finish in any order
+    if jobs > 1:
+        occurrences = dict(sorted(occurrences.items()))
+
     return occurrences, i
 
 
+def index_terms(matcher) -> List[str]:
+    """
+    Gets the strings to look up in the trigram index: the
+    patterns, or for regexes the literal each must contain. The
+    index is case sensitive, so matching ignoring case (or a
+    regex without a literal) needs every file.
+    :param matcher: PatternMatcher or RegexMatcher object.
+    :return: List of strings for TrigramIndex.candidates.
+    """
+    if not isinstance(matcher, RegexMatcher):
+        return matcher.patterns
+    if matcher.ignore_case:
+        return [""]
+    return matcher.literals
+
+
+def matching_lines(results: List[NamedTuple]) -> int:
+    """
+    Counts the lines the results of a file are on (binary
+    results, which have no line, count one each).
+    :param results: List of records found in the file.
+    :return: Integer representing the number of lines.
+    """
+    if results and not hasattr(results[0], "line"):
+        return len(results)
+    return len({r.line for r in results})
+
+
+def describe_results(file: str, results: List[NamedTuple], files_only: bool = False, count: bool = False) -> str:
+    if files_only:
+        return file
+    if count:
+        return "{:s}: {:d}".format(file, matching_lines(results))
+    return "{:s}: {:d} matches".format(file, len(results))
+
+
+def run_replace(files: List[str], replacer: Replacer, jobs: int = 1, dry_run: bool = False) -> Tuple[int, int, int]:
+    """
+    Rewrites the files that matched, printing the diffs of a
+    dry run and a summary.
+    :param files: List of the paths of the files that matched.
+    :param replacer: Replacer object.
+    :param jobs: Number of worker processes.
+    :param dry_run: Whether to only print the diffs.
+    :return: Tuple with the files changed, the replacements made
+    and the bytes (re)written.
+    """
+    n_files = 0
+    n_replaced = 0
+    n_bytes = 0
+    for r in replace_files(files, replacer, jobs, dry_run):
+        if not r.count:
+            continue
+        n_files += 1
+        n_replaced += r.count
+        n_bytes += r.new_size
+        if dry_run:
+            print(r.diff, end="")
+
+    print("{:s} {:d} files, {:d} replacements, {:d} bytes {:s}".format(
+        "Would rewrite" if dry_run else "Rewrote", n_files, n_replaced, n_bytes,
+        "to write" if dry_run else "written"))
+    return n_files, n_replaced, n_bytes
+
+
+def run_dupes(entries: Iterable[os.DirEntry], asset: str = None, sample: int = 4096, inside: bool = False,
+              save_path: str = "duplicates.json") -> NoReturn:
+    """
+    Finds the duplicate files (or the copies of the asset given),
+    printing them with the work done by each stage and saving
+    them as JSON.
+    :param entries: Iterable of the DirEntry objects of the walk.
+    :param asset: Path of the file to find the copies of, or None
+    to find every group of duplicates.
+    :param sample: Bytes hashed from each end of the files.
+    :param inside: Whether to also find the bytes of the asset
+    inside bigger files.
+    :param save_path: String representing the output file path.
+    :return: void
+    """
+    finder = DupeFinder(sample)
+    output = {}
+    if asset is None:
+        groups = finder.find(entries)
+        for group in groups:
+            print("{:d} copies: {:s}".format(len(group), ", ".join(group)))
+        output["groups"] = groups
+    else:
+        # Checked before the walk: a folder has no contents to
+        # compare and an empty asset is inside every file
+        try:
+            st = os.stat(asset)
+        except OSError as e:
+            print("Could not read the asset: {:s}".format(str(e)))
+            return
+        if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+            print("The asset must be a file that isn't empty: {:s}".format(asset))
+            return
+
+        entries = list(entries)
+        try:
+            copies = finder.find_copies(asset, entries)
+            if inside:
+                with open(asset, "rb") as f:
+                    blob = f.read()
+        except OSError as e:
+            print("Could not read the asset: {:s}".format(str(e)))
+            return
+        for copy in copies:
+            print("Copy of {:s}: {:s}".format(asset, copy))
+        output["copies"] = copies
+        if inside:
+            # The files of its size were already compared whole
+            found = list(find_blob(blob, entries, finder.stages, bigger_only=True))
+            for hit in found:
+                print("Found {:s} in {:s} at byte {:d}".format(asset, hit.path, hit.offset))
+            output["inside"] = [list(h) for h in found]
+
+    print(finder.summary())
+    output["stages"] = [s._asdict() for s in finder.stages]
+    with open(save_path, "w") as f:
+        json.dump(output, f, indent=2)
+    print("Saving results to {:s}".format(save_path))
+
+
+def run_server(root: str, socket_path: str, ignore: IgnoreRules, file_filter: FileFilter, budget: int) -> NoReturn:
+    """
+    Walks the directory once, then serves searches from memory
+    until stopped.
+    :param root: String representing the directory.
+    :param socket_path: String representing the socket path.
+    :param ignore: IgnoreRules of the walk, or None.
+    :param file_filter: FileFilter of the walk.
+    :param budget: Bytes of file contents kept in memory.
+    :return: void
+    """
+    try:
+        tree = WarmTree(root, ignore, file_filter, budget)
+    except OSError as e:
+        print("Could not watch the directory: {:s}".format(str(e)))
+        return
+
+    try:
+        n_cached = tree.warm()
+        print("Cached {:d} files ({:d} bytes), listening on {:s}".format(n_cached, tree.cache.nbytes, socket_path))
+        serve(tree, socket_path)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tree.close()
+    print("Server stopped")
+
+
+def run_ask(socket_path: str, record: Dict, writer=None, files_only: bool = False, count_only: bool = False) -> bool:
+    """
+    Sends a request to the server, printing and writing the
+    results it sends back.
+    :param socket_path: String representing the socket path.
+    :param record: The request (see search_server.request).
+    :param writer: Output writer the results are written to.
+    :param files_only: Whether to only print the file paths.
+    :param count_only: Whether to print the line counts.
+    :return: True if the server answered.
+    """
+    try:
+        for reply in request(socket_path, record):
+            if "error" in reply:
+                print("Server error: {:s}".format(reply["error"]))
+                return False
+            if reply.get("done"):
+                if "files" in reply:
+                    print("Files which contain the matches: {:d} ({:.3f}s, {:d} files from memory)".format(
+                        reply["files"], reply["seconds"], reply["from_memory"]))
+                continue
+            results = [Entry(*m) for m in reply["matches"]]
+            writer.write(reply["path"], results)
+            print(describe_results(reply["path"], results, files_only, count_only))
+    except OSError as e:
+        print("No server on {:s} ({:s}), start one with: finder.py serve <dir>".format(socket_path, str(e)))
+        return False
+    return True
+
+
+def print_ignored(ignore: IgnoreRules) -> NoReturn:
+    if ignore is not None:
+        print("Ignored while walking: {:d} folders (never listed), {:d} files".format(
+            ignore.stats["folders"], ignore.stats["files"]))
+
+
+def count_pruned(stats: NullStats, ignore: IgnoreRules) -> NoReturn:
+    """
+    Lists (without going deeper) the folders the ignore rules
+    pruned, adding the number of entries the walk never read.
+    :param stats: RunStats object to add it to.
+    :param ignore: IgnoreRules of the walk.
+    :return: void
+    """
+    entries = 0
+    for folder in ignore.pruned:
+        try:
+            with os.scandir(folder) as listing:
+                entries += sum(1 for _ in listing)
+        except OSError:
+            pass
+    stats.add("entries_pruned_by_ignore", entries)
+
+
+def count_skipped(stats: NullStats, ignore: IgnoreRules, file_filter: FileFilter, n_walked: int) -> NoReturn:
+    """
+    Adds the counts of the files left out while walking.
+    :param stats: RunStats object to add them to.
+    :param ignore: IgnoreRules of the walk, or None.
+    :param file_filter: FileFilter of the walk.
+    :param n_walked: Number of files the walk gave.
+    :return: void
+    """
+    skipped = file_filter.total_rejected()
+    for reason, n in file_filter.rejected.items():
+        stats.add("skipped_" + reason, n)
+    if ignore is not None:
+        skipped += ignore.stats["files"]
+        stats.add("skipped_ignored", ignore.stats["files"])
+        stats.add("folders_ignored", ignore.stats["folders"])
+        count_pruned(stats, ignore)
+    stats.add("files_discovered", n_walked + skipped)
+
+
+def print_filtered(file_filter: FileFilter) -> NoReturn:
+    print("Filtered while walking: {:s}".format(
+        ", ".join("{:d} by {:s}".format(n, reason) for reason, n in file_filter.rejected.items())))
+
+
+def make_file_filter(parsed: List[ParsedArgument]) -> FileFilter:
+    """
+    Builds the FileFilter from the filtering options.
+    :param parsed: List of the ParsedArgument objects.
+    :return: FileFilter object.
+    """
+    def int_or_none(name: str):
+        value = arg_value(parsed, name)
+        return int(value) if value else None
+
+    newer_than = arg_value(parsed, "--newer-than")
+    return FileFilter(extensions=split_list(arg_value(parsed, "--ext")),
+                      exclude_extensions=split_list(arg_value(parsed, "--exclude-ext")),
+                      include=split_list(arg_value(parsed, "--include")),
+                      exclude=split_list(arg_value(parsed, "--exclude")),
+                      min_size=int_or_none("--min-size"),
+                      max_size=int_or_none("--max-size"),
+                      newer_than=parse_time(newer_than) if newer_than else None)
+
+
+def arg_value(parsed: List[ParsedArgument], name: str):
+    """
+    Gets the value of the argument with the name given.
+    :param parsed: List of the ParsedArgument objects.
+    :param name: The name of the argument (E.g. "<dir>").
+    :return: The value of the argument.
+    """
+    return [arg.value for arg in parsed if arg.arg == name][0]
+
+
 def parse_arg(argument: Argument, doc_args: Dict[str, str]) -> ParsedArgument:
     """
     This function will return the parsed argument
@@ -104,8 +573,51 @@ def parse_arg(argument: Argument, doc_args: Dict[str, str]) -> ParsedArgument:
 def main() -> NoReturn:
     to_parse = [
         Argument("<dir>", "root directory"),
-        Argument("<save>", "save directory for output.", ArgumentOption("s", "save")),
-        Argument("<words>", "words to look for.", ArgumentOption("", "words"))
+        Argument("--save", "save path for output.", ArgumentOption("s", "save")),
+        Argument("<words>", "words to look for.", ArgumentOption("", "words")),
+        Argument("--jobs", "number of worker processes.", ArgumentOption("j", "jobs")),
+        Argument("--read-ahead", "number of reading threads.", ArgumentOption("", "read-ahead")),
+        Argument("--read-budget", "bytes read ahead at most.", ArgumentOption("", "read-budget")),
+        Argument("--no-cache", "don't use cached results.", ArgumentOption("", "no-cache")),
+        Argument("--rebuild-cache", "empty the result cache first.", ArgumentOption("", "rebuild-cache")),
+        Argument("--index", "trigram index file.", ArgumentOption("", "index")),
+        Argument("--no-ignore", "don't apply the ignore rules.", ArgumentOption("", "no-ignore")),
+        Argument("--ignore-file", "extra ignore rules.", ArgumentOption("", "ignore-file")),
+        Argument("--snapshot", "tree snapshot file.", ArgumentOption("", "snapshot")),
+        Argument("--binary", "search binary files too.", ArgumentOption("", "binary")),
+        Argument("--regex", "words are regexes.", ArgumentOption("", "regex")),
+        Argument("--ignore-case", "match ignoring case.", ArgumentOption("i", "ignore-case")),
+        Argument("--word", "match whole words only.", ArgumentOption("w", "word")),
+        Argument("--files-with-matches", "only list the matching files.", ArgumentOption("l", "files-with-matches")),
+        Argument("--count", "count the matching lines.", ArgumentOption("c", "count")),
+        Argument("--max-count", "matching lines per file.", ArgumentOption("m", "max-count")),
+        Argument("--first", "matches before stopping.", ArgumentOption("", "first")),
+        Argument("--replace", "replacement as old=new.", ArgumentOption("", "replace")),
+        Argument("--dry-run", "only show the replacement diff.", ArgumentOption("", "dry-run")),
+        Argument("--batch", "file of named queries.", ArgumentOption("", "batch")),
+        Argument("--format", "output format.", ArgumentOption("", "format")),
+        Argument("--stats", "print and save the run stats.", ArgumentOption("", "stats")),
+        Argument("--stats-file", "run stats JSON file.", ArgumentOption("", "stats-file")),
+        Argument("--profile", "profile of the matching phase.", ArgumentOption("", "profile")),
+        Argument("--ext", "extensions to search.", ArgumentOption("", "ext")),
+        Argument("--exclude-ext", "extensions to skip.", ArgumentOption("", "exclude-ext")),
+        Argument("--include", "globs of the files to search.", ArgumentOption("", "include")),
+        Argument("--exclude", "globs of the files to skip.", ArgumentOption("", "exclude")),
+        Argument("--min-size", "minimum file size.", ArgumentOption("", "min-size")),
+        Argument("--max-size", "maximum file size.", ArgumentOption("", "max-size")),
+        Argument("--newer-than", "minimum modification time.", ArgumentOption("", "newer-than")),
+        Argument("--sample", "bytes sampled from each end.", ArgumentOption("", "sample")),
+        Argument("--inside", "find the asset inside bigger files.", ArgumentOption("", "inside")),
+        Argument("<asset>", "file to find the copies of."),
+        Argument("index", "build or update the trigram index."),
+        Argument("--socket", "server socket path.", ArgumentOption("", "socket")),
+        Argument("--memory", "server memory budget.", ArgumentOption("", "memory")),
+        Argument("--stop", "stop the server.", ArgumentOption("", "stop")),
+        Argument("serve", "serve the directory."),
+        Argument("ask", "search through the server."),
+        Argument("dupes", "find duplicate files."),
+        Argument("copies", "find the copies of a file."),
+        Argument("query", "search the files selected by the index.")
     ]
 
     # Should be run on Windows, not necessary to have
@@ -128,42 +640,267 @@ def main() -> NoReturn:
         print("Description: %s" % arg.description)
     print("================================")
 
-    root_folder = [arg.value for arg in valid_parsed if arg.arg == "<dir>"][0]
-    words = [arg.value for arg in valid_parsed if arg.arg == "<words>"][0]
-
-    print("Generating file tree...")
-    root_node = Node.from_path(root_folder, FolderNode)
-
-    print("Finding files...")
-    all_files = get_all_file_nodes(root_node)
-    print("Number of files found: {:d}".format(len(all_files)))
-
-    print("Checking for word occurrences")
+    root_folder = arg_value(parsed, "<dir>")
+    words = arg_value(parsed, "<words>")
+    jobs = int(arg_value(parsed, "--jobs"))
+    readers = int(arg_value(parsed, "--read-ahead"))
+    read_budget = int(arg_value(parsed, "--read-budget"))
+    index_path = arg_value(parsed, "--index") or default_index_path(root_folder)
+
+    # Ignored folders (.git and anything in the .gitignore files)
+    # are pruned before they are listed
+    ignore = None
+    if not arg_value(parsed, "--no-ignore"):
+        try:
+            ignore = IgnoreRules.for_root(root_folder, arg_value(parsed, "--ignore-file"))
+        except OSError as e:
+            print("Could not read the ignore file: {:s}".format(str(e)))
+            sys.exit(1)
+
+    # Files are searched as soon as the walk finds them, so the
+    # tree is never held in memory as a whole, and the ones the
+    # filter rejects are dropped from the listing itself
+    file_filter = make_file_filter(parsed)
+    socket_path = arg_value(parsed, "--socket") or default_socket_path(root_folder)
+
+    if arg_value(parsed, "serve"):
+        run_server(root_folder, socket_path, ignore, file_filter, int(arg_value(parsed, "--memory")))
+        return
+    if arg_value(parsed, "ask") and arg_value(parsed, "--stop"):
+        run_ask(socket_path, {"command": "stop"})
+        return
+
+    # Without --stats or --profile nothing is wrapped or timed
+    profile_path = arg_value(parsed, "--profile")
+    stats = NullStats()
+    if arg_value(parsed, "--stats") or profile_path:
+        stats = RunStats("search" if profile_path else None)
+
+    if arg_value(parsed, "--snapshot"):
+        # The snapshot holds every file the ignore rules keep, the
+        # filters of this run are checked on the paths
+        with stats.phase("walk"):
+            root = open_tree(root_folder, arg_value(parsed, "--snapshot"), ignore)
+        all_files = (f for f in root.iter_files() if file_filter.accepts(f))
+    else:
+        all_files = (entry.path for entry in folder_utils.walk_files(root_folder, ignore, file_filter))
+    all_files = stats.timed("walk", all_files)
+
+    if arg_value(parsed, "index"):
+        print("Indexing files into {:s}...".format(index_path))
+        with TrigramIndex(index_path) as index:
+            added, removed, unchanged = index.update(skip_binary_files(all_files))
+        print("Files indexed: {:d}, removed: {:d}, unchanged: {:d}".format(added, removed, unchanged))
+        print_ignored(ignore)
+        print_filtered(file_filter)
+        return
+
+    if arg_value(parsed, "dupes") or arg_value(parsed, "copies"):
+        # The walk's entries carry the sizes the first stage needs
+        entries = stats.timed("walk", folder_utils.walk_files(root_folder, ignore, file_filter))
+        with stats.phase("dupes"):
+            run_dupes(entries, arg_value(parsed, "<asset>"), int(arg_value(parsed, "--sample")),
+                      arg_value(parsed, "--inside"), output_path(arg_value(parsed, "--save"), "json", "duplicates"))
+        print_ignored(ignore)
+        print_filtered(file_filter)
+        if arg_value(parsed, "--stats"):
+            print(stats.summary())
+        return
 
     to_match = [" LFM ", " Server ", " server ", " NetView ", " netview "]
     if words:
         to_match = words
-    finder_params = {
-        "files": all_files,
-        "matches": to_match,
-        "extensions": ["png", "jpg", "jpeg"],
-        "ignore": True,
-        "max_size": 3000000 # 3Mb max file
-    }
+
+    # Only the files holding the text to replace are rewritten
+    replacer = None
+    if arg_value(parsed, "--replace"):
+        try:
+            old, new = parse_replacement(arg_value(parsed, "--replace"))
+        except ValueError as e:
+            print(str(e))
+            return
+        to_match = [old]
+
+    # All the queries of a batch are searched as one pattern list
+    batch = None
+    if arg_value(parsed, "--batch"):
+        if replacer is not None or arg_value(parsed, "--replace"):
+            print("--replace can't be used with --batch")
+            return
+        # The limits count the matches of all the queries together,
+        # so a query's results would depend on the others
+        for limit_arg in ("--files-with-matches", "--max-count", "--first"):
+            if arg_value(parsed, limit_arg):
+                print("{:s} can't be used with --batch".format(limit_arg))
+                return
+        try:
+            batch = BatchQuery(load_queries(arg_value(parsed, "--batch")))
+        except (OSError, ValueError) as e:
+            print("Could not load the queries: {:s}".format(str(e)))
+            return
+        to_match = batch.patterns
+        print("Running the queries: {:s}".format(", ".join(batch.names)))
     print("Looking for the following words: {:s}".format(", ".join(to_match)))
-    occurrences, n = analyse_files(**finder_params)
-    print("")
-    print("Number of files analysed: {:d}".format(n))
-    print("Number of files which contain the matches: {:d}".format(len(occurrences)))
-    print("Preparing JSON data...")
-    json_dump = {}
-    for key in occurrences:
-        json_dump[key] = [i._asdict() for i in occurrences[key]]
 
-    print("Saving file to output.txt")
+    # Compiled once for the whole run (and for every worker)
+    try:
+        matcher = compile_patterns(to_match, arg_value(parsed, "--regex"), arg_value(parsed, "--ignore-case"),
+                                   arg_value(parsed, "--word"))
+        if arg_value(parsed, "--replace"):
+            replacer = Replacer(old, new, arg_value(parsed, "--regex"), arg_value(parsed, "--ignore-case"),
+                                arg_value(parsed, "--word"))
+    except re.error as e:
+        print("Invalid regular expression: {:s}".format(str(e)))
+        return
+
+    if arg_value(parsed, "query"):
+        # The tree is not walked, files deleted since
+        # the last index update are just skipped
+        with TrigramIndex(index_path) as index:
+            to_search = [f for f in index.candidates(index_terms(matcher)) if file_utils.is_file(f) and file_filter.accepts(f)]
+        print("Candidate files from the index: {:d}".format(len(to_search)))
+    else:
+        to_search = all_files
+
+    out_format = arg_value(parsed, "--format")
+    if out_format not in FORMATS:
+        print("Unknown output format {:s}, use one of: {:s}".format(out_format, ", ".join(FORMATS)))
+        return
+    save_path = output_path(arg_value(parsed, "--save"), out_format)
+
+    # Files are left as soon as their answer is known
+    files_only = arg_value(parsed, "--files-with-matches")
+    count_only = arg_value(parsed, "--count")
+    limit = 1 if files_only else None
+    if arg_value(parsed, "--max-count"):
+        limit = int(arg_value(parsed, "--max-count"))
+    first = int(arg_value(parsed, "--first")) if arg_value(parsed, "--first") else None
+    if first is not None:
+        limit = min(limit or first, first)
+
+    if arg_value(parsed, "ask"):
+        record = {"words": to_match, "regex": arg_value(parsed, "--regex"),
+                  "ignore_case": arg_value(parsed, "--ignore-case"), "word": arg_value(parsed, "--word"),
+                  "limit": limit}
+        writer = open_writer(save_path, out_format)
+        if run_ask(socket_path, record, writer, files_only, count_only):
+            print("Saving results to {:s}".format(save_path))
+        writer.close()
+        return
+
+    # The JSON document holds every result until the end, so
+    # those are kept compact and their lines read back on output
+    compact = out_format == "json" or batch is not None
+
+    cache = None
+    if not arg_value(parsed, "--no-cache"):
+        cache = ResultCache(default_cache_path(), matcher, rebuild=arg_value(parsed, "--rebuild-cache"),
+                            record=Hit if compact else Entry, limit=limit)
+
+    # Workers (and cache hits) come in any order, the JSON document
+    # is sorted by path while the streaming formats are written as
+    # they come
+    sort = jobs > 1 or cache is not None
+    if batch is not None:
+        writer = BatchWriter(batch, arg_value(parsed, "--save"), out_format, sort=sort)
+    else:
+        writer = open_writer(save_path, out_format, sort=sort, patterns=to_match)
+
+    # The paths are only kept when they are used after the
+    # search, so memory doesn't grow with the number of files
+    binaries = [] if arg_value(parsed, "--binary") else _Counted()
+    to_search = stats.timed("binary_check", skip_binary_files(to_search, cache, binaries))
+
+    n = 0
+    n_found = 0
+    n_matches = 0
+    matched_files = [] if replacer is not None else _Counted()
+    searched = stats.timed("search", search_files(to_search, matcher, jobs, cache, compact, stats, readers,
+                                                  read_budget, limit))
+    for file, results in searched:
+        n += 1
+        if len(results) > 0:
+            if first is not None:
+                results = results[:first - n_matches]
+            n_found += 1
+            n_matches += len(results)
+            matched_files.append(file)
+            stats.add("matches", len(results))
+            with stats.phase("output"):
+                writer.write(file, results)
+            print(describe_results(file, results, files_only, count_only))
+            if first is not None and n_matches >= first:
+                break
+        print("Analysed {:d} files   \r".format(n), end="")
+    # Stops the walk and the workers when leaving early
+    searched.close()
+    n_walked = n + len(binaries)
+    stopped = first is not None and n_matches >= first
+
+    if arg_value(parsed, "--binary") and not stopped:
+        for file in binaries:
+            n += 1
+            with stats.phase("binary_search"):
+                results = io_utils.find_offsets_in_file(file, matcher)
+            stats.add("bytes_read", os.path.getsize(file))
+            if len(results) > 0:
+                if first is not None:
+                    results = results[:first - n_matches]
+                n_found += 1
+                n_matches += len(results)
+                stats.add("matches", len(results))
+                with stats.phase("output"):
+                    writer.write(file, results)
+                print(describe_results(file, results, files_only, count_only))
+                if first is not None and n_matches >= first:
+                    stopped = True
+                    break
 
-    with open("output.json", "w") as f:
-        json.dump(json_dump, f)
+    print("")
+    if stopped:
+        print("Stopped after the first {:d} matches".format(first))
+    print("Number of files analysed: {:d}".format(n))
+    print("Number of files which contain the matches: {:d}".format(n_found))
+    print("Binary files {:s}: {:d}".format("searched" if arg_value(parsed, "--binary") else "skipped", len(binaries)))
+    print_ignored(ignore)
+    print_filtered(file_filter)
+    if cache is not None:
+        cache.close()
+        print("Cache hits: {:d}, misses: {:d}".format(cache.hits, cache.misses))
+
+    if batch is not None:
+        for name, n_files, n_query, path in writer.summary():
+            print("Query {:s}: {:d} matches in {:d} files, saving to {:s}".format(name, n_query, n_files, path))
+    else:
+        print("Saving results to {:s}".format(save_path))
+    with stats.phase("output"):
+        writer.close()
+
+    # After the output, since the JSON writer reads the lines back
+    if replacer is not None:
+        with stats.phase("replace"):
+            _, n_replaced, n_bytes = run_replace(matched_files, replacer, jobs, arg_value(parsed, "--dry-run"))
+        stats.add("replacements", n_replaced)
+        stats.add("bytes_rewritten", 0 if arg_value(parsed, "--dry-run") else n_bytes)
+
+    if isinstance(stats, RunStats):
+        if not arg_value(parsed, "query"):
+            count_skipped(stats, ignore, file_filter, n_walked)
+        stats.add("skipped_binary", len(binaries))
+        stats.add("files_searched", n)
+        stats.add("files_matched", n_found)
+        if cache is not None:
+            stats.add("cache_hits", cache.hits)
+            stats.add("cache_misses", cache.misses)
+
+    if arg_value(parsed, "--stats"):
+        stats_path = arg_value(parsed, "--stats-file")
+        print(stats.summary())
+        stats.save(stats_path)
+        print("Stats saved to {:s}".format(stats_path))
+    if profile_path:
+        print(stats.save_profile(profile_path))
+        print("Profile of the matching phase saved to {:s}".format(profile_path))
 
 
 if __name__ == "__main__":
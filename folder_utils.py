@@ -1,4 +1,6 @@
-from typing import List, NoReturn
+from typing import Iterator, List, NoReturn, Optional, Set, Tuple
+from file_filter import FileFilter
+from ignore_rules import IgnoreRules
 import os
 
 
@@ -47,6 +49,98 @@ def get_files(path: str) -> List[str]:
         return os.listdir(path)
 
 
+def scan_dir(path: str) -> Tuple[List[os.DirEntry], List[os.DirEntry]]:
+    """
+    This function will list the directory given once, splitting
+    the entries into files and folders. The entry types come from
+    the listing itself, so no extra stat calls are made for them.
+    :param path: String representing the directory path.
+    :return: Tuple with the list of file entries and the list of
+    folder entries, in listing order.
+    """
+    files = []
+    folders = []
+    with os.scandir(path or '.') as it:
+        for entry in it:
+            if entry.is_file():
+                files.append(entry)
+            elif entry.is_dir():
+                folders.append(entry)
+
+    return files, folders
+
+
+def scan_filtered(path: str, rules: IgnoreRules = None,
+                  file_filter: FileFilter = None) -> Tuple[List[os.DirEntry], List[os.DirEntry], Optional[IgnoreRules]]:
+    """
+    This function lists the directory given like scan_dir, leaving
+    out the entries the ignore rules and the file filter reject,
+    the way every walk of the tree does.
+    :param path: String representing the directory path.
+    :param rules: IgnoreRules the folder inherits, or None.
+    :param file_filter: FileFilter the files must pass, or None.
+    :return: Tuple with the list of file entries, the list of
+    folder entries and the IgnoreRules for the folder's contents
+    (None without rules).
+    """
+    files, folders = scan_dir(path)
+    if rules is not None:
+        rules = rules.enter(path, files, folders)
+        files = [f for f in files if not rules.is_ignored(f, False)]
+        folders = [f for f in folders if not rules.is_ignored(f, True)]
+    if file_filter is not None:
+        files = [f for f in files if file_filter.accepts(f)]
+
+    return files, folders, rules
+
+
+def is_seen_link(entry: os.DirEntry, seen: Set[Tuple[int, int]]) -> bool:
+    """
+    This function checks whether the folder entry given is a
+    symlink to a folder that was already reached through another
+    link, recording it otherwise. Used to stop walks looping
+    forever on links pointing back up the tree.
+    :param entry: DirEntry object for the folder.
+    :param seen: Set of (device, inode) pairs of the link targets
+    walked so far.
+    :return: True if the entry should not be walked again.
+    """
+    if not entry.is_symlink():
+        return False
+
+    target = os.stat(entry.path)
+    key = (target.st_dev, target.st_ino)
+    if key in seen:
+        return True
+    seen.add(key)
+    return False
+
+
+def walk_files(path: str, ignore: IgnoreRules = None, file_filter: FileFilter = None) -> Iterator[os.DirEntry]:
+    """
+    This function lazily walks the directory given, yielding the
+    file entries as each folder is listed. The order is the same
+    as flattening the FolderNode tree (files of a folder first,
+    then each sub folder depth first), but only the folders
+    still to be walked are kept in memory.
+    :param path: String representing the root directory.
+    :param ignore: IgnoreRules of the root, to leave out ignored
+    files and never list ignored folders. None walks everything.
+    :param file_filter: FileFilter the files must pass to be
+    yielded, checked on the entries of the listing. None keeps all.
+    :return: Iterator over the DirEntry objects of the files.
+    """
+    seen_links = set()
+    pending = [(os.path.abspath(path), ignore)]
+
+    while pending:
+        folder, rules = pending.pop()
+        files, folders, rules = scan_filtered(folder, rules, file_filter)
+
+        yield from files
+        pending.extend(reversed([(f.path, rules) for f in folders if not is_seen_link(f, seen_links)]))
+
+
 def filter_files(path_list: List[str]) -> List[str]:
     """
     This function will filter the list given so
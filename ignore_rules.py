@@ -0,0 +1,200 @@
+# ignore_rules.py - .gitignore style rules to prune the walk
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+import os
+import re
+
+# Folders that are never walked, like git does with its own
+ALWAYS_IGNORED = [".git"]
+
+
+def _glob_to_regex(glob: str) -> str:
+    """
+    Translates the glob of a gitignore rule (without the
+    leading '!' or trailing '/') into a regex over '/' paths.
+    :param glob: String representing the glob.
+    :return: String representing the regex.
+    """
+    out = []
+    i = 0
+    n = len(glob)
+    while i < n:
+        c = glob[i]
+        if glob.startswith("**/", i) and (i == 0 or glob[i - 1] == "/"):
+            out.append("(?:.*/)?")
+            i += 3
+        elif glob.startswith("**", i) and i + 2 == n and (i == 0 or glob[i - 1] == "/"):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = glob.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+            else:
+                body = glob[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end + 1
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(glob[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+
+def parse_rules(lines: List[str]) -> List[Tuple[str, bool, bool]]:
+    """
+    Parses the lines of a gitignore file.
+    :param lines: List of the lines of the file.
+    :return: List of (regex, negated, folders only) tuples, where
+    the regex matches paths relative to the file's folder.
+    """
+    rules = []
+    for line in lines:
+        line = line.rstrip("\n").rstrip("\r")
+        if not line.endswith("\\ "):
+            line = line.rstrip(" ")
+        if not line or line.startswith("#"):
+            continue
+
+        negated = line.startswith("!")
+        if negated or line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+
+        folders_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+
+        # A slash anywhere but the end anchors the rule to the folder
+        if "/" in line:
+            regex = _glob_to_regex(line.lstrip("/"))
+        else:
+            regex = "(?:.*/)?" + _glob_to_regex(line)
+        rules.append((regex, negated, folders_only))
+
+    return rules
+
+
+class IgnoreLevel(object):
+    """
+    The rules read in one folder, compiled once. All the rules
+    are also joined in one regex, so most entries are cleared
+    with a single match.
+    """
+
+    def __init__(self, base: str, rules: List[Tuple[str, bool, bool]]):
+        self.base = base
+        self.rules = [(re.compile(r), negated, folders_only) for r, negated, folders_only in rules]
+        self._any = re.compile("(?:" + "|".join(r for r, _, _ in rules) + r")\Z")
+
+    def match(self, path: str, is_dir: bool) -> Optional[bool]:
+        """
+        Checks the path given against the rules of this level.
+        :param path: String representing the absolute path.
+        :param is_dir: Whether the path is a folder.
+        :return: True if ignored, False if re-included by a '!'
+        rule and None if no rule matches.
+        """
+        rel = path[len(self.base) + 1:].replace(os.sep, "/")
+        if not self._any.match(rel):
+            return None
+
+        # The last rule that matches decides
+        for regex, negated, folders_only in reversed(self.rules):
+            if folders_only and not is_dir:
+                continue
+            if regex.fullmatch(rel):
+                return not negated
+        return None
+
+
+class IgnoreRules(object):
+    """
+    The chain of IgnoreLevels that apply to a folder of the
+    walk, from the deepest to the walk root. Counts of what was
+    pruned, and the paths of the pruned folders, are shared by
+    the whole chain.
+    """
+
+    def __init__(self, levels: Tuple[IgnoreLevel] = (), stats: Dict[str, int] = None, pruned: List[str] = None):
+        self.levels = levels
+        self.stats = stats if stats is not None else {"folders": 0, "files": 0}
+        self.pruned = pruned if pruned is not None else []
+
+    @classmethod
+    def for_root(cls, root: str, ignore_file: str = None) -> IgnoreRules:
+        """
+        Creates the rules of the walk root, starting from the
+        user's ignore file if one is given.
+        :param root: String representing the walk root.
+        :param ignore_file: Path (relative to the root) of a
+        gitignore style file whose rules are relative to the root.
+        :return: IgnoreRules object.
+        """
+        rules = IgnoreRules()
+        if ignore_file:
+            with open(os.path.join(root, ignore_file), errors="ignore") as f:
+                rules = rules._with_rules(os.path.abspath(root), parse_rules(f.readlines()))
+        return rules
+
+    def _with_rules(self, base: str, rules: List[Tuple[str, bool, bool]]) -> IgnoreRules:
+        if not rules:
+            return self
+        return IgnoreRules((IgnoreLevel(base, rules),) + self.levels, self.stats, self.pruned)
+
+    def enter(self, folder: str, files: List[os.DirEntry], folders: List[os.DirEntry]) -> IgnoreRules:
+        """
+        Gets the rules for the contents of the folder given, adding
+        its .gitignore (and .git/info/exclude at a repository root).
+        :param folder: String representing the folder path.
+        :param files: File entries of the folder.
+        :param folders: Folder entries of the folder.
+        :return: IgnoreRules object for the folder's entries.
+        """
+        rules = []
+        if any(f.name == ".git" for f in folders):
+            rules.extend(_read_rules(os.path.join(folder, ".git", "info", "exclude")))
+        if any(f.name == ".gitignore" for f in files):
+            rules.extend(_read_rules(os.path.join(folder, ".gitignore")))
+        return self._with_rules(folder, rules)
+
+    def is_ignored(self, entry: os.DirEntry, is_dir: bool) -> bool:
+        """
+        Checks whether the entry given should be left out of the
+        walk, counting it if so.
+        :param entry: DirEntry object of a file or folder.
+        :param is_dir: Whether the entry is a folder.
+        :return: True if the entry is ignored.
+        """
+        ignored = is_dir and entry.name in ALWAYS_IGNORED
+        if not ignored:
+            for level in self.levels:
+                decision = level.match(entry.path, is_dir)
+                if decision is not None:
+                    ignored = decision
+                    break
+
+        if ignored:
+            self.stats["folders" if is_dir else "files"] += 1
+            if is_dir:
+                self.pruned.append(entry.path)
+        return ignored
+
+
+def _read_rules(path: str) -> List[Tuple[str, bool, bool]]:
+    try:
+        with open(path, errors="ignore") as f:
+            return parse_rules(f.readlines())
+    except OSError:
+        return []
@@ -0,0 +1,332 @@
+# image_hash.py - Perceptual hashes of images, decoding PNG with zlib
+from collections import namedtuple
+from itertools import accumulate
+from typing import BinaryIO, Iterator, List, Sequence, Tuple
+import struct
+import zlib
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Extensions of the files hashed as images (PNG is decoded here,
+# the others need Pillow)
+PNG_EXTENSIONS = ["png"]
+PIL_EXTENSIONS = ["jpg", "jpeg", "gif", "bmp", "webp", "tif", "tiff"]
+
+# Bytes of compressed image data inflated at once
+INFLATE_BLOCK = 262144
+
+# Grids the images are shrunk to for each hash
+AHASH_SIZE = (8, 8)
+DHASH_SIZE = (9, 8)
+
+# Both hashes of an image, as 64 bit integers
+ImageHash = namedtuple("ImageHash", ["width", "height", "ahash", "dhash"])
+
+# Luma weights (per mille) of the red, green and blue channels
+_LUMA = (299, 587, 114)
+
+
+class ImageError(Exception):
+    pass
+
+
+def image_extensions() -> List[str]:
+    """
+    :return: List of the extensions that can be hashed, the
+    ones Pillow reads only when it's installed.
+    """
+    return PNG_EXTENSIONS + (PIL_EXTENSIONS if Image is not None else [])
+
+
+def _read_chunks(f: BinaryIO) -> Iterator[Tuple[bytes, bytes]]:
+    if f.read(8) != PNG_SIGNATURE:
+        raise ImageError("Not a PNG file")
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            raise ImageError("Truncated PNG file")
+        length, kind = struct.unpack(">I4s", head)
+        data = f.read(length)
+        f.read(4)
+        yield kind, data
+        if kind == b"IEND":
+            return
+
+
+def _swar_add(a: bytes, b: bytes) -> bytes:
+    # Adds the bytes pairwise (mod 256) as two big integers,
+    # keeping the carries from crossing into the next byte
+    n = len(a)
+    low = int.from_bytes(b"\x7f" * n, "big")
+    x = int.from_bytes(a, "big")
+    y = int.from_bytes(b, "big")
+    return (((x & low) + (y & low)) ^ ((x ^ y) & ~low)).to_bytes(n, "big")
+
+
+def _unfilter(kind: int, raw: bytes, prev: bytes, bpp: int) -> bytes:
+    """
+    Undoes the PNG filter of one scanline.
+    :param kind: Filter type, the first byte of the scanline.
+    :param raw: The filtered bytes of the scanline.
+    :param prev: The unfiltered previous scanline (zeros for the
+    first one).
+    :param bpp: Bytes per complete pixel, at least 1.
+    :return: The unfiltered bytes.
+    """
+    if kind == 0:
+        return raw
+    if kind == 2:
+        return _swar_add(raw, prev)
+    out = bytearray(raw)
+    if kind == 1:
+        # Each channel is a running sum, done in C
+        for c in range(bpp):
+            out[c::bpp] = bytes(map((255).__and__, accumulate(raw[c::bpp])))
+        return bytes(out)
+    if kind == 3:
+        for i in range(len(out)):
+            left = out[i - bpp] if i >= bpp else 0
+            out[i] = (out[i] + ((left + prev[i]) >> 1)) & 255
+        return bytes(out)
+    if kind == 4:
+        for i in range(len(out)):
+            a = out[i - bpp] if i >= bpp else 0
+            b = prev[i]
+            c = prev[i - bpp] if i >= bpp else 0
+            p = a + b - c
+            pa = abs(p - a)
+            pb = abs(p - b)
+            pc = abs(p - c)
+            out[i] = (out[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 255
+        return bytes(out)
+    raise ImageError("Unknown PNG filter {:d}".format(kind))
+
+
+def _expand_table(depth: int, scale: bool) -> List[bytes]:
+    # Byte -> the pixels packed in it, one per byte
+    per_byte = 8 // depth
+    mask = (1 << depth) - 1
+    factor = 255 // mask if scale else 1
+    return [bytes(((b >> (8 - depth * (i + 1))) & mask) * factor for i in range(per_byte)) for b in range(256)]
+
+
+def _inflate(chunks: List[bytes]) -> Iterator[bytes]:
+    inflate = zlib.decompressobj()
+    try:
+        for chunk in chunks:
+            for i in range(0, len(chunk), INFLATE_BLOCK):
+                yield inflate.decompress(chunk[i:i + INFLATE_BLOCK])
+        yield inflate.flush()
+    except zlib.error as e:
+        raise ImageError("Corrupt PNG image data: {:s}".format(str(e)))
+
+
+def decode_png(f: BinaryIO) -> Tuple[int, int, Iterator[bytes], int, Sequence[Tuple[int, int]]]:
+    """
+    Decodes a PNG file a scanline at a time. Only the layout of
+    the samples is given, so the caller can reduce the channels
+    over slices of each row.
+    :param f: File object opened in binary mode.
+    :return: Tuple with the width, the height, an iterator of the
+    rows (bytes), the bytes per pixel in the rows and the
+    (offset, weight) of each channel in the gray level.
+    """
+    chunks = _read_chunks(f)
+    kind, header = next(chunks)
+    if kind != b"IHDR" or len(header) != 13:
+        raise ImageError("PNG file without a header")
+    width, height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", header)
+    if not width or not height:
+        raise ImageError("Empty PNG image")
+    if interlace:
+        raise ImageError("Interlaced PNG files are not supported")
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}.get(color)
+    if channels is None or depth not in (1, 2, 4, 8, 16):
+        raise ImageError("Unsupported PNG color type {:d} / depth {:d}".format(color, depth))
+
+    palette = None
+    data = []
+    for kind, chunk in chunks:
+        if kind == b"PLTE":
+            palette = chunk
+        elif kind == b"IDAT":
+            data.append(chunk)
+        elif kind == b"IEND":
+            break
+        elif data:
+            # The image data is one run of IDAT chunks
+            chunks.close()
+            break
+
+    row_bytes = (width * channels * depth + 7) // 8
+    bpp = max(1, channels * depth // 8)
+
+    # How a row of unfiltered bytes turns into gray levels
+    if color == 3:
+        if palette is None:
+            raise ImageError("Palette PNG file without a palette")
+        entries = [palette[i:i + 3] for i in range(0, len(palette) - 2, 3)]
+        gray = bytes(sum(w * c for w, c in zip(_LUMA, e)) // 1000 for e in entries).ljust(256, b"\0")
+        expand = _expand_table(depth, False) if depth < 8 else None
+
+        def convert(row):
+            if expand is not None:
+                row = b"".join(map(expand.__getitem__, row))[:width]
+            return row.translate(gray)
+        stride, layout = 1, [(0, 1000)]
+    elif depth < 8:
+        expand = _expand_table(depth, True)
+
+        def convert(row):
+            return b"".join(map(expand.__getitem__, row))[:width]
+        stride, layout = 1, [(0, 1000)]
+    else:
+        def convert(row):
+            return row
+        # 16 bit samples are read from their high byte
+        size = depth // 8
+        stride = bpp
+        layout = [(0, 1000)] if channels < 3 else [(c * size, w) for c, w in enumerate(_LUMA)]
+
+    def rows() -> Iterator[bytes]:
+        prev = bytes(row_bytes)
+        n = 0
+        pending = b""
+        for block in _inflate(data):
+            pending += block
+            # Each scanline is its filter type and its bytes
+            pos = 0
+            while len(pending) - pos > row_bytes and n < height:
+                prev = _unfilter(pending[pos], pending[pos + 1:pos + row_bytes + 1], prev, bpp)
+                pos += row_bytes + 1
+                n += 1
+                yield convert(prev)
+            pending = pending[pos:]
+        if n < height:
+            raise ImageError("Truncated PNG image data")
+
+    return width, height, rows(), stride, layout
+
+
+def _cells(length: int, n: int) -> List[Tuple[int, int]]:
+    # Ranges of the n cells, each at least one pixel long
+    return [(i * length // n, max(i * length // n + 1, (i + 1) * length // n)) for i in range(n)]
+
+
+def shrink(width: int, height: int, rows: Iterator[bytes], stride: int, layout: Sequence[Tuple[int, int]],
+           sizes: Sequence[Tuple[int, int]]) -> List[List[float]]:
+    """
+    Averages the gray levels of the image over the cells of each
+    grid size given, in a single pass over the rows. The sums of
+    each channel over a cell are taken on row slices, so no
+    Python code runs per pixel.
+    :param width: Width of the image, in pixels.
+    :param height: Height of the image, in pixels.
+    :param rows: Iterator of the rows, as given by decode_png.
+    :param stride: Bytes per pixel in the rows.
+    :param layout: (offset, weight) of each channel.
+    :param sizes: List of the (columns, rows) of each grid.
+    :return: List of the grids, each a list of the mean gray
+    levels (0 to 255) of its cells, row by row.
+    """
+    grids = []
+    for cols, n_rows in sizes:
+        x_cells = _cells(width, cols)
+        y_cells = _cells(height, n_rows)
+        # The cell rows each image row adds to
+        owners = [[] for _ in range(height)]
+        for cy, (y0, y1) in enumerate(y_cells):
+            for y in range(y0, y1):
+                owners[y].append(cy)
+        grids.append((x_cells, y_cells, owners, [0] * (cols * n_rows)))
+
+    for y, row in enumerate(rows):
+        for x_cells, _, owners, sums in grids:
+            if not owners[y]:
+                continue
+            cols = len(x_cells)
+            row_sums = []
+            for x0, x1 in x_cells:
+                row_sums.append(sum(w * sum(row[x0 * stride + c:x1 * stride:stride]) for c, w in layout))
+            for cy in owners[y]:
+                for cx, s in enumerate(row_sums):
+                    sums[cy * cols + cx] += s
+
+    result = []
+    for x_cells, y_cells, _, sums in grids:
+        cols = len(x_cells)
+        areas = [(x1 - x0) * (y1 - y0) for y0, y1 in y_cells for x0, x1 in x_cells]
+        result.append([s / (1000 * area) for s, area in zip(sums, areas)])
+    return result
+
+
+def _bits(flags: Iterator[bool]) -> int:
+    value = 0
+    for flag in flags:
+        value = (value << 1) | int(flag)
+    return value
+
+
+def average_hash(grid: List[float]) -> int:
+    """
+    :param grid: The 8x8 mean gray levels.
+    :return: 64 bit integer, a bit set per cell brighter than
+    the mean of the image.
+    """
+    mean = sum(grid) / len(grid)
+    return _bits(v > mean for v in grid)
+
+
+def difference_hash(grid: List[float], cols: int = DHASH_SIZE[0]) -> int:
+    """
+    :param grid: The 9x8 mean gray levels.
+    :param cols: Columns of the grid.
+    :return: 64 bit integer, a bit set per cell brighter than
+    the one on its right.
+    """
+    return _bits(grid[i] > grid[i + 1] for i in range(len(grid)) if i % cols != cols - 1)
+
+
+def _pil_grids(path: str, sizes: Sequence[Tuple[int, int]]) -> Tuple[int, int, List[List[float]]]:
+    with Image.open(path) as img:
+        gray = img.convert("L")
+        return img.width, img.height, [list(gray.resize(size, Image.BOX).getdata()) for size in sizes]
+
+
+def hash_image(path: str) -> ImageHash:
+    """
+    Computes the perceptual hashes of the image given: PNG files
+    are decoded here, the other formats through Pillow if it's
+    installed.
+    :param path: String representing the image path.
+    :return: ImageHash(width, height, ahash, dhash).
+    """
+    sizes = [AHASH_SIZE, DHASH_SIZE]
+    with open(path, "rb") as f:
+        is_png = f.read(8) == PNG_SIGNATURE
+        if is_png:
+            f.seek(0)
+            width, height, rows, stride, layout = decode_png(f)
+            grids = shrink(width, height, rows, stride, layout, sizes)
+    if not is_png:
+        if Image is None:
+            raise ImageError("Only PNG files can be read without Pillow")
+        try:
+            width, height, grids = _pil_grids(path, sizes)
+        except Exception as e:
+            raise ImageError(str(e))
+    return ImageHash(width, height, average_hash(grids[0]), difference_hash(grids[1]))
+
+
+def hamming(a: int, b: int) -> int:
+    """
+    :return: Number of bits that differ between the two hashes.
+    """
+    x = a ^ b
+    # int.bit_count is Python 3.10+
+    return x.bit_count() if hasattr(x, "bit_count") else bin(x).count("1")
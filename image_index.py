@@ -0,0 +1,174 @@
+# image_index.py - On disk index of the perceptual hashes of images
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, NoReturn, Optional, Tuple
+import hashlib
+import os
+import sqlite3
+from image_hash import ImageError, ImageHash, hamming, hash_image
+from result_cache import default_cache_dir
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Images given to each worker at once
+CHUNK_IMAGES = 32
+
+# Hashes are written every this many images
+COMMIT_EVERY = 500
+
+HASH_KINDS = ["ahash", "dhash"]
+
+
+def default_image_index_path(root: str) -> str:
+    """
+    Gets the path of the image index of the directory given,
+    in the cache directory next to the trigram indexes.
+    :param root: String representing the indexed directory.
+    :return: String representing the index path.
+    """
+    key = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()
+    return os.path.join(default_cache_dir(), "images-{:s}.sqlite".format(key))
+
+
+def _signed(value: int) -> int:
+    # SQLite integers are signed 64 bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _hash_or_none(path: str) -> Optional[ImageHash]:
+    try:
+        return hash_image(path)
+    except (OSError, ImageError):
+        return None
+
+
+class ImageIndex(object):
+    """
+    The aHash and dHash of every image, keyed on the path, size,
+    mtime and inode of the file so images are only decoded again
+    when they change. Images that can't be decoded are kept too
+    (without hashes), so they aren't retried on every update.
+    Queries scan all the hashes of a kind at once, with NumPy
+    when it's installed.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER,"
+            " width INTEGER, height INTEGER, ahash INTEGER, dhash INTEGER)")
+        self._db.commit()
+        self._loaded = {}
+
+    def update(self, files: Iterable[str], jobs: int = 1) -> Tuple[int, int, int, int]:
+        """
+        Brings the index up to date with the images given, decoding
+        only the new and changed ones. Indexed images missing from
+        the list are dropped.
+        :param files: Iterable of the image paths.
+        :param jobs: Number of worker processes decoding the images.
+        :return: Tuple with the number of images (re)hashed, the
+        ones that could not be decoded, dropped and unchanged.
+        """
+        known = {row[0]: tuple(row[1:]) for row in
+                 self._db.execute("SELECT path, size, mtime_ns, inode FROM images")}
+        seen = set()
+        changed = []
+        unchanged = 0
+        for path in files:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            seen.add(path)
+            key = (st.st_size, st.st_mtime_ns, st.st_ino)
+            if known.get(path) == key:
+                unchanged += 1
+            else:
+                changed.append((path, key))
+
+        paths = [path for path, _ in changed]
+        if jobs > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(jobs) as pool:
+                hashes = list(pool.map(_hash_or_none, paths, chunksize=CHUNK_IMAGES))
+        else:
+            hashes = map(_hash_or_none, paths)
+
+        n_hashed = 0
+        n_failed = 0
+        for i, ((path, key), h) in enumerate(zip(changed, hashes)):
+            if h is None:
+                n_failed += 1
+                values = (None, None, None, None)
+            else:
+                n_hashed += 1
+                values = (h.width, h.height, _signed(h.ahash), _signed(h.dhash))
+            self._db.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (path,) + key + values)
+            if (i + 1) % COMMIT_EVERY == 0:
+                self._db.commit()
+
+        gone = [(p,) for p in known if p not in seen]
+        self._db.executemany("DELETE FROM images WHERE path = ?", gone)
+        self._db.commit()
+        self._loaded = {}
+        return n_hashed, n_failed, len(gone), unchanged
+
+    def _hashes(self, kind: str) -> Tuple[List[str], array]:
+        # Loaded once per index, as unsigned 64 bit values
+        if kind not in self._loaded:
+            paths = []
+            hashes = array("q")
+            for path, value in self._db.execute(
+                    "SELECT path, {:s} FROM images WHERE {:s} IS NOT NULL ORDER BY path".format(kind, kind)):
+                paths.append(path)
+                hashes.append(value)
+            self._loaded[kind] = (paths, array("Q", hashes.tobytes()))
+        return self._loaded[kind]
+
+    def distances(self, value: int, kind: str = "dhash") -> List[int]:
+        """
+        Gets the Hamming distance of the hash given to every
+        indexed image, in the order of paths().
+        :param value: The 64 bit hash of the reference image.
+        :param kind: Which hash it is, one of HASH_KINDS.
+        :return: List of the distances, in bits.
+        """
+        _, hashes = self._hashes(kind)
+        if numpy is not None:
+            xor = numpy.frombuffer(hashes, dtype=numpy.uint64) ^ numpy.uint64(value)
+            bits = numpy.unpackbits(xor.view(numpy.uint8).reshape(-1, 8), axis=1)
+            return bits.sum(axis=1).tolist()
+        return [hamming(h, value) for h in hashes]
+
+    def paths(self, kind: str = "dhash") -> List[str]:
+        return self._hashes(kind)[0]
+
+    def query(self, reference: ImageHash, max_distance: int = 10, kind: str = "dhash") -> List[Tuple[str, int]]:
+        """
+        Finds the images whose hash is within a distance of the
+        reference image's.
+        :param reference: ImageHash of the reference image.
+        :param max_distance: Largest number of bits that may differ.
+        :param kind: Hash to compare, one of HASH_KINDS.
+        :return: List of (path, distance), closest first.
+        """
+        value = getattr(reference, kind)
+        found = [(d, p) for p, d in zip(self.paths(kind), self.distances(value, kind)) if d <= max_distance]
+        return [(p, d) for d, p in sorted(found)]
+
+    def close(self) -> NoReturn:
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
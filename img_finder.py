@@ -1,21 +1,81 @@
 """ img_finder.py Script that finds the images in the given
-directory.
+directory that look like a reference image (E.g. a logo, resized
+or saved again in another format).
 
 Usage:
-    img_finder.py <dir>
+    img_finder.py index <dir> [options]
+    img_finder.py <dir> <image> [options]
     img_finder.py (-h | --help)
 
 Options:
     -h --help                       Show the programs help page.
     -s<save> --save=<save>          Indicates the output should be saved.
+    -j <jobs> --jobs=<jobs>         Number of processes hashing the images [default: 1].
+    --index=<index>                 Path of the image index of the directory.
+    --hash=<kind>                   Hash compared, ahash or dhash [default: dhash].
+    --max-distance=<bits>           Bits of the hashes that may differ [default: 10].
+    --no-ignore                     Walk into the files and folders ignored by git too.
+
+Commands:
+    index                           Only build or update the image index.
 
 Arguments:
-    <dir>                           The string representing the
+    <dir>                           The string representing the directory.
+    <image>                         The reference image.
+    <save>                          The JSON file the matches are saved to.
 """
 
+from docopt import docopt
+from typing import NoReturn
+from file_filter import FileFilter
+from ignore_rules import IgnoreRules
+from image_hash import ImageError, hash_image, image_extensions
+from image_index import HASH_KINDS, ImageIndex, default_image_index_path
+import folder_utils
+import json
+import time
+
+
+def main() -> NoReturn:
+    arguments = docopt(__doc__)
+    root_folder = arguments["<dir>"]
+    kind = arguments["--hash"]
+    if kind not in HASH_KINDS:
+        print("Unknown hash {:s}, use one of: {:s}".format(kind, ", ".join(HASH_KINDS)))
+        return
+
+    ignore = None if arguments["--no-ignore"] else IgnoreRules.for_root(root_folder)
+    file_filter = FileFilter(extensions=image_extensions())
+    images = (entry.path for entry in folder_utils.walk_files(root_folder, ignore, file_filter))
+
+    index_path = arguments["--index"] or default_image_index_path(root_folder)
+    with ImageIndex(index_path) as index:
+        # Only the new and changed images are decoded
+        hashed, failed, removed, unchanged = index.update(images, int(arguments["--jobs"]))
+        print("Images hashed: {:d}, not readable: {:d}, removed: {:d}, unchanged: {:d}".format(
+            hashed, failed, removed, unchanged))
+        if arguments["index"]:
+            return
+
+        try:
+            reference = hash_image(arguments["<image>"])
+        except (OSError, ImageError) as e:
+            print("Could not read the reference image: {:s}".format(str(e)))
+            return
+
+        start = time.perf_counter()
+        found = index.query(reference, int(arguments["--max-distance"]), kind)
+        elapsed = time.perf_counter() - start
+        total = len(index.paths(kind))
+
+    for path, distance in found:
+        print("{:s}: {:d} bits apart".format(path, distance))
+    print("{:d} similar images out of {:d} ({:.3f}s)".format(len(found), total, elapsed))
 
-def main():
-    pass
+    if arguments["--save"]:
+        with open(arguments["--save"], "w") as f:
+            json.dump([{"path": p, "distance": d} for p, d in found], f, indent=2)
+        print("Saving results to {:s}".format(arguments["--save"]))
 
 
 if __name__ == "__main__":
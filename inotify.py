@@ -0,0 +1,116 @@
+# inotify.py - Linux inotify through ctypes, to watch the folders of a tree
+from collections import namedtuple
+from typing import List, NoReturn
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+
+# Event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# What changes the files of a folder or the folder itself
+FOLDER_EVENTS = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+                 IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+# Bytes read from the descriptor at once
+READ_SIZE = 65536
+
+# One change, name is empty for the watched folder itself
+Event = namedtuple("Event", ["wd", "mask", "cookie", "name"])
+
+_HEADER = struct.Struct("iIII")
+
+
+def _libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("inotify is not available on this system")
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class Inotify(object):
+    """
+    An inotify instance: folders are watched with add_watch and
+    their changes read back with read_events, so a tree kept in
+    memory can be brought up to date without walking it again.
+    """
+
+    def __init__(self):
+        self._libc = _libc()
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def add_watch(self, path: str, mask: int = FOLDER_EVENTS) -> int:
+        """
+        Watches the path given.
+        :param path: String representing the folder path.
+        :param mask: Events to watch for.
+        :return: The watch descriptor, the same one for a path
+        watched twice.
+        """
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def remove_watch(self, wd: int) -> NoReturn:
+        # The kernel already dropped the watches of deleted folders
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: float = 0) -> List[Event]:
+        """
+        Reads the events waiting, blocking up to the timeout
+        for the first ones.
+        :param timeout: Seconds to wait, or None to wait forever.
+        :return: List of Event(wd, mask, cookie, name).
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = _HEADER.unpack_from(data, pos)
+                pos += _HEADER.size
+                name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+                pos += length
+                events.append(Event(wd, mask, cookie, name))
+        return events
+
+    def close(self) -> NoReturn:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
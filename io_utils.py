@@ -1,9 +1,31 @@
 from types import TracebackType
-from typing import NoReturn, Type, List, NamedTuple
-from collections import namedtuple
+from typing import BinaryIO, Callable, Iterator, NoReturn, Type, List, NamedTuple, Optional, Tuple, Union
+from matcher import ByteEntry, Entry, Hit, PatternMatcher, RegexMatcher, compile_patterns
 import file_utils as fu
+import io
+import mmap
+import os
 import sys
 
+# Files smaller than this are read instead of memory mapped
+MMAP_MIN_SIZE = 65536
+
+# Chunk size used when checking a memory map is ASCII
+ASCII_CHECK_CHUNK = 1048576
+
+# Bytes read from the start of a file to tell if it's binary
+SNIFF_SIZE = 8192
+
+# Files whose prefix has more invalid UTF-8 than this are binary
+BINARY_INVALID_RATIO = 0.1
+
+# Text files bigger than this are searched a block at a time
+# instead of being read whole
+CHUNKED_MIN_SIZE = 32000000
+
+# Characters (or bytes, for binary files) read per block
+CHUNK_SIZE = 4194304
+
 
 def LOG(error: str) -> NoReturn:
     print(error)
@@ -88,16 +110,406 @@ class File(object):
                 sys.exit()
 
 
-# TODO : Perhaps change the match obj to a list
-def find_in_file(path: str, matches: List[str]) -> List[NamedTuple]:
-    lines = None  # Will hold the contents of each line
+def read_text(path: str) -> str:
+    """
+    Reads the whole file given as text, ignoring the
+    bytes that can't be decoded.
+    :param path: String representing the file path.
+    :return: String with the contents of the file.
+    """
     with File(path) as f:
-        # Should be [(line_n, contents)]
-        lines = enumerate(list(f.file_handle))
+        return f.file_handle.read()
+
+
+def iter_text_blocks(path: str, chunk_size: int = CHUNK_SIZE, overlap: int = 0) -> Iterator[Tuple[int, int, str]]:
+    """
+    Reads the file given as text (like read_text) a block at a
+    time, cutting each block after its last new line so no line
+    is split. The partial line at the end of a block is carried
+    over to the next one, up to a block's worth: a longer line is
+    given in pieces, keeping memory bounded by two blocks. Each
+    piece after the first starts with the last overlap characters
+    of the one before, so a match no longer than that is whole in
+    one of them.
+    :param path: String representing the file path.
+    :param chunk_size: Characters read per block.
+    :param overlap: Characters of a cut line given again at the
+    start of the next block.
+    :return: Iterator of (number of the first line, offset of the
+    block in the text, text of the block) tuples. A block starts
+    inside a line when the one before doesn't end with a new line.
+    """
+    with open(path, "r", errors="ignore") as f:
+        carry = []
+        carry_size = 0
+        # Characters of the carry already given in the last block
+        kept = 0
+        line_n = 0
+        offset = 0
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+
+            cut = block.rfind("\n") + 1
+            if cut:
+                text = "".join(carry) + block[:cut]
+                carry = [block[cut:]] if cut < len(block) else []
+                carry_size = len(block) - cut
+                kept = 0
+            elif carry_size + len(block) < chunk_size:
+                carry.append(block)
+                carry_size += len(block)
+                continue
+            else:
+                # The line is too long, it is cut and its end
+                # starts the next block again
+                text = "".join(carry) + block
+                kept = min(overlap, len(text))
+                carry = [text[len(text) - kept:]] if kept else []
+                carry_size = kept
+
+            yield line_n, offset, text
+            line_n += text.count("\n")
+            offset += len(text) - kept
+
+        if carry_size > kept:
+            yield line_n, offset, "".join(carry)
+
+
+def read_spans(path: str, spans: List[Tuple[int, int]]) -> List[str]:
+    """
+    Reads pieces of the text of a file (as read_text gives it),
+    like the lines Hit records point at, a block at a time. A
+    piece over several blocks (a line cut by iter_text_blocks)
+    is joined back.
+    :param path: String representing the file path.
+    :param spans: List of (start, end) offsets in the text, sorted
+    by start.
+    :return: List of the strings, "" for the spans past the end.
+    """
+    pieces = [""] * len(spans)
+    # Parts read so far of the spans not ended yet
+    parts = {}
+    i = 0
+    for _, offset, text in iter_text_blocks(path, CHUNK_SIZE):
+        end = offset + len(text)
+        while i < len(spans) and spans[i][0] < end:
+            parts[i] = []
+            i += 1
+        for j in list(parts):
+            start, stop = spans[j]
+            parts[j].append(text[max(start - offset, 0):stop - offset])
+            if stop <= end:
+                pieces[j] = "".join(parts.pop(j))
+        if i == len(spans) and not parts:
+            break
+
+    for j, found in parts.items():
+        pieces[j] = "".join(found)
+    return pieces
+
+
+def _find_chunked(path: str, matcher: Union[PatternMatcher, RegexMatcher], limit: int = None,
+                  entries: bool = False) -> List[NamedTuple]:
+    """
+    Runs the line search over each block of the file, moving the
+    line numbers and offsets of the hits to the whole file. A line
+    cut over several blocks keeps the first hit of each pattern
+    (the blocks overlap by the longest match, so a hit in the
+    overlap is seen twice), with its start, end and column taken
+    over the whole line. Entry lines are sliced from the blocks,
+    the cut ones are read back at the end. A regex match longer
+    than a block, or looking around it past a cut, isn't seen.
+    """
+    overlap = min(matcher.max_length, CHUNK_SIZE)
+    results = []
+    lines = {}
+    read_back = []
+    # Start of the line the last block ended inside, and the
+    # index in results of the first hit of each pattern on it
+    cut_start = None
+    cut_hits = {}
+    n_lines = 0
+    done = False
+    for line_n, offset, text in iter_text_blocks(path, CHUNK_SIZE, overlap):
+        first_end = offset + (text.find("\n") + 1 or len(text))
+        if cut_start is not None:
+            for i in cut_hits.values():
+                results[i] = results[i]._replace(end=first_end)
+                read_back.append(i)
+                lines.pop(i, None)
+        if done:
+            # Past the limit, only the end of the cut line is looked for
+            if "\n" in text:
+                break
+            continue
+
+        if "\n" in text:
+            open_start = offset + text.rfind("\n") + 1
+            open_hits = {}
+        else:
+            open_start = offset if cut_start is None else cut_start
+            open_hits = cut_hits
+
+        found = matcher.find_line_hits(text, None if limit is None else limit - n_lines + 1)
+        for h in found:
+            continued = cut_start is not None and h.line == 0
+            if continued:
+                if h.pattern in cut_hits:
+                    continue
+                h = Hit(line_n, cut_start, first_end, h.column + offset - cut_start, h.pattern)
+            else:
+                h = h._replace(line=h.line + line_n, start=h.start + offset, end=h.end + offset)
+            if not results or h.line != results[-1].line:
+                if n_lines == limit:
+                    done = True
+                    break
+                n_lines += 1
+
+            if continued:
+                read_back.append(len(results))
+            elif entries:
+                lines[len(results)] = text[h.start - offset:h.end - offset]
+            if h.start == open_start and not text.endswith("\n"):
+                open_hits.setdefault(h.pattern, len(results))
+            results.append(h)
+
+        cut_start = None if text.endswith("\n") else open_start
+        cut_hits = open_hits
+        if done and not cut_hits:
+            break
+
+    # The hits of a cut line come in the order they were found
+    order = sorted(range(len(results)), key=lambda i: (results[i].line, results[i].pattern))
+    if not entries:
+        return [results[i] for i in order]
+    if read_back:
+        read_back = sorted(set(read_back), key=lambda i: results[i].start)
+        spans = [(results[i].start, results[i].end) for i in read_back]
+        lines.update(zip(read_back, read_spans(path, spans)))
+    return [Entry(results[i].line, lines[i]) for i in order]
+
+
+def _is_big(path: str) -> bool:
+    try:
+        return os.path.getsize(path) >= CHUNKED_MIN_SIZE
+    except OSError:
+        return False
+
+
+def decode_text(data: bytes) -> str:
+    """
+    Decodes the contents of a file the same way read_text
+    reads it (default encoding, undecodable bytes ignored and
+    universal new lines).
+    :param data: Bytes of the whole file.
+    :return: String with the contents of the file.
+    """
+    return io.TextIOWrapper(io.BytesIO(data), errors="ignore").read()
+
+
+def find_in_file(path: str, matches: Union[List[str], PatternMatcher], limit: int = None) -> List[NamedTuple]:
+    """
+    Finds the lines of the file that contain any of the matches.
+    ASCII files are searched as raw bytes (memory mapped if they
+    are big), decoding only the lines that hold a hit. Anything
+    else is read as text, a block at a time past CHUNKED_MIN_SIZE.
+    :param path: String representing the file path.
+    :param matches: List of strings to look for, or the
+    PatternMatcher already compiled for them.
+    :param limit: Stop after this many matching lines (the rest
+    of a memory mapped file is then never read), or None.
+    :return: List of Entry(line, s) with one entry for each line
+    and match found in it.
+    """
+    matcher = compile_patterns(matches)
+    if not matcher.has_empty:
+        results = _find_in_ascii_file(path, lambda data: matcher.find_lines_ascii(data, limit))
+        if results is not None:
+            return results
+
+    if _is_big(path):
+        return _find_chunked(path, matcher, limit, entries=True)
+    return matcher.find_lines(read_text(path), limit)
+
+
+def find_hits_in_file(path: str, matches: Union[List[str], PatternMatcher], limit: int = None) -> List[NamedTuple]:
+    """
+    Same search as find_in_file, but giving compact Hit records
+    whose start/end point at the line in the text of the file
+    (as read by read_text), so the lines aren't kept.
+    :param path: String representing the file path.
+    :param matches: List of strings to look for, or the
+    PatternMatcher already compiled for them.
+    :param limit: Stop after this many matching lines, or None.
+    :return: List of Hit(line, start, end, column, pattern).
+    """
+    matcher = compile_patterns(matches)
+    if not matcher.has_empty:
+        results = _find_in_ascii_file(path, lambda data: matcher.find_line_hits(data, limit))
+        if results is not None:
+            return results
+
+    if _is_big(path):
+        return _find_chunked(path, matcher, limit)
+    return matcher.find_line_hits(read_text(path), limit)
+
+
+def find_in_data(data: bytes, matches: Union[List[str], PatternMatcher], limit: int = None) -> List[NamedTuple]:
+    """
+    Same search as find_in_file, over the contents of a file
+    that were already read.
+    :param data: Bytes of the whole file.
+    :param matches: List of strings to look for, or the
+    PatternMatcher already compiled for them.
+    :param limit: Stop after this many matching lines, or None.
+    :return: List of Entry(line, s).
+    """
+    matcher = compile_patterns(matches)
+    if not matcher.has_empty and _is_plain_ascii(data):
+        return matcher.find_lines_ascii(data, limit) if data else []
+    return matcher.find_lines(decode_text(data), limit)
+
+
+def find_hits_in_data(data: bytes, matches: Union[List[str], PatternMatcher], limit: int = None) -> List[NamedTuple]:
+    """
+    Same search as find_hits_in_file, over the contents of a
+    file that were already read.
+    :param data: Bytes of the whole file.
+    :param matches: List of strings to look for, or the
+    PatternMatcher already compiled for them.
+    :param limit: Stop after this many matching lines, or None.
+    :return: List of Hit(line, start, end, column, pattern).
+    """
+    matcher = compile_patterns(matches)
+    if not matcher.has_empty and _is_plain_ascii(data):
+        return matcher.find_line_hits(data, limit) if data else []
+    return matcher.find_line_hits(decode_text(data), limit)
+
+
+def _find_in_ascii_file(path: str, search: Callable[[Union[bytes, mmap.mmap]], List[NamedTuple]]) -> Optional[List[NamedTuple]]:
+    """
+    Runs the bytes search over the file, if it's ASCII and
+    has no '\\r' (which text mode would turn into new lines).
+    :return: The results, or None if the file is not eligible.
+    """
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return []
+            if size < MMAP_MIN_SIZE:
+                data = f.read()
+                return search(data) if _is_plain_ascii(data) else None
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return search(data) if _is_plain_ascii(data) else None
+    except (OSError, ValueError):
+        return None
+
+
+def _is_plain_ascii(data: Union[bytes, mmap.mmap]) -> bool:
+    if data.find(b"\r") != -1:
+        return False
+    if isinstance(data, bytes):
+        return data.isascii()
+    return all(data[i:i + ASCII_CHECK_CHUNK].isascii() for i in range(0, len(data), ASCII_CHECK_CHUNK))
+
+
+def is_binary_data(data: bytes) -> bool:
+    """
+    Guesses whether the data given (the start of a file) is
+    binary: it is if it holds a NUL byte or too much of it is
+    not valid UTF-8.
+    :param data: Bytes from the start of the file.
+    :return: True if the data looks binary, False otherwise.
+    """
+    if not data:
+        return False
+    if b"\0" in data:
+        return True
+
+    try:
+        data.decode("utf-8")
+        return False
+    except UnicodeDecodeError as e:
+        # A character cut at the end of the prefix is not invalid
+        if e.reason == "unexpected end of data":
+            return is_binary_data(data[:e.start])
+
+    invalid = len(data) - len(data.decode("utf-8", errors="ignore").encode("utf-8"))
+    return invalid / len(data) > BINARY_INVALID_RATIO
+
+
+def is_binary_file(path: str) -> bool:
+    """
+    Guesses whether the file given is binary from its first
+    SNIFF_SIZE bytes.
+    :param path: String representing the file path.
+    :return: True if the file looks binary, False otherwise.
+    """
+    with open(path, "rb") as f:
+        return is_binary_data(f.read(SNIFF_SIZE))
+
+
+def find_offsets_in_file(path: str, matches: Union[List[str], PatternMatcher]) -> List[NamedTuple]:
+    """
+    Finds every occurrence of the matches in the raw bytes of
+    the file, for files that are not text.
+    :param path: String representing the file path.
+    :param matches: List of strings to look for, or the
+    PatternMatcher already compiled for them.
+    :return: List of ByteEntry(offset, pattern).
+    """
+    matcher = compile_patterns(matches)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_MIN_SIZE:
+            return matcher.find_offsets(f.read())
+        if size >= CHUNKED_MIN_SIZE and isinstance(matcher, PatternMatcher) and matcher.patterns:
+            return _find_offsets_chunked(f, matcher)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return matcher.find_offsets(data)
+
+
+def _find_offsets_chunked(f: BinaryIO, matcher: PatternMatcher, chunk_size: int = CHUNK_SIZE) -> List[NamedTuple]:
+    """
+    Searches the raw bytes a block at a time, keeping the last
+    (longest pattern - 1) bytes of each block in front of the next
+    one, so the occurrences across two blocks are found too.
+    """
+    lengths = {p: len(p.encode("utf-8")) for p in matcher.patterns}
+    overlap = max(lengths.values()) - 1
+    results = []
+    tail = b""
+    base = 0
+    while True:
+        block = f.read(chunk_size)
+        if not block:
+            break
+
+        data = tail + block
+        # The ones inside the carried bytes came with the last block
+        results.extend(ByteEntry(base + e.offset, e.pattern) for e in matcher.find_offsets(data)
+                       if e.offset + lengths[e.pattern] > len(tail))
+        keep = min(overlap, len(data))
+        tail = data[len(data) - keep:]
+        base += len(data) - keep
+
+    results.sort(key=lambda e: e.offset)
+    return results
+
 
-    # Run the string checking in each of the lines
-    Entry = namedtuple("Entry", ["line", "s"])
-    return [Entry(n, s) for n, s in lines for match in matches if match in s]
+def find_matches_in_file(path: str, matches: Union[List[str], PatternMatcher]) -> List[NamedTuple]:
+    """
+    Finds every occurrence of the matches in the file.
+    :param path: String representing the file path.
+    :param matches: List of strings to look for, or the
+    PatternMatcher already compiled for them.
+    :return: List of Match(line, column, pattern, s).
+    """
+    return compile_patterns(matches).find_all(read_text(path))
 
 
 def main() -> NoReturn:
@@ -0,0 +1,149 @@
+# match_store.py - Compact storage of the search results
+from array import array
+from typing import Dict, Iterator, List, NamedTuple, NoReturn, Tuple
+import io_utils
+
+
+class StoredEntry(object):
+    """
+    Entry(line, s) like view of one result of a MatchStore.
+    The line text is only read from the file when asked for.
+    """
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store: "MatchStore", i: int):
+        self._store = store
+        self._i = i
+
+    @property
+    def line(self) -> int:
+        return self._store.line[self._i]
+
+    @property
+    def column(self) -> int:
+        return self._store.column[self._i]
+
+    @property
+    def pattern(self) -> str:
+        return self._store.patterns[self._store.pattern[self._i]]
+
+    @property
+    def path(self) -> str:
+        return self._store.paths[self._store.file_id[self._i]]
+
+    @property
+    def s(self) -> str:
+        return self._store.line_text(self._i)
+
+    def _asdict(self) -> Dict[str, object]:
+        return {"line": self.line, "s": self.s}
+
+    # So it compares and unpacks like Entry(line, s)
+    def __iter__(self):
+        return iter((self.line, self.s))
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return "Entry(line={:d}, s={!r})".format(self.line, self.s)
+
+
+class MatchStore(object):
+    """
+    Results of a search kept as parallel arrays of (file id,
+    line, column, pattern id) plus the offsets of each line in
+    the text of its file, instead of a namedtuple and a copy of
+    the line per match. The results of a file are added at once
+    so they sit next to each other.
+    """
+    __slots__ = ("patterns", "paths", "file_id", "line", "column", "pattern",
+                 "start", "end", "_first", "_text_file", "_text")
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = list(patterns)
+        self.paths = []
+        self.file_id = array("I")
+        self.line = array("I")
+        self.column = array("I")
+        self.pattern = array("I")
+        self.start = array("Q")
+        self.end = array("Q")
+        # Index of the first result of each file
+        self._first = array("Q")
+        self._text_file = None
+        self._text = None
+
+    def add(self, path: str, hits: List[NamedTuple]) -> NoReturn:
+        """
+        Adds the results of one file.
+        :param path: String representing the file path.
+        :param hits: List of Hit(line, start, end, column, pattern)
+        from find_hits_in_file.
+        :return: void
+        """
+        file_id = len(self.paths)
+        self.paths.append(path)
+        self._first.append(len(self.line))
+        for h in hits:
+            self.file_id.append(file_id)
+            self.line.append(h.line)
+            self.start.append(h.start)
+            self.end.append(h.end)
+            self.column.append(h.column)
+            self.pattern.append(h.pattern)
+
+    def line_text(self, i: int) -> str:
+        """
+        Reads the line of the result given from its file. The
+        lines of the last file read are kept, so reading the
+        results file by file reads each file once.
+        :param i: Index of the result.
+        :return: String representing the line.
+        """
+        file_id = self.file_id[i]
+        if file_id != self._text_file:
+            self._text = self._read_lines(file_id)
+            self._text_file = file_id
+        return self._text.get(i, "")
+
+    def _read_lines(self, file_id: int) -> Dict[int, str]:
+        # The file is read a block at a time and only the lines
+        # of its results are kept, so big files aren't held whole
+        first, last = self._range(file_id)
+        spans = [(self.start[i], self.end[i]) for i in range(first, last)]
+        return dict(zip(range(first, last), io_utils.read_spans(self.paths[file_id], spans)))
+
+    def _range(self, file_id: int) -> Tuple[int, int]:
+        first = self._first[file_id]
+        last = self._first[file_id + 1] if file_id + 1 < len(self._first) else len(self)
+        return first, last
+
+    def __len__(self) -> int:
+        return len(self.line)
+
+    def __iter__(self) -> Iterator[StoredEntry]:
+        for i in range(len(self)):
+            yield StoredEntry(self, i)
+
+    def entries(self, file_id: int) -> List[StoredEntry]:
+        """
+        Gets the results of the file given.
+        :param file_id: Position of the file in the paths list.
+        :return: List of StoredEntry views.
+        """
+        first, last = self._range(file_id)
+        return [StoredEntry(self, i) for i in range(first, last)]
+
+    def by_file(self, sort: bool = False) -> Iterator[Tuple[str, List[StoredEntry]]]:
+        """
+        Goes through the results grouped by file.
+        :param sort: Whether to go through the files by path
+        instead of the order they were added in.
+        :return: Iterator of (path, results) tuples.
+        """
+        ids = range(len(self.paths))
+        if sort:
+            ids = sorted(ids, key=self.paths.__getitem__)
+        for file_id in ids:
+            yield self.paths[file_id], self.entries(file_id)
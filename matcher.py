@@ -0,0 +1,581 @@
+# matcher.py - Multi pattern matching, compiled once per run
+from __future__ import annotations
+from collections import namedtuple
+from functools import lru_cache
+import itertools
+from typing import Dict, Iterator, List, NamedTuple, Pattern, Sequence, Tuple, Union
+import mmap
+import re
+
+try:
+    from re import _parser as _sre_parse
+except ImportError:
+    import sre_parse as _sre_parse
+
+# Results of the line based search, one per (line, pattern)
+Entry = namedtuple("Entry", ["line", "s"])
+
+# Results of the full search, one per occurrence of a pattern
+Match = namedtuple("Match", ["line", "column", "pattern", "s"])
+
+# Results of the search of binary files, one per occurrence
+ByteEntry = namedtuple("ByteEntry", ["offset", "pattern"])
+
+# Compact form of Entry: where the line is in the text (so it can
+# be read back later), the column of the first occurrence and the
+# position of the pattern in the list given
+Hit = namedtuple("Hit", ["line", "start", "end", "column", "pattern"])
+
+# Marks the end of a pattern in the prefilter trie
+_END = ""
+
+# Patterns using these can't be joined into one regex run over
+# the whole text: back references and whole text anchors
+_NOT_JOINABLE = re.compile(r"\\[1-9AZ]|\(\?P=|\(\?\(")
+
+
+def _build_trie(patterns: Sequence[str]) -> Dict:
+    trie = {}
+    for p in patterns:
+        node = trie
+        for ch in p:
+            node = node.setdefault(ch, {})
+        node[_END] = True
+    return trie
+
+
+def _trie_regex(node: Dict) -> str:
+    """
+    Turns the trie given into a regex that matches where
+    any of its patterns starts. Patterns that have a shorter
+    pattern as a prefix are dropped, the shorter one is enough.
+    :param node: Dictionary of char -> child node.
+    :return: String representing the regex.
+    """
+    literal = []
+    while _END not in node and len(node) == 1:
+        (ch, node), = node.items()
+        literal.append(re.escape(ch))
+
+    if _END in node:
+        return "".join(literal)
+
+    alternatives = [re.escape(ch) + _trie_regex(child) for ch, child in sorted(node.items())]
+    return "".join(literal) + "(?:" + "|".join(alternatives) + ")"
+
+
+class PatternMatcher(object):
+    """
+    Aho-Corasick automaton over a list of patterns. The text is
+    first scanned (in C) by a trie shaped regex to find the lines
+    that may hold a pattern, and only those lines are walked
+    through the automaton, so the cost of a file does not grow
+    with the number of patterns.
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = list(patterns)
+
+        # Duplicates still produce one entry each, like
+        # the original `match in s` loop did
+        self._unique = []
+        self._positions = []
+        ids = {}
+        for i, p in enumerate(self.patterns):
+            if p not in ids:
+                ids[p] = len(self._unique)
+                self._unique.append(p)
+                self._positions.append([])
+            self._positions[ids[p]].append(i)
+
+        # The empty pattern is in every line
+        self._empty = ids.get("")
+        self.has_empty = self._empty is not None
+        # Longest text a hit can span
+        self.max_length = max(map(len, self._unique), default=0)
+        self._build_automaton()
+        self._build_prefilter()
+
+    def _build_automaton(self) -> None:
+        goto = [{}]
+        out = [[]]
+        for pid, p in enumerate(self._unique):
+            if not p:
+                continue
+            state = 0
+            for ch in p:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append(pid)
+
+        # Breadth first so the fail state of a node is
+        # always done before its children
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+                queue.append(nxt)
+
+        self._goto = goto
+        self._fail = fail
+        self._out = [tuple(o) for o in out]
+        self._lengths = [len(p) for p in self._unique]
+
+    def _build_prefilter(self) -> None:
+        trie = {}
+        for p in self._unique:
+            node = trie
+            for ch in p:
+                node = node.setdefault(ch, {})
+            node[_END] = True
+
+        self._prefilter = re.compile(_trie_regex(trie)) if trie else None
+
+        # Same regex over the UTF-8 bytes of the patterns, read
+        # as latin-1 so each byte is one char of the trie
+        trie = {}
+        for p in self._unique:
+            node = trie
+            for ch in p.encode("utf-8").decode("latin-1"):
+                node = node.setdefault(ch, {})
+            node[_END] = True
+
+        self._bytes_prefilter = re.compile(_trie_regex(trie).encode("latin-1")) if trie else None
+
+        # Encoded patterns by first byte, to check at each hit
+        self._by_first_byte = {}
+        for p in self._unique:
+            encoded = p.encode("utf-8")
+            if encoded:
+                self._by_first_byte.setdefault(encoded[0], []).append((encoded, p))
+
+    def _scan_ids(self, text: str) -> Iterator[Tuple[int, int]]:
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        lengths = self._lengths
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for pid in out[state]:
+                yield i - lengths[pid] + 1, pid
+
+    def scan(self, text: str) -> Iterator[Tuple[int, str]]:
+        """
+        Walks the text given through the automaton, yielding every
+        occurrence of every (non empty) pattern, overlaps included.
+        :param text: String to scan.
+        :return: Iterator of (column, pattern) tuples, in order of
+        where each occurrence ends.
+        """
+        for col, pid in self._scan_ids(text):
+            yield col, self._unique[pid]
+
+    def _line_entries(self, n: int, s: str) -> List[NamedTuple]:
+        found = {pid for _, pid in self._scan_ids(s)}
+        if self._empty is not None:
+            found.add(self._empty)
+        count = sum(len(self._positions[pid]) for pid in found)
+        return [Entry(n, s) for _ in range(count)]
+
+    def _line_hits(self, n: int, start: int, s: str) -> List[NamedTuple]:
+        first = {}
+        for col, pid in self._scan_ids(s):
+            if col < first.get(pid, col + 1):
+                first[pid] = col
+        if self._empty is not None:
+            first[self._empty] = 0
+        found = sorted((i, first[pid]) for pid in first for i in self._positions[pid])
+        return [Hit(n, start, start + len(s), col, i) for i, col in found]
+
+    def find_lines(self, text: str, limit: int = None) -> List[NamedTuple]:
+        """
+        Line based search, with the same results as checking
+        `pattern in line` for every line and every pattern.
+        :param text: String representing the text to search.
+        :param limit: Stop after this many matching lines, or None.
+        :return: List of Entry(line, s), one for each line and
+        pattern found in it, ordered by line.
+        """
+        if self._empty is not None:
+            lines = _all_lines(text)
+        else:
+            lines = _candidate_lines(text, self._prefilter)
+
+        # Every line given holds a pattern, so the lines after
+        # the limit are never looked for
+        results = []
+        for n, _, s in itertools.islice(lines, limit):
+            results.extend(self._line_entries(n, s))
+
+        return results
+
+    def find_lines_ascii(self, data: Union[bytes, mmap.mmap], limit: int = None) -> List[NamedTuple]:
+        """
+        Same as find_lines, but over the raw bytes of a file, which
+        are only decoded around the hits. The data must be ASCII
+        without any '\\r', so it decodes to the same text whatever
+        the encoding used to open the file, and the patterns can't
+        contain an empty string.
+        :param data: Bytes or memory map of the file contents.
+        :param limit: Stop after this many matching lines, or None.
+        :return: List of Entry(line, s), one for each line and
+        pattern found in it, ordered by line.
+        """
+        results = []
+        for n, _, line in itertools.islice(_candidate_lines(data, self._bytes_prefilter), limit):
+            results.extend(self._line_entries(n, line.decode("ascii")))
+
+        return results
+
+    def find_line_hits(self, text: Union[str, bytes, mmap.mmap], limit: int = None) -> List[NamedTuple]:
+        """
+        Same search as find_lines, but giving compact Hit records
+        that point back into the text instead of copying the lines.
+        Bytes must follow the rules of find_lines_ascii.
+        :param text: String, or bytes/memory map of an ASCII file.
+        :param limit: Stop after this many matching lines, or None.
+        :return: List of Hit(line, start, end, column, pattern),
+        one for each line and pattern found in it, ordered by line
+        and then by the position of the pattern in the list given.
+        """
+        if isinstance(text, str):
+            lines = _all_lines(text) if self._empty is not None else _candidate_lines(text, self._prefilter)
+        else:
+            lines = ((n, start, line.decode("ascii")) for n, start, line
+                     in _candidate_lines(text, self._bytes_prefilter))
+
+        results = []
+        for n, start, s in itertools.islice(lines, limit):
+            results.extend(self._line_hits(n, start, s))
+
+        return results
+
+    def find_offsets(self, data: Union[bytes, mmap.mmap]) -> List[NamedTuple]:
+        """
+        Finds every occurrence of the UTF-8 encoded patterns in
+        the raw data given, for files that are not text.
+        Empty patterns are never reported.
+        :param data: Bytes or memory map of the file contents.
+        :return: List of ByteEntry(offset, pattern), by offset.
+        """
+        results = []
+        if self._bytes_prefilter is None:
+            return results
+
+        search = self._bytes_prefilter.search
+        m = search(data)
+        while m:
+            pos = m.start()
+            results.extend(ByteEntry(pos, p) for encoded, p in self._by_first_byte[data[pos]]
+                           if data[pos:pos + len(encoded)] == encoded)
+            m = search(data, pos + 1)
+
+        return results
+
+    def find_all(self, text: str) -> List[NamedTuple]:
+        """
+        Finds every occurrence of the patterns in the text given.
+        Empty patterns are never reported.
+        :param text: String representing the text to search.
+        :return: List of Match(line, column, pattern, s), where the
+        column is the 0 based offset of the pattern in the line.
+        """
+        results = []
+        for n, _, s in _candidate_lines(text, self._prefilter):
+            hits = sorted(self._scan_ids(s))
+            results.extend(Match(n, col, self._unique[pid], s) for col, pid in hits)
+
+        return results
+
+
+def required_literal(pattern: str) -> str:
+    """
+    Finds the longest run of plain characters that every match
+    of the regex given must contain, looking at the top level of
+    the regex only (E.g. "Server" for "\\bServer\\d+").
+    :param pattern: String representing the regex.
+    :return: The literal, or "" if there is none to rely on.
+    """
+    parsed = _sre_parse.parse(pattern)
+    if parsed.state.flags & re.IGNORECASE:
+        return ""
+
+    best = ""
+    run = []
+
+    def walk(items):
+        nonlocal best, run
+        for op, arg in items:
+            if op == _sre_parse.LITERAL:
+                run.append(chr(arg))
+            elif op == _sre_parse.AT:
+                # Zero width, the characters around it are still adjacent
+                continue
+            elif op == _sre_parse.SUBPATTERN and not arg[1] and not arg[2]:
+                walk(arg[3])
+            else:
+                if len(run) > len(best):
+                    best = "".join(run)
+                run = []
+
+    walk(parsed)
+    if len(run) > len(best):
+        best = "".join(run)
+    return best
+
+
+class RegexMatcher(object):
+    """
+    Line based search of regexes (or of literals matched as whole
+    words or ignoring case), with the same results and interface
+    as PatternMatcher. The lines that may match are found first,
+    by a trie of the literal every pattern must contain when there
+    is one, or else by all the patterns joined in one regex, and
+    only those lines are checked against each pattern.
+    """
+
+    def __init__(self, patterns: Sequence[str], regex: bool = False, ignore_case: bool = False, word: bool = False):
+        self.patterns = list(patterns)
+        self.mode = {"regex": regex, "ignore_case": ignore_case, "word": word}
+        self.ignore_case = ignore_case
+
+        sources = [p if regex else re.escape(p) for p in self.patterns]
+        self.literals = [required_literal(p) if regex else p for p in self.patterns]
+        if word:
+            # Like grep -w, so patterns starting or ending with
+            # punctuation still work
+            sources = [r"(?<!\w)(?:" + p + r")(?!\w)" for p in sources]
+
+        flags = re.IGNORECASE if ignore_case else 0
+        self._regexes = [re.compile(p, flags) for p in sources]
+        self.has_empty = any(r.search("") for r in self._regexes)
+        # Longest text a match can span, huge for unbounded repeats
+        self.max_length = max((_sre_parse.parse(p, flags).getwidth()[1] for p in sources), default=0)
+        self._prefilter, self._bytes_prefilter = self._build_prefilters(sources, flags)
+
+        # Bytes versions for the search of binary files, where
+        # a pattern can't be one (E.g. \w over non ASCII)
+        self._bytes_regexes = []
+        for i, p in enumerate(sources):
+            try:
+                self._bytes_regexes.append((re.compile(p.encode("utf-8"), flags), self.patterns[i]))
+            except re.error:
+                pass
+
+    def _build_prefilters(self, sources: List[str], flags: int) -> Tuple[Pattern, Pattern]:
+        if self.has_empty:
+            return None, None
+
+        if all(self.literals):
+            trie = _trie_regex(_build_trie(self.literals))
+            prefilter = re.compile(trie, flags)
+
+            # Unicode case folding maps some non ASCII letters to
+            # ASCII ones, which the bytes regex can't do
+            bytes_prefilter = None
+            if not self.ignore_case or all(lit.isascii() for lit in self.literals):
+                latin = _trie_regex(_build_trie(lit.encode("utf-8").decode("latin-1") for lit in self.literals))
+                bytes_prefilter = re.compile(latin.encode("latin-1"), flags)
+            return prefilter, bytes_prefilter
+
+        if any(_NOT_JOINABLE.search(p) for p in sources):
+            return None, None
+        joined = "|".join("(?:" + p + ")" for p in sources)
+        try:
+            prefilter = re.compile(joined, flags | re.MULTILINE)
+        except re.error:
+            return None, None
+        bytes_prefilter = None
+        if joined.isascii():
+            bytes_prefilter = re.compile(joined.encode("ascii"), flags | re.MULTILINE)
+        return prefilter, bytes_prefilter
+
+    def _lines(self, text: Union[str, bytes, mmap.mmap]) -> Iterator[Tuple[int, int, str]]:
+        if not isinstance(text, str):
+            # ASCII data decodes to the same offsets
+            if self._bytes_prefilter is None:
+                text = text[:].decode("ascii")
+            else:
+                return ((n, start, line.decode("ascii")) for n, start, line
+                        in _candidate_lines(text, self._bytes_prefilter))
+
+        if self._prefilter is None:
+            return _all_lines(text)
+        return _candidate_lines(text, self._prefilter)
+
+    def find_lines(self, text: str, limit: int = None) -> List[NamedTuple]:
+        """
+        Same as PatternMatcher.find_lines, with a line holding a
+        pattern when the pattern's regex is found in it.
+        :param text: String representing the text to search.
+        :param limit: Stop after this many matching lines, or None.
+        :return: List of Entry(line, s), one for each line and
+        pattern found in it, ordered by line.
+        """
+        results = []
+        n_lines = 0
+        for n, _, s in self._lines(text):
+            found = [Entry(n, s) for r in self._regexes if r.search(s)]
+            if found:
+                results.extend(found)
+                n_lines += 1
+                if n_lines == limit:
+                    break
+
+        return results
+
+    def find_lines_ascii(self, data: Union[bytes, mmap.mmap], limit: int = None) -> List[NamedTuple]:
+        """
+        Same as find_lines over the bytes of an ASCII file without
+        '\\r', like PatternMatcher.find_lines_ascii.
+        :param data: Bytes or memory map of the file contents.
+        :param limit: Stop after this many matching lines, or None.
+        :return: List of Entry(line, s).
+        """
+        return self.find_lines(data, limit)
+
+    def find_line_hits(self, text: Union[str, bytes, mmap.mmap], limit: int = None) -> List[NamedTuple]:
+        """
+        Same as PatternMatcher.find_line_hits.
+        :param text: String, or bytes/memory map of an ASCII file.
+        :param limit: Stop after this many matching lines, or None.
+        :return: List of Hit(line, start, end, column, pattern).
+        """
+        results = []
+        n_lines = 0
+        for n, start, s in self._lines(text):
+            n_found = len(results)
+            for i, r in enumerate(self._regexes):
+                m = r.search(s)
+                if m:
+                    results.append(Hit(n, start, start + len(s), m.start(), i))
+            if len(results) > n_found:
+                n_lines += 1
+                if n_lines == limit:
+                    break
+
+        return results
+
+    def find_offsets(self, data: Union[bytes, mmap.mmap]) -> List[NamedTuple]:
+        """
+        Finds the matches of the patterns in the raw data given,
+        for files that are not text. Empty matches are skipped.
+        :param data: Bytes or memory map of the file contents.
+        :return: List of ByteEntry(offset, pattern), by offset.
+        """
+        results = []
+        for regex, p in self._bytes_regexes:
+            results.extend(ByteEntry(m.start(), p) for m in regex.finditer(data) if m.end() > m.start())
+
+        results.sort(key=lambda e: e.offset)
+        return results
+
+    def find_all(self, text: str) -> List[NamedTuple]:
+        """
+        Finds every (non overlapping, non empty) match of the
+        patterns in the text given.
+        :param text: String representing the text to search.
+        :return: List of Match(line, column, pattern, s).
+        """
+        results = []
+        for n, _, s in self._lines(text):
+            found = sorted((m.start(), i) for i, r in enumerate(self._regexes)
+                           for m in r.finditer(s) if m.end() > m.start())
+            results.extend(Match(n, col, self.patterns[i], s) for col, i in found)
+
+        return results
+
+
+def _candidate_lines(text: Union[str, bytes, mmap.mmap], prefilter: Pattern) -> Iterator[Tuple[int, int, Union[str, bytes]]]:
+    """
+    Yields the (line number, start offset, line) of the lines
+    where the prefilter found the start of a pattern. Line
+    numbers are only counted up to each hit.
+    """
+    if prefilter is None:
+        return
+
+    newline = "\n" if isinstance(text, str) else b"\n"
+    search = prefilter.search
+    pos = 0
+    line_n = 0
+    counted_to = 0
+    while True:
+        m = search(text, pos)
+        if not m:
+            return
+
+        start = text.rfind(newline, 0, m.start()) + 1
+        end = text.find(newline, m.start())
+        end = len(text) if end == -1 else end + 1
+
+        # mmap has no count, so that one gets sliced
+        if isinstance(text, mmap.mmap):
+            line_n += text[counted_to:start].count(newline)
+        else:
+            line_n += text.count(newline, counted_to, start)
+        counted_to = start
+        yield line_n, start, text[start:end]
+
+        if end >= len(text):
+            return
+        pos = end
+
+
+def _split_on_newline(text: str) -> List[str]:
+    """
+    Splits the text keeping the line ends, only on '\\n' like
+    iterating a text file does (unlike str.splitlines).
+    """
+    lines = text.split("\n")
+    last = lines.pop()
+    result = [line + "\n" for line in lines]
+    if last:
+        result.append(last)
+    return result
+
+
+def _all_lines(text: str) -> Iterator[Tuple[int, int, str]]:
+    start = 0
+    for n, line in enumerate(_split_on_newline(text)):
+        yield n, start, line
+        start += len(line)
+
+
+@lru_cache(maxsize=8)
+def _compile(patterns: Tuple[str], regex: bool, ignore_case: bool, word: bool) -> Union[PatternMatcher, RegexMatcher]:
+    if regex or ignore_case or word:
+        return RegexMatcher(patterns, regex, ignore_case, word)
+    return PatternMatcher(patterns)
+
+
+def compile_patterns(patterns: Sequence[str], regex: bool = False, ignore_case: bool = False,
+                     word: bool = False) -> Union[PatternMatcher, RegexMatcher]:
+    """
+    Returns the matcher for the patterns given, reusing the
+    one built before if the same patterns were already compiled.
+    Plain substrings get the PatternMatcher, the other modes the
+    RegexMatcher.
+    :param patterns: Sequence of strings to look for, or a
+    matcher already compiled (given back as it is).
+    :param regex: Whether the patterns are regexes.
+    :param ignore_case: Whether to match ignoring case.
+    :param word: Whether to only match whole words.
+    :return: PatternMatcher or RegexMatcher object.
+    """
+    if isinstance(patterns, (PatternMatcher, RegexMatcher)):
+        return patterns
+    return _compile(tuple(patterns), regex, ignore_case, word)
@@ -0,0 +1,120 @@
+# output_writers.py - Writers for the search results
+from typing import Iterator, List, NamedTuple, NoReturn, Tuple
+import heapq
+import itertools
+import json
+import os
+from match_store import MatchStore
+from matcher import Hit
+
+# Size of the write buffer of the streaming writers
+BUFFER_SIZE = 65536
+
+FORMATS = ["json", "ndjson", "ndjson-files"]
+
+_EXTENSIONS = {"json": "json", "ndjson": "ndjson", "ndjson-files": "ndjson"}
+
+
+def output_path(save: str, out_format: str, name: str = "output") -> str:
+    """
+    Gets the file the results are written to. The save path
+    may be a directory, in which case the output file is put
+    in it, or the file path itself.
+    :param save: The path given with --save, or None.
+    :param out_format: One of FORMATS.
+    :param name: Name of the output file in the directory.
+    :return: String representing the output file path.
+    """
+    name = "{:s}.{:s}".format(name, _EXTENSIONS[out_format])
+    if not save:
+        return name
+    if os.path.isdir(save):
+        return os.path.join(save, name)
+    return save
+
+
+class JsonWriter(object):
+    """
+    Writes all the results as one JSON document mapping each
+    path to its list of results. The results are kept until the
+    writer is closed, in a MatchStore when they are Hit records.
+    """
+
+    def __init__(self, path: str, sort: bool = False, store: MatchStore = None):
+        self.path = path
+        self.sort = sort
+        self.store = store
+        self._occurrences = {}
+
+    def write(self, file: str, results: List[NamedTuple]) -> NoReturn:
+        if self.store is not None and results and isinstance(results[0], Hit):
+            self.store.add(file, results)
+        else:
+            self._occurrences[file] = results
+
+    def _items(self) -> Iterator[Tuple[str, List[NamedTuple]]]:
+        stored = self.store.by_file(self.sort) if self.store is not None else iter(())
+        others = sorted(self._occurrences.items()) if self.sort else self._occurrences.items()
+        if not self.sort:
+            return itertools.chain(stored, others)
+        return heapq.merge(stored, others, key=lambda item: item[0])
+
+    def close(self) -> NoReturn:
+        # Each file is dumped on its own so there is never a
+        # second copy of all the results in memory
+        with open(self.path, "w", buffering=BUFFER_SIZE) as f:
+            f.write("{")
+            for i, (file, results) in enumerate(self._items()):
+                if i:
+                    f.write(", ")
+                f.write(json.dumps(file))
+                f.write(": ")
+                f.write(json.dumps([r._asdict() for r in results]))
+            f.write("}")
+
+
+class NdjsonWriter(object):
+    """
+    Writes one JSON record per line as soon as the results of
+    a file are given: one per match ({"path": ..., "line": ...,
+    "s": ...}), or one per file ({"path": ..., "matches": [...]}).
+    Only the write buffer is held in memory.
+    """
+
+    def __init__(self, path: str, per_file: bool = False):
+        self.path = path
+        self.per_file = per_file
+        self._file = open(path, "w", buffering=BUFFER_SIZE)
+
+    def write(self, file: str, results: List[NamedTuple]) -> NoReturn:
+        if self.per_file:
+            self._file.write(json.dumps({"path": file, "matches": [r._asdict() for r in results]}))
+            self._file.write("\n")
+            return
+
+        for r in results:
+            record = {"path": file}
+            record.update(r._asdict())
+            self._file.write(json.dumps(record))
+            self._file.write("\n")
+
+    def close(self) -> NoReturn:
+        self._file.close()
+
+
+def open_writer(path: str, out_format: str, sort: bool = False, patterns: List[str] = None):
+    """
+    Creates the writer for the format given.
+    :param path: String representing the output file path.
+    :param out_format: One of FORMATS.
+    :param sort: Whether the JSON document should be sorted by
+    path (the streaming formats are written as results come).
+    :param patterns: Patterns searched for, to keep the Hit
+    records given to the JSON writer in a MatchStore.
+    :return: JsonWriter or NdjsonWriter object.
+    """
+    if out_format == "json":
+        return JsonWriter(path, sort, MatchStore(patterns) if patterns is not None else None)
+    if out_format in ("ndjson", "ndjson-files"):
+        return NdjsonWriter(path, per_file=out_format == "ndjson-files")
+    raise ValueError("Unknown output format: {:s}".format(out_format))
@@ -0,0 +1,102 @@
+# parallel.py - Runs the file search over a pool of processes
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator, List, NamedTuple, Tuple, Union
+import itertools
+import file_utils
+import io_utils
+from matcher import PatternMatcher, RegexMatcher, compile_patterns
+
+# Below this many files the pool costs more than it saves
+SERIAL_LIMIT = 200
+
+# A batch is sent once it holds this many bytes or files
+BATCH_BYTES = 4000000
+BATCH_FILES = 64
+
+# The matcher and search of each worker, set once by _init_worker
+_worker_matcher = None
+_worker_search = None
+_worker_limit = None
+
+
+def _init_worker(matches: Union[Tuple[str], PatternMatcher, RegexMatcher], compact: bool, limit: int = None) -> None:
+    global _worker_matcher, _worker_search, _worker_limit
+    _worker_matcher = compile_patterns(matches)
+    _worker_search = io_utils.find_hits_in_file if compact else io_utils.find_in_file
+    _worker_limit = limit
+
+
+def _search_batch(batch: List[str]) -> List[Tuple[str, List[NamedTuple]]]:
+    return [(file, _worker_search(file, _worker_matcher, _worker_limit)) for file in batch]
+
+
+def make_batches(files: Iterable[Tuple[str, int]], batch_bytes: int = BATCH_BYTES,
+                 batch_files: int = BATCH_FILES) -> Iterator[List[str]]:
+    """
+    Groups the files given into batches of about the same
+    number of bytes, so a worker given a big file doesn't also
+    get a long list of small ones. A file bigger than the batch
+    size is sent on its own.
+    :param files: Iterable of (path, size in bytes) tuples.
+    :param batch_bytes: Bytes after which a batch is closed.
+    :param batch_files: Files after which a batch is closed.
+    :return: Iterator over the batches of paths.
+    """
+    batch = []
+    size = 0
+    for path, file_size in files:
+        if file_size >= batch_bytes:
+            yield [path]
+            continue
+
+        batch.append(path)
+        size += file_size
+        if size >= batch_bytes or len(batch) >= batch_files:
+            yield batch
+            batch = []
+            size = 0
+
+    if batch:
+        yield batch
+
+
+def match_files_parallel(files: Iterable[str], matches: List[str], jobs: int, compact: bool = False,
+                         limit: int = None) -> Iterator[Tuple[str, List[NamedTuple]]]:
+    """
+    Searches the files over a pool of processes, yielding the
+    results of every file analysed as batches complete, so the
+    order is not the order of the files given. Small inputs are
+    searched in this process instead.
+    :param files: Iterable of file paths to search.
+    :param matches: List of strings to look for, or the matcher
+    compiled for them (sent to each worker as it is).
+    :param jobs: Number of worker processes.
+    :param compact: Whether to give Hit records instead of Entry.
+    :param limit: Matching lines after which a file is left, or None.
+    :return: Iterator of (path, results) tuples.
+    """
+    files = iter(files)
+    head = list(itertools.islice(files, SERIAL_LIMIT))
+    matcher = compile_patterns(matches)
+    if jobs <= 1 or len(head) < SERIAL_LIMIT:
+        search = io_utils.find_hits_in_file if compact else io_utils.find_in_file
+        for file in itertools.chain(head, files):
+            yield file, search(file, matcher, limit)
+        return
+
+    sized = ((f, file_utils.get_file_size(f)) for f in itertools.chain(head, files))
+    batches = make_batches(sized)
+
+    with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(matcher, compact, limit)) as pool:
+        # Only a few batches are in flight at once, so the
+        # walk doesn't run too far ahead of the workers
+        pending = set()
+        for batch in batches:
+            pending.add(pool.submit(_search_batch, batch))
+            if len(pending) >= 2 * jobs:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+
+        for future in pending:
+            yield from future.result()
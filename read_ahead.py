@@ -0,0 +1,101 @@
+# read_ahead.py - Reads files on a thread pool ahead of the matcher
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, NamedTuple, List, Optional, Tuple
+import os
+import io_utils
+from matcher import compile_patterns
+
+# Bytes of file contents read ahead at most
+READ_AHEAD_BYTES = 64000000
+
+# Files bigger than this are not read ahead, they are searched
+# from disk (memory mapped) when their turn comes
+READ_AHEAD_MAX_FILE = 8000000
+
+
+def _read(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def read_ahead(files: Iterable[str], threads: int = 4, budget: int = READ_AHEAD_BYTES,
+               max_file: int = READ_AHEAD_MAX_FILE) -> Iterator[Tuple[str, Optional[bytes]]]:
+    """
+    Reads the files on a pool of threads while the caller works
+    on the ones already read, so the time blocked on open/read
+    (slow on network or cold disks) overlaps with the matching.
+    The files read but not yet taken stay under the byte budget.
+    :param files: Iterable of file paths.
+    :param threads: Number of reading threads.
+    :param budget: Bytes that may be read ahead at once. A file
+    bigger than the budget is still read when nothing else is.
+    :param max_file: Files bigger than this are not read.
+    :return: Iterator of (path, contents) tuples in the order of
+    the files given, where the contents are None for the files
+    that were not read.
+    """
+    files = iter(files)
+    pending = deque()
+    in_flight = 0
+    next_file = None
+
+    with ThreadPoolExecutor(threads) as pool:
+        while True:
+            # Keep submitting while the budget allows it
+            while True:
+                if next_file is None:
+                    path = next(files, None)
+                    if path is None:
+                        break
+                    try:
+                        size = os.path.getsize(path)
+                    except OSError:
+                        size = 0
+                    next_file = (path, size)
+
+                path, size = next_file
+                if size > max_file:
+                    pending.append((path, 0, None))
+                elif pending and in_flight + size > budget:
+                    break
+                else:
+                    pending.append((path, size, pool.submit(_read, path)))
+                    in_flight += size
+                next_file = None
+
+            if not pending:
+                return
+
+            path, size, future = pending.popleft()
+            in_flight -= size
+            yield path, future.result() if future is not None else None
+
+
+def match_files_read_ahead(files: Iterable[str], matches: List[str], threads: int = 4, compact: bool = False,
+                           budget: int = READ_AHEAD_BYTES, limit: int = None) -> Iterator[Tuple[str, List[NamedTuple]]]:
+    """
+    Same search as finder.match_files, with the files read
+    ahead on a thread pool.
+    :param files: Iterable of file paths to search.
+    :param matches: List of strings to look for.
+    :param threads: Number of reading threads.
+    :param compact: Whether to give Hit records instead of Entry.
+    :param budget: Bytes that may be read ahead at once.
+    :param limit: Matching lines after which a file is left, or None.
+    :return: Iterator of (path, results) tuples, in order.
+    """
+    matcher = compile_patterns(matches)
+    if compact:
+        search_data, search_file = io_utils.find_hits_in_data, io_utils.find_hits_in_file
+    else:
+        search_data, search_file = io_utils.find_in_data, io_utils.find_in_file
+
+    for path, data in read_ahead(files, threads, budget, READ_AHEAD_MAX_FILE):
+        if data is None:
+            yield path, search_file(path, matcher, limit)
+        else:
+            yield path, search_data(data, matcher, limit)
@@ -0,0 +1,140 @@
+# replacer.py - Rewrites the files that matched, replacing a pattern
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Iterable, Iterator, NoReturn, Tuple
+import difflib
+import os
+import re
+import stat
+import tempfile
+
+# Outcome of the replacement in one file
+Replacement = namedtuple("Replacement", ["path", "count", "old_size", "new_size", "diff"])
+
+# Files given to each worker at once
+CHUNK_FILES = 16
+
+
+def parse_replacement(spec: str) -> Tuple[str, str]:
+    """
+    Splits a replacement given as "old=new" (on the first '=').
+    :param spec: String representing the replacement.
+    :return: Tuple with the old and new strings.
+    """
+    old, sep, new = spec.partition("=")
+    if not sep or not old:
+        raise ValueError("Replacement must look like old=new: {:s}".format(spec))
+    return old, new
+
+
+class Replacer(object):
+    """
+    Replaces one pattern with the same match modes as the search
+    (plain substring, regex, ignoring case, whole words). Files
+    are decoded as UTF-8 with surrogate escapes, so any bytes
+    that aren't valid UTF-8 and the line endings are written
+    back exactly as they were.
+    """
+
+    def __init__(self, old: str, new: str, regex: bool = False, ignore_case: bool = False, word: bool = False):
+        self.old = old
+        self.new = new
+        self._regex = None
+        if regex or ignore_case or word:
+            source = old if regex else re.escape(old)
+            if word:
+                source = r"(?<!\w)(?:" + source + r")(?!\w)"
+            self._regex = re.compile(source, re.IGNORECASE if ignore_case else 0)
+            # A plain replacement has no group references
+            if not regex:
+                self.new = new.replace("\\", "\\\\")
+
+    def apply(self, text: str) -> Tuple[str, int]:
+        """
+        Replaces every occurrence of the pattern in the text.
+        :param text: String to rewrite.
+        :return: Tuple with the new text and the number of
+        replacements made.
+        """
+        if self._regex is not None:
+            return self._regex.subn(self.new, text)
+        count = text.count(self.old)
+        return (text.replace(self.old, self.new) if count else text), count
+
+
+def write_atomic(path: str, data: bytes) -> NoReturn:
+    """
+    Writes the file given through a temporary file in the same
+    folder that is then renamed over it, so readers see either
+    the old or the new contents. The permissions are kept.
+    :param path: String representing the file path.
+    :param data: The new contents of the file.
+    :return: void
+    """
+    path = os.path.realpath(path)
+    mode = stat.S_IMODE(os.stat(path).st_mode)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _diff(path: str, old: bytes, new: bytes) -> str:
+    def lines(data):
+        return [line if line.endswith("\n") else line + "\n"
+                for line in data.decode("utf-8", errors="replace").splitlines(keepends=True)]
+    return "".join(difflib.unified_diff(lines(old), lines(new), path, path))
+
+
+def replace_in_file(path: str, replacer: Replacer, dry_run: bool = False) -> Replacement:
+    """
+    Applies the replacement to the file given.
+    :param path: String representing the file path.
+    :param replacer: Replacer object.
+    :param dry_run: Whether to only give the diff, leaving the
+    file as it is.
+    :return: Replacement(path, count, old_size, new_size, diff),
+    with the diff only given in a dry run.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    text, count = replacer.apply(data.decode("utf-8", errors="surrogateescape"))
+    if not count:
+        return Replacement(path, 0, len(data), len(data), "")
+
+    new_data = text.encode("utf-8", errors="surrogateescape")
+    if dry_run:
+        return Replacement(path, count, len(data), len(new_data), _diff(path, data, new_data))
+
+    write_atomic(path, new_data)
+    return Replacement(path, count, len(data), len(new_data), "")
+
+
+def replace_files(files: Iterable[str], replacer: Replacer, jobs: int = 1, dry_run: bool = False) -> Iterator[Replacement]:
+    """
+    Applies the replacement to each file, over a pool of
+    processes if more than one job is given.
+    :param files: Iterable of file paths (the ones that matched).
+    :param replacer: Replacer object, sent to each worker.
+    :param jobs: Number of worker processes.
+    :param dry_run: Whether to only give the diffs.
+    :return: Iterator of Replacement records, in the order given.
+    """
+    files = list(files)
+    replace = partial(replace_in_file, replacer=replacer, dry_run=dry_run)
+    if jobs <= 1 or len(files) <= 1:
+        yield from map(replace, files)
+        return
+
+    with ProcessPoolExecutor(jobs) as pool:
+        yield from pool.map(replace, files, chunksize=CHUNK_FILES)
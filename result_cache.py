@@ -0,0 +1,321 @@
+# result_cache.py - On disk cache of the search results of each file
+from typing import Callable, Iterable, Iterator, List, NamedTuple, NoReturn, Optional, Tuple, Type, Union
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from matcher import Entry, RegexMatcher
+
+# Results are evicted (least recently used first) above this
+MAX_CACHE_BYTES = 256000000
+
+# Binary checks kept at most, least recently used evicted first
+MAX_BINARY_ROWS = 1000000
+
+# Writes are committed every this many results
+COMMIT_EVERY = 500
+
+# Files queued for the search of the misses at most, so the walk
+# doesn't run too far ahead of it
+MAX_QUEUED = 256
+
+# Seconds waited on the queues before checking for a stop
+WAIT_SECONDS = 0.05
+
+# Marks the end of the files to search and of their results
+_DONE = object()
+
+
+def default_cache_dir() -> str:
+    """
+    Gets the directory pyfind keeps its caches in, under
+    $XDG_CACHE_HOME (or ~/.cache).
+    :return: String representing the directory path.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "pyfind")
+
+
+def default_cache_path() -> str:
+    """
+    Gets the path of the cache database, in the cache
+    directory unless $PYFIND_CACHE gives one.
+    :return: String representing the database path.
+    """
+    if os.environ.get("PYFIND_CACHE"):
+        return os.environ["PYFIND_CACHE"]
+    return os.path.join(default_cache_dir(), "results.sqlite")
+
+
+def patterns_key(matches: Union[List[str], RegexMatcher]) -> str:
+    """
+    Hashes the list of patterns given. The order and repeated
+    patterns are part of the key since they change the results,
+    and so is the match mode of a RegexMatcher.
+    :param matches: List of strings searched for, or a matcher.
+    :return: String representing the hash.
+    """
+    if isinstance(matches, RegexMatcher):
+        key = [matches.patterns, matches.mode]
+    else:
+        key = list(getattr(matches, "patterns", matches))
+    return hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+
+
+class ResultCache(object):
+    """
+    Results of find_in_file keyed on the path, size, mtime and
+    inode of the file plus the patterns searched, kept in SQLite
+    so two runs can share the cache safely.
+    """
+
+    def __init__(self, path: str, matches: List[str], max_bytes: int = MAX_CACHE_BYTES, rebuild: bool = False,
+                 record: Type[NamedTuple] = Entry, limit: int = None, max_binary_rows: int = MAX_BINARY_ROWS):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.record = record
+        self.key = patterns_key(matches)
+        if record is not Entry:
+            self.key += ":" + record.__name__
+        # Results cut at a number of lines are kept apart
+        if limit is not None:
+            self.key += ":limit={:d}".format(limit)
+        self.max_bytes = max_bytes
+        self.max_binary_rows = max_binary_rows
+        self.hits = 0
+        self.misses = 0
+        self._used = []
+        self._used_binary = []
+        self._pending = 0
+
+        self._db = sqlite3.connect(path, timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " path TEXT, patterns TEXT, size INTEGER, mtime_ns INTEGER, inode INTEGER,"
+            " data TEXT, nbytes INTEGER, last_used INTEGER,"
+            " PRIMARY KEY (path, patterns))")
+        # Tables made before the binary checks were evicted are
+        # dropped, they are only a cache
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(binary)")]
+        if columns and "last_used" not in columns:
+            self._db.execute("DROP TABLE binary")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS binary ("
+            " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, is_binary INTEGER,"
+            " last_used INTEGER)")
+        if rebuild:
+            self._db.execute("DELETE FROM results")
+            self._db.execute("DELETE FROM binary")
+        self._db.commit()
+
+    def get(self, path: str, st: os.stat_result) -> Optional[List[NamedTuple]]:
+        """
+        Gets the cached results of the file given, if the file
+        didn't change since they were stored.
+        :param path: String representing the file path.
+        :param st: Current stat result of the file.
+        :return: List of records (Entry(line, s) by default), or
+        None on a miss.
+        """
+        row = self._db.execute(
+            "SELECT size, mtime_ns, inode, data FROM results WHERE path = ? AND patterns = ?",
+            (path, self.key)).fetchone()
+        if row is None or tuple(row[:3]) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._used.append((time.time_ns(), path, self.key))
+        return [self.record(*e) for e in json.loads(row[3])]
+
+    def put(self, path: str, st: os.stat_result, results: List[NamedTuple]) -> NoReturn:
+        """
+        Stores the results of the file given.
+        :param path: String representing the file path.
+        :param st: Stat result of the file taken before it was read.
+        :param results: List of records found in the file.
+        :return: void
+        """
+        data = json.dumps([tuple(e) for e in results])
+        self._db.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, self.key, st.st_size, st.st_mtime_ns, st.st_ino, data, len(data), time.time_ns()))
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.flush()
+
+    def get_binary(self, path: str, st: os.stat_result) -> Optional[bool]:
+        """
+        Gets whether the file given was found to be binary,
+        if it didn't change since.
+        :param path: String representing the file path.
+        :param st: Current stat result of the file.
+        :return: True if binary, False if text, None if unknown.
+        """
+        row = self._db.execute(
+            "SELECT size, mtime_ns, inode, is_binary FROM binary WHERE path = ?", (path,)).fetchone()
+        if row is None or tuple(row[:3]) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        self._used_binary.append((time.time_ns(), path))
+        return bool(row[3])
+
+    def put_binary(self, path: str, st: os.stat_result, is_binary: bool) -> NoReturn:
+        """
+        Stores whether the file given is binary.
+        :param path: String representing the file path.
+        :param st: Stat result of the file taken before it was read.
+        :param is_binary: True if the file is binary.
+        :return: void
+        """
+        self._db.execute(
+            "INSERT OR REPLACE INTO binary VALUES (?, ?, ?, ?, ?, ?)",
+            (path, st.st_size, st.st_mtime_ns, st.st_ino, int(is_binary), time.time_ns()))
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.flush()
+
+    def flush(self) -> NoReturn:
+        """
+        Commits the pending writes and the use times of the hits.
+        :return: void
+        """
+        if self._used:
+            self._db.executemany(
+                "UPDATE results SET last_used = ? WHERE path = ? AND patterns = ?", self._used)
+            self._used = []
+        if self._used_binary:
+            self._db.executemany("UPDATE binary SET last_used = ? WHERE path = ?", self._used_binary)
+            self._used_binary = []
+        self._db.commit()
+        self._pending = 0
+
+    def evict(self) -> NoReturn:
+        """
+        Drops the least recently used results until the cache
+        is under its size cap, and the least recently used binary
+        checks above their row cap.
+        :return: void
+        """
+        n_binary = self._db.execute("SELECT COUNT(*) FROM binary").fetchone()[0]
+        if n_binary > self.max_binary_rows:
+            self._db.execute("DELETE FROM binary WHERE rowid IN (SELECT rowid FROM binary ORDER BY last_used LIMIT ?)",
+                             (n_binary - self.max_binary_rows,))
+            self._db.commit()
+
+        total = self._db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        to_delete = []
+        rows = self._db.execute("SELECT rowid, nbytes FROM results ORDER BY last_used")
+        for rowid, nbytes in rows:
+            if total <= self.max_bytes:
+                break
+            to_delete.append((rowid,))
+            total -= nbytes
+        self._db.executemany("DELETE FROM results WHERE rowid = ?", to_delete)
+        self._db.commit()
+
+    def close(self) -> NoReturn:
+        self.flush()
+        self.evict()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def match_files_cached(files: Iterable[str], cache: ResultCache,
+                       search: Callable[[Iterable[str]], Iterator[Tuple[str, List[NamedTuple]]]]) -> Iterator[Tuple[str, List[NamedTuple]]]:
+    """
+    Wraps a search so only the files missing from the cache
+    are read. The walk and the cache lookups stay in this thread,
+    so the hits are yielded as soon as they are found, while the
+    misses are searched by one search running in a thread of its
+    own, their results yielded as they come back.
+    :param files: Iterable of file paths to search.
+    :param cache: ResultCache to read and fill.
+    :param search: Function searching an iterable of paths,
+    like finder.match_files.
+    :return: Iterator of (path, results) tuples.
+    """
+    to_search = queue.Queue(MAX_QUEUED)
+    found = queue.Queue()
+    stop = threading.Event()
+    stats = {}
+
+    def feed() -> Iterator[str]:
+        while not stop.is_set():
+            try:
+                file = to_search.get(timeout=WAIT_SECONDS)
+            except queue.Empty:
+                continue
+            if file is _DONE:
+                return
+            yield file
+
+    def run() -> NoReturn:
+        try:
+            # Once stopped the feed ends, so the search finishes
+            # the files it already has and returns
+            for result in search(feed()):
+                found.put(result)
+        except BaseException as e:
+            found.put(e)
+        found.put(_DONE)
+
+    def results(block: bool) -> Iterator[Tuple[str, List[NamedTuple]]]:
+        # The results of the search so far, or all of them
+        while block or not found.empty():
+            item = found.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            file, matches = item
+            st = stats.pop(file, None)
+            if st is not None:
+                cache.put(file, st, matches)
+            yield file, matches
+
+    def send(file: str) -> Iterator[Tuple[str, List[NamedTuple]]]:
+        # A full queue means the search is behind, its results
+        # are given while waiting
+        while True:
+            try:
+                to_search.put(file, timeout=WAIT_SECONDS)
+                return
+            except queue.Full:
+                yield from results(False)
+
+    searcher = threading.Thread(target=run, daemon=True)
+    searcher.start()
+    try:
+        for file in files:
+            try:
+                st = os.stat(file)
+            except OSError:
+                yield from send(file)
+                continue
+
+            cached = cache.get(file, st)
+            if cached is None:
+                stats[file] = st
+                yield from send(file)
+            else:
+                yield file, cached
+            yield from results(False)
+
+        yield from send(_DONE)
+        yield from results(True)
+    finally:
+        # Also stops the search when the caller leaves early
+        stop.set()
+        searcher.join()
@@ -0,0 +1,155 @@
+# run_stats.py - Per phase timings and counters of a run
+from typing import Dict, Iterable, Iterator, NoReturn, Optional
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+
+
+class NullStats(object):
+    """
+    Stands in for RunStats when the stats are off, so the
+    pipeline is left as it is and counting costs one call.
+    """
+
+    def timed(self, name: str, items: Iterable) -> Iterable:
+        return items
+
+    def phase(self, name: str):
+        return contextlib.nullcontext()
+
+    def count_bytes(self, files: Iterable[str]) -> Iterable[str]:
+        return files
+
+    def add(self, name: str, n: int = 1) -> NoReturn:
+        pass
+
+
+class RunStats(NullStats):
+    """
+    Wall and CPU time of each phase of a run, plus counters.
+    The pipeline stages are lazy generators pulling from each
+    other, so the time is charged to whichever phase is running:
+    a stage waiting on the stage before it isn't charged for it.
+    The matching phase can also be run under cProfile.
+    """
+
+    def __init__(self, profile_phase: str = None):
+        self.wall = {}
+        self.cpu = {}
+        self.counters = {}
+        self._current = None
+        self._wall_mark = time.perf_counter()
+        self._cpu_mark = time.process_time()
+        self._started = self._wall_mark
+        self.profile_phase = profile_phase
+        self.profiler = cProfile.Profile() if profile_phase else None
+
+    def _switch(self, name: Optional[str]) -> Optional[str]:
+        """
+        Charges the time since the last switch to the current
+        phase and makes the phase given the current one.
+        :param name: The phase starting, or None for no phase.
+        :return: The phase that was running.
+        """
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        previous = self._current
+        if previous is not None:
+            self.wall[previous] = self.wall.get(previous, 0.0) + wall - self._wall_mark
+            self.cpu[previous] = self.cpu.get(previous, 0.0) + cpu - self._cpu_mark
+
+        if self.profiler is not None and name != previous:
+            if previous == self.profile_phase:
+                self.profiler.disable()
+            elif name == self.profile_phase:
+                self.profiler.enable()
+
+        self._current = name
+        self._wall_mark = wall
+        self._cpu_mark = cpu
+        return previous
+
+    def timed(self, name: str, items: Iterable) -> Iterator:
+        """
+        Wraps a stage of the pipeline, charging the time spent
+        getting each of its items to the phase given.
+        :param name: Name of the phase.
+        :param items: Iterable given by the stage.
+        :return: Iterator over the same items.
+        """
+        it = iter(items)
+        while True:
+            previous = self._switch(name)
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self._switch(previous)
+            yield item
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        previous = self._switch(name)
+        try:
+            yield
+        finally:
+            self._switch(previous)
+
+    def count_bytes(self, files: Iterable[str]) -> Iterator[str]:
+        """
+        Counts the size of the files going through as bytes read.
+        :param files: Iterable of file paths.
+        :return: Iterator over the same paths.
+        """
+        for file in files:
+            try:
+                self.add("bytes_read", os.path.getsize(file))
+            except OSError:
+                pass
+            yield file
+
+    def add(self, name: str, n: int = 1) -> NoReturn:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "total_wall": time.perf_counter() - self._started,
+            "phases": {name: {"wall": self.wall[name], "cpu": self.cpu[name]} for name in self.wall},
+            "counters": dict(self.counters),
+        }
+
+    def summary(self) -> str:
+        """
+        Formats the stats as a table for the console.
+        :return: String with one line per phase and counter.
+        """
+        data = self.to_dict()
+        lines = ["{:<16s} {:>10s} {:>10s}".format("Phase", "Wall (s)", "CPU (s)")]
+        for name, phase in data["phases"].items():
+            lines.append("{:<16s} {:10.3f} {:10.3f}".format(name, phase["wall"], phase["cpu"]))
+        lines.append("{:<16s} {:10.3f}".format("total", data["total_wall"]))
+        for name, value in sorted(data["counters"].items()):
+            lines.append("{:<24s} {:d}".format(name, value))
+        return "\n".join(lines)
+
+    def save(self, path: str) -> NoReturn:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def save_profile(self, path: str, top: int = 15) -> str:
+        """
+        Writes the profile of the profiled phase (readable with
+        pstats or snakeviz).
+        :param path: String representing the output file path.
+        :param top: Number of functions in the returned report.
+        :return: String with the functions taking the most time.
+        """
+        self.profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        return out.getvalue()
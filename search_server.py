@@ -0,0 +1,415 @@
+# search_server.py - Long running search over a tree kept warm in memory
+from collections import OrderedDict
+from typing import Dict, Iterator, List, NoReturn, Optional, Tuple
+import hashlib
+import json
+import os
+import re
+import selectors
+import socket
+import time
+import folder_utils
+import io_utils
+from file_filter import FileFilter
+from file_tree import FileNode, FileTree, FolderNode
+from ignore_rules import IgnoreRules
+from inotify import IN_CREATE, IN_DELETE_SELF, IN_IGNORED, IN_ISDIR, IN_MOVE_SELF, IN_MOVED_TO, IN_Q_OVERFLOW, Inotify
+from matcher import compile_patterns
+from result_cache import default_cache_dir
+
+# Bytes of file contents kept in memory at most
+MEMORY_BUDGET = 256000000
+
+# Files bigger than this are never kept, they are searched from disk
+MAX_CACHED_FILE = 8000000
+
+# Seconds a client may take to send its request
+CLIENT_TIMEOUT = 10
+
+# The tree is copied without its dropped nodes once they are
+# this fraction of its arrays
+DEAD_FRACTION = 0.5
+
+
+def default_socket_path(root: str) -> str:
+    """
+    Gets the socket the server of the directory given listens
+    on, in $XDG_RUNTIME_DIR (or the cache directory).
+    :param root: String representing the served directory.
+    :return: String representing the socket path.
+    """
+    key = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()[:16]
+    folder = os.environ.get("XDG_RUNTIME_DIR") or default_cache_dir()
+    return os.path.join(folder, "pyfind-{:s}.sock".format(key))
+
+
+class ContentCache(object):
+    """
+    Contents of the files searched, least recently used first,
+    dropped as the total goes over the byte budget.
+    """
+
+    def __init__(self, budget: int = MEMORY_BUDGET):
+        self.budget = budget
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def get(self, path: str) -> Optional[bytes]:
+        data = self._data.get(path)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(path)
+        return data
+
+    def put(self, path: str, data: bytes) -> NoReturn:
+        if len(data) > self.budget:
+            return
+        self.drop(path)
+        self._data[path] = data
+        self.nbytes += len(data)
+        while self.nbytes > self.budget:
+            _, old = self._data.popitem(last=False)
+            self.nbytes -= len(old)
+            self.evictions += 1
+
+    def drop(self, path: str) -> NoReturn:
+        data = self._data.pop(path, None)
+        if data is not None:
+            self.nbytes -= len(data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class WarmTree(object):
+    """
+    The FolderNode tree of a directory, kept up to date through
+    inotify, with the contents of its text files cached. A change
+    in a folder only lists that folder again (and walks the
+    folders added to it), and drops the cached contents of the
+    files changed.
+    """
+
+    def __init__(self, root: str, ignore: IgnoreRules = None, file_filter: FileFilter = None,
+                 budget: int = MEMORY_BUDGET):
+        self.root_path = os.path.abspath(root)
+        self.ignore = ignore
+        self.file_filter = file_filter
+        self.cache = ContentCache(budget)
+        self.binary = {}
+        self.watcher = Inotify()
+        self._folders = {}
+        self._rules = {}
+        self._watches = {}
+        self._watch_of = {}
+        self._dead = 0
+        self.root = self._build(self.root_path, ignore, None)
+
+    def _visit(self, node: FolderNode, rules: IgnoreRules) -> NoReturn:
+        self._folders[node.path] = node
+        self._rules[node.path] = rules
+        try:
+            wd = self.watcher.add_watch(node.path)
+        except OSError:
+            return
+        self._watches[wd] = node.path
+        self._watch_of[node.path] = wd
+
+    def _build(self, path: str, rules: IgnoreRules, tree: FileTree) -> FolderNode:
+        return FolderNode.get_node_from_path(path, FileNode, rules, self.file_filter, self._visit, tree)
+
+    def _forget(self, node) -> NoReturn:
+        # Drops a removed node and everything under it
+        pending = [node]
+        while pending:
+            curr = pending.pop()
+            self._dead += 1
+            if isinstance(curr, FolderNode):
+                self._folders.pop(curr.path, None)
+                self._rules.pop(curr.path, None)
+                # A folder moved inside the tree keeps its watch
+                wd = self._watch_of.pop(curr.path, None)
+                if wd is not None and self._watches.get(wd) == curr.path:
+                    self.watcher.remove_watch(wd)
+                    del self._watches[wd]
+                pending.extend(curr.children)
+            else:
+                self.cache.drop(curr.path)
+                self.binary.pop(curr.path, None)
+
+    def _compact(self) -> NoReturn:
+        """
+        Copies the nodes still in the tree into new arrays, so the
+        ones dropped by the changes don't pile up in a server that
+        runs for long.
+        """
+        tree = FileTree(FolderNode, FileNode)
+        index = tree.graft(self.root.tree, self.root.index, -1)
+        tree.root_paths[index] = self.root_path
+        self.root = tree.node(index)
+        self._folders = {}
+        pending = [self.root]
+        while pending:
+            node = pending.pop()
+            self._folders[node.path] = node
+            pending.extend(child for child in node if isinstance(child, FolderNode))
+        self._dead = 0
+
+    def _rescan(self, node: FolderNode, created: set = frozenset()) -> NoReturn:
+        """
+        Lists the folder again, the same way the walk does, adding
+        and removing the child nodes that changed. Sub folders that
+        were (re)created are walked again.
+        """
+        try:
+            files, folders, rules = folder_utils.scan_filtered(node.path, self._rules[node.path], self.file_filter)
+        except OSError:
+            return
+
+        old = {child.path: child for child in node.children}
+        children = []
+        for entry in files:
+            child = old.pop(entry.path, None)
+            if not isinstance(child, FileNode):
+                if child is not None:
+                    self._forget(child)
+                child = FileNode.from_dir_entry(entry, node.tree)
+            children.append(child)
+        for entry in folders:
+            child = old.pop(entry.path, None)
+            if child is not None and (entry.path in created or not isinstance(child, FolderNode)):
+                self._forget(child)
+                child = None
+            if child is None:
+                child = self._build(entry.path, rules, node.tree)
+            children.append(child)
+        for child in old.values():
+            self._forget(child)
+        node.children = children
+
+    def update(self, timeout: float = 0) -> int:
+        """
+        Applies the changes inotify reported since the last update.
+        :param timeout: Seconds to wait for the first change.
+        :return: Number of events applied.
+        """
+        events = self.watcher.read_events(timeout)
+        dirty = set()
+        created = set()
+        for event in events:
+            if event.mask & IN_Q_OVERFLOW:
+                # Changes were lost, only a new walk can tell
+                self.rebuild()
+                return len(events)
+            folder = self._watches.get(event.wd)
+            if event.mask & IN_IGNORED:
+                if folder is not None:
+                    self._watches.pop(event.wd)
+                    self._watch_of.pop(folder, None)
+                continue
+            if folder is None or event.mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                continue
+            path = os.path.join(folder, event.name)
+            if event.mask & IN_ISDIR:
+                if event.mask & (IN_CREATE | IN_MOVED_TO):
+                    created.add(path)
+            elif event.name:
+                self.cache.drop(path)
+                self.binary.pop(path, None)
+            dirty.add(folder)
+
+        # Parents first, so folders removed with them are skipped
+        for folder in sorted(dirty):
+            node = self._folders.get(folder)
+            if node is not None:
+                self._rescan(node, created)
+        if self._dead > DEAD_FRACTION * len(self.root.tree):
+            self._compact()
+        return len(events)
+
+    def rebuild(self) -> NoReturn:
+        for wd in list(self._watches):
+            self.watcher.remove_watch(wd)
+        self._watches = {}
+        self._watch_of = {}
+        self._folders = {}
+        self._rules = {}
+        self.cache = ContentCache(self.cache.budget)
+        self.binary = {}
+        self._dead = 0
+        self.root = self._build(self.root_path, self.ignore, None)
+
+    def iter_files(self) -> Iterator[str]:
+        return self.root.iter_files()
+
+    def _contents(self, path: str) -> Tuple[Optional[bytes], bool]:
+        # (contents, is_binary), the contents None when too big
+        data = self.cache.get(path)
+        if data is not None:
+            return data, False
+        if self.binary.get(path):
+            return None, True
+        if os.path.getsize(path) > MAX_CACHED_FILE:
+            is_binary = self.binary[path] = io_utils.is_binary_file(path)
+            return None, is_binary
+        with open(path, "rb") as f:
+            data = f.read()
+        is_binary = io_utils.is_binary_data(data[:io_utils.SNIFF_SIZE])
+        self.binary[path] = is_binary
+        if not is_binary:
+            self.cache.put(path, data)
+        return data, is_binary
+
+    def warm(self) -> int:
+        """
+        Reads the text files into the cache, in walk order, until
+        the budget is used.
+        :return: Number of files cached.
+        """
+        for path in self.iter_files():
+            if self.cache.nbytes >= self.cache.budget:
+                break
+            try:
+                self._contents(path)
+            except OSError:
+                continue
+        # Reads made to warm up are not misses
+        self.cache.misses = 0
+        return len(self.cache)
+
+    def search(self, words: List[str], regex: bool = False, ignore_case: bool = False, word: bool = False,
+               limit: int = None) -> Iterator[Tuple[str, List]]:
+        """
+        Searches the text files of the tree, from memory where
+        their contents are cached.
+        :param words: List of strings to look for.
+        :param regex: Whether the words are regular expressions.
+        :param ignore_case: Whether to match ignoring case.
+        :param word: Whether to only match whole words.
+        :param limit: Matching lines after which a file is left.
+        :return: Iterator of (path, list of Entry(line, s)), for
+        the files that match.
+        """
+        matcher = compile_patterns(words, regex, ignore_case, word)
+        for path in self.iter_files():
+            try:
+                data, is_binary = self._contents(path)
+                if is_binary:
+                    continue
+                if data is None:
+                    results = io_utils.find_in_file(path, matcher, limit)
+                else:
+                    results = io_utils.find_in_data(data, matcher, limit)
+            except OSError:
+                continue
+            if results:
+                yield path, results
+
+    def stats(self) -> Dict[str, int]:
+        return {"folders": len(self._folders), "watches": len(self._watches), "cached_files": len(self.cache),
+                "cached_bytes": self.cache.nbytes, "budget": self.cache.budget, "cache_hits": self.cache.hits,
+                "cache_misses": self.cache.misses, "evictions": self.cache.evictions}
+
+    def close(self) -> NoReturn:
+        self.watcher.close()
+
+
+def _send(conn: socket.socket, record: Dict) -> NoReturn:
+    conn.sendall(json.dumps(record).encode("utf-8") + b"\n")
+
+
+def _handle(tree: WarmTree, conn: socket.socket) -> bool:
+    """
+    Answers one request: a JSON line with the "command" (search,
+    stats or stop) and the search options. Search results are sent
+    back one JSON line per file, then a line with "done".
+    :return: False if the server should stop.
+    """
+    conn.settimeout(CLIENT_TIMEOUT)
+    with conn, conn.makefile("rb") as f:
+        record = json.loads(f.readline() or b"{}")
+        command = record.get("command", "search")
+        if command == "stop":
+            _send(conn, {"done": True})
+            return False
+        if command == "stats":
+            _send(conn, dict(tree.stats(), done=True))
+            return True
+
+        # Changes made right before the request are seen
+        tree.update()
+        start = time.perf_counter()
+        hits = tree.cache.hits
+        n_files = 0
+        try:
+            for path, results in tree.search(record["words"], record.get("regex", False),
+                                             record.get("ignore_case", False), record.get("word", False),
+                                             record.get("limit")):
+                n_files += 1
+                _send(conn, {"path": path, "matches": [list(r) for r in results]})
+        except (re.error, KeyError, TypeError) as e:
+            _send(conn, {"error": str(e), "done": True})
+            return True
+        _send(conn, dict(tree.stats(), done=True, files=n_files, seconds=time.perf_counter() - start,
+                             from_memory=tree.cache.hits - hits))
+    return True
+
+
+def serve(tree: WarmTree, socket_path: str) -> NoReturn:
+    """
+    Answers the requests sent to the socket one at a time, and
+    applies the changes of the tree in between, until a stop
+    request (or an interrupt).
+    :param tree: WarmTree of the served directory.
+    :param socket_path: String representing the socket path.
+    :return: void
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server.listen()
+
+    selector = selectors.DefaultSelector()
+    selector.register(server, selectors.EVENT_READ)
+    selector.register(tree.watcher, selectors.EVENT_READ)
+    try:
+        running = True
+        while running:
+            for key, _ in selector.select():
+                if key.fileobj is server:
+                    conn, _ = server.accept()
+                    try:
+                        running = _handle(tree, conn) and running
+                    except (OSError, ValueError):
+                        # The client went away or sent garbage
+                        pass
+                else:
+                    tree.update()
+    finally:
+        selector.close()
+        server.close()
+        os.unlink(socket_path)
+
+
+def request(socket_path: str, record: Dict) -> Iterator[Dict]:
+    """
+    Sends a request to the server and reads back its answer.
+    :param socket_path: String representing the socket path.
+    :param record: The request, E.g. {"words": ["LFM"]}.
+    :return: Iterator of the records sent back, the last one
+    holding "done".
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        _send(conn, record)
+        with conn.makefile("rb") as f:
+            for line in f:
+                yield json.loads(line)
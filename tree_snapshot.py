@@ -0,0 +1,342 @@
+# tree_snapshot.py - Saves a file tree to disk and loads it back without walking
+from __future__ import annotations
+from array import array
+from collections import namedtuple
+from file_filter import FileFilter
+from file_tree import FILE, FOLDER, FileNode, FileTree, FolderNode, FolderNodeError, Node
+from ignore_rules import IgnoreRules
+from itertools import accumulate, repeat
+from typing import NoReturn, Optional, Set, Tuple, Type
+import folder_utils
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b"FTSNAP\x00\x01"
+
+# Magic, little endian flag, number of nodes, number of folders,
+# bytes of the root path and bytes of the names
+_HEADER = struct.Struct("<8sB3xIIII4x")
+
+# A name of the tree standing for a listing entry, for IgnoreRules.enter
+_Listed = namedtuple("_Listed", ["name"])
+_RULE_FILES = [_Listed(".gitignore")]
+_RULE_FOLDERS = [_Listed(".git")]
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def save(root: Node, path: str) -> int:
+    """
+    Saves the tree under the node given. The nodes are numbered
+    again breadth first, so the children of each folder follow each
+    other and are stored as a first index and a count. The arrays
+    are written as they are in memory, one after the other:
+    folder mtimes (int64), folder indices, parents, first children,
+    children counts and name ends (int32), kinds (uint8), then the
+    root path and the names (UTF-8).
+    :param root: The root node of the tree to save.
+    :param path: String representing the snapshot file.
+    :return: Number of nodes saved.
+    """
+    tree = root.tree
+    tree_kind = tree.kind
+    order = [root.index]
+    parent = array("i", [-1])
+    kind = bytearray([tree_kind[root.index]])
+    # Only the folders are gone through one by one
+    folders = array("i", [0] if kind[0] == FOLDER else [])
+    first = array("i", bytes(4))
+    count = array("i", bytes(4))
+    i = 0
+    while i < len(folders):
+        new = folders[i]
+        kids = tree.children[order[new]]
+        start = len(order)
+        order.extend(kids)
+        parent.extend(repeat(new, len(kids)))
+        kind.extend(map(tree_kind.__getitem__, kids))
+        first.extend(repeat(0, len(kids)))
+        count.extend(repeat(0, len(kids)))
+        first[new] = start
+        count[new] = len(kids)
+        pos = kind.find(FOLDER, start)
+        while pos >= 0:
+            folders.append(pos)
+            pos = kind.find(FOLDER, pos + 1)
+        i += 1
+
+    names = list(map(tree.names.__getitem__, order))
+    joined = "".join(names)
+    blob = joined.encode("utf-8", "surrogateescape")
+    sizes = map(len, names)
+    if len(blob) != len(joined):
+        # Some names aren't ASCII, their sizes in bytes differ
+        sizes = (len(name.encode("utf-8", "surrogateescape")) for name in names)
+    ends = array("i", accumulate(sizes))
+    # Folders never listed get 0, so they are listed on revalidation
+    mtimes = array("q", (tree.mtimes.get(order[new], 0) for new in folders))
+    root_path = tree.path(root.index).encode("utf-8", "surrogateescape")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, sys.byteorder == "little", len(order), len(folders), len(root_path), len(blob)))
+        for data in (mtimes, folders, parent, first, count, ends, kind, root_path, blob):
+            f.write(data)
+    os.replace(tmp_path, path)
+    return len(order)
+
+
+class _Names(object):
+    """
+    The names of a snapshot, decoded only when asked for, then
+    the names of the nodes added since.
+    """
+    __slots__ = ("ends", "blob", "added")
+
+    def __init__(self, ends: memoryview, blob: memoryview):
+        self.ends = ends
+        self.blob = blob
+        self.added = []
+
+    def append(self, name: str) -> NoReturn:
+        self.added.append(name)
+
+    def __getitem__(self, index: int) -> str:
+        if index >= len(self.ends):
+            return self.added[index - len(self.ends)]
+        start = self.ends[index - 1] if index else 0
+        return str(self.blob[start:self.ends[index]], "utf-8", "surrogateescape")
+
+    def __len__(self) -> int:
+        return len(self.ends) + len(self.added)
+
+
+class _Children(object):
+    """
+    The children of the folders of a snapshot, as the ranges of
+    indices they were numbered with, or as arrays for the folders
+    changed since.
+    """
+    __slots__ = ("kind", "first", "count", "changed")
+
+    def __init__(self, kind: memoryview, first: memoryview, count: memoryview):
+        self.kind = kind
+        self.first = first
+        self.count = count
+        self.changed = {}
+
+    def get(self, index: int, default=None):
+        children = self.changed.get(index)
+        if children is not None:
+            return children
+        if self.kind[index] != FOLDER:
+            return default
+        start = self.first[index]
+        return range(start, start + self.count[index])
+
+    def own(self, index: int) -> array:
+        # The children of the folder as an array that can be changed
+        if index not in self.changed:
+            self.changed[index] = array("i", self[index])
+        return self.changed[index]
+
+    def __getitem__(self, index: int):
+        children = self.get(index)
+        if children is None:
+            raise KeyError(index)
+        return children
+
+    def __setitem__(self, index: int, children: array) -> NoReturn:
+        self.changed[index] = children
+
+
+class SnapshotTree(FileTree):
+    """
+    A FileTree read from a snapshot. Its arrays are views of the
+    memory mapped file, so loading costs nothing per node: the
+    names are decoded and the pages read as the tree is used. A
+    change to the tree copies the parents and kinds into memory,
+    the new names and children are kept apart from the file's.
+    """
+
+    def __init__(self, data: mmap.mmap, folder_cls: Type[FolderNode] = None, file_cls: Type[FileNode] = None):
+        super().__init__(folder_cls, file_cls)
+        if len(data) < _HEADER.size:
+            raise SnapshotError("Snapshot file is truncated")
+        magic, little, n, n_folders, root_len, names_len = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise SnapshotError("Not a tree snapshot")
+        if little != (sys.byteorder == "little"):
+            raise SnapshotError("Snapshot saved on a machine of another byte order")
+        if len(data) != _HEADER.size + 12 * n_folders + 17 * n + root_len + names_len:
+            raise SnapshotError("Snapshot file is truncated")
+
+        view = memoryview(data)
+        pos = _HEADER.size
+
+        def take(size: int, fmt: str) -> memoryview:
+            nonlocal pos
+            pos += size
+            return view[pos - size:pos].cast(fmt)
+
+        mtimes = take(8 * n_folders, "q")
+        folders = take(4 * n_folders, "i")
+        self.parent = take(4 * n, "i")
+        first = take(4 * n, "i")
+        count = take(4 * n, "i")
+        ends = take(4 * n, "i")
+        self.kind = take(n, "B")
+        root_path = str(take(root_len, "B"), "utf-8", "surrogateescape")
+        self.names = _Names(ends, take(names_len, "B"))
+        self.children = _Children(self.kind, first, count)
+        self.mtimes = dict(zip(folders, mtimes))
+        self.root_paths = {0: root_path}
+        self._writable = False
+
+    def _make_writable(self) -> NoReturn:
+        # Copies the parents and kinds out of the file, the names
+        # and children of the nodes added or changed go on top
+        if self._writable:
+            return
+        parent = array("i")
+        parent.frombytes(self.parent.cast("B"))
+        self.parent = parent
+        self.kind = self.children.kind = bytearray(self.kind)
+        self._writable = True
+
+    def add(self, parent: int, name: str, kind: int) -> int:
+        self._make_writable()
+        if parent >= 0:
+            self.children.own(parent)
+        return super().add(parent, name, kind)
+
+    def attach(self, index: int, parent: int) -> NoReturn:
+        self._make_writable()
+        self.children.own(parent)
+        super().attach(index, parent)
+
+    def clear_children(self, index: int) -> NoReturn:
+        self._make_writable()
+        super().clear_children(index)
+
+
+def load(path: str, folder_cls: Type[FolderNode] = FolderNode, file_cls: Type[FileNode] = FileNode) -> Node:
+    """
+    Loads a snapshot saved by save, memory mapping it.
+    :param path: String representing the snapshot file.
+    :param folder_cls: Class of the views of the folder nodes.
+    :param file_cls: Class of the views of the file nodes.
+    :return: The root node of the tree.
+    """
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise SnapshotError("Snapshot file is empty")
+    return SnapshotTree(data, folder_cls, file_cls).node(0)
+
+
+def _rescan(tree: FileTree, index: int, path: str, rules: Optional[IgnoreRules],
+            file_filter: Optional[FileFilter]) -> Tuple[Optional[IgnoreRules], Set[int]]:
+    # Lists the folder again the way the walk does, keeping the
+    # children still there and walking the new sub folders
+    try:
+        files, folders, rules = folder_utils.scan_filtered(path, rules, file_filter)
+    except OSError:
+        return rules, set()
+
+    old = {tree.names[child]: child for child in tree.children.get(index, ())}
+    kept = []
+    walked = set()
+    for entry in files:
+        child = old.pop(entry.name, None)
+        if child is None or tree.kind[child] != FILE:
+            child = tree.file_cls.from_dir_entry(entry, tree).index
+        kept.append(child)
+    for entry in folders:
+        child = old.pop(entry.name, None)
+        if child is None or tree.kind[child] != FOLDER:
+            try:
+                child = tree.folder_cls.get_node_from_path(entry.path, tree.file_cls, rules, file_filter,
+                                                           tree=tree).index
+            except FolderNodeError:
+                continue
+            walked.add(child)
+        kept.append(child)
+
+    if kept != list(tree.children.get(index, ())):
+        tree.clear_children(index)
+        for child in kept:
+            tree.attach(child, index)
+    return rules, walked
+
+
+def revalidate(root: FolderNode, ignore: IgnoreRules = None, file_filter: FileFilter = None) -> Tuple[int, int]:
+    """
+    Brings a loaded tree up to date with the disk. Adding, removing
+    or renaming an entry changes the mtime of its folder, so each
+    folder is stat'ed and only the ones whose mtime changed are
+    listed again, the files are never looked at. Edits to the
+    .gitignore files of unchanged folders aren't seen.
+    :param root: The root node of the tree.
+    :param ignore: IgnoreRules the tree was walked with.
+    :param file_filter: FileFilter the tree was walked with.
+    :return: Tuple with the number of folders checked and the
+    number of folders listed again.
+    """
+    tree = root.tree
+    checked = 0
+    changed = 0
+    pending = [(root.index, root.path, ignore)]
+    while pending:
+        index, path, rules = pending.pop()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            # Gone, its parent is listed again (or the root is gone)
+            continue
+        checked += 1
+
+        walked = ()
+        if mtime != tree.mtimes.get(index):
+            tree.mtimes[index] = mtime
+            rules, walked = _rescan(tree, index, path, rules, file_filter)
+            changed += 1
+        elif rules is not None:
+            # Without its listing, the rule files of the folder are
+            # just opened, the ones missing give no rules
+            rules = rules.enter(path, _RULE_FILES, _RULE_FOLDERS)
+
+        prefix = path if path.endswith(os.sep) else path + os.sep
+        for child in tree.children.get(index, ()):
+            if tree.kind[child] == FOLDER and child not in walked:
+                pending.append((child, prefix + tree.names[child], rules))
+    return checked, changed
+
+
+def open_tree(root: str, path: str, ignore: IgnoreRules = None, file_filter: FileFilter = None) -> FolderNode:
+    """
+    Loads the tree of the folder from its snapshot, revalidating
+    it, or walks the folder if there is no usable snapshot. The
+    snapshot is saved again when anything changed.
+    :param root: String representing the root directory.
+    :param path: String representing the snapshot file.
+    :param ignore: IgnoreRules of the root, None keeps everything.
+    :param file_filter: FileFilter deciding which files get a node.
+    :return: FolderNode representing the root of the tree.
+    """
+    try:
+        node = load(path)
+        if node.path == os.path.abspath(root):
+            if revalidate(node, ignore, file_filter)[1]:
+                save(node, path)
+            return node
+    except (OSError, SnapshotError):
+        pass
+    node = FolderNode.get_node_from_path(root, FileNode, ignore, file_filter)
+    save(node, path)
+    return node
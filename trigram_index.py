@@ -0,0 +1,189 @@
+# trigram_index.py - On disk trigram index of the files to search
+from array import array
+from typing import Dict, Iterable, List, NoReturn, Set, Tuple
+import hashlib
+import os
+import sqlite3
+import io_utils
+from result_cache import default_cache_dir
+
+# Postings are written out as a new segment every this many files
+SEGMENT_FILES = 20000
+
+
+def default_index_path(root: str) -> str:
+    """
+    Gets the path of the index of the directory given, in
+    the cache directory so the index is not inside the tree.
+    :param root: String representing the indexed directory.
+    :return: String representing the index path.
+    """
+    key = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()
+    return os.path.join(default_cache_dir(), "index-{:s}.sqlite".format(key))
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    Gets all the 3 character substrings of the text given.
+    :param text: String to split.
+    :return: Set of the trigrams.
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex(object):
+    """
+    Posting lists of file ids for every trigram found in the
+    files, over the same text find_in_file searches. Updates add
+    the new and changed files as a new segment and mark the old
+    ids as dead, so files are only read again when they change.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " id INTEGER PRIMARY KEY, path TEXT, size INTEGER, mtime_ns INTEGER,"
+            " inode INTEGER, live INTEGER)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS postings (trigram TEXT, segment INTEGER, ids BLOB)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS postings_trigram ON postings (trigram)")
+        self._db.commit()
+
+    def _live_files(self) -> Dict[str, Tuple[int, int, int, int]]:
+        rows = self._db.execute("SELECT path, id, size, mtime_ns, inode FROM files WHERE live = 1")
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def _write_segment(self, postings: Dict[str, array]) -> NoReturn:
+        segment = self._db.execute("SELECT COALESCE(MAX(segment), -1) + 1 FROM postings").fetchone()[0]
+        self._db.executemany(
+            "INSERT INTO postings VALUES (?, ?, ?)",
+            ((t, segment, ids.tobytes()) for t, ids in postings.items()))
+        self._db.commit()
+
+    def update(self, files: Iterable[str]) -> Tuple[int, int, int]:
+        """
+        Brings the index up to date with the files given, reading
+        only those that are new or changed since the last update.
+        Indexed files missing from the list are dropped.
+        :param files: Iterable of the paths that should be indexed.
+        :return: Tuple with the number of files (re)indexed, dropped
+        and unchanged.
+        """
+        known = self._live_files()
+        seen = set()
+        postings = {}
+        added = 0
+        unchanged = 0
+        in_segment = 0
+
+        for path in files:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            seen.add(path)
+
+            old = known.get(path)
+            if old is not None and old[1:] == (st.st_size, st.st_mtime_ns, st.st_ino):
+                unchanged += 1
+                continue
+            if old is not None:
+                self._db.execute("UPDATE files SET live = 0 WHERE id = ?", (old[0],))
+
+            file_id = self._db.execute(
+                "INSERT INTO files (path, size, mtime_ns, inode, live) VALUES (?, ?, ?, ?, 1)",
+                (path, st.st_size, st.st_mtime_ns, st.st_ino)).lastrowid
+            # Patterns never span lines, so neither do the trigrams
+            # that matter, and big files are read a block at a time
+            grams = set()
+            for _, _, text in io_utils.iter_text_blocks(path):
+                grams |= trigrams(text)
+            for t in grams:
+                postings.setdefault(t, array("I")).append(file_id)
+
+            added += 1
+            in_segment += 1
+            if in_segment >= SEGMENT_FILES:
+                self._write_segment(postings)
+                postings = {}
+                in_segment = 0
+
+        if postings:
+            self._write_segment(postings)
+
+        gone = [(known[p][0],) for p in known if p not in seen]
+        self._db.executemany("UPDATE files SET live = 0 WHERE id = ?", gone)
+        self._db.commit()
+
+        live, dead = self._db.execute(
+            "SELECT COALESCE(SUM(live), 0), COUNT(*) - COALESCE(SUM(live), 0) FROM files").fetchone()
+        if dead > live:
+            self.compact()
+
+        return added, len(gone), unchanged
+
+    def compact(self) -> NoReturn:
+        """
+        Merges all the segments into one, leaving the dead file
+        ids out, and forgets the dead files.
+        :return: void
+        """
+        live = {row[0] for row in self._db.execute("SELECT id FROM files WHERE live = 1")}
+        merged = {}
+        for t, blob in self._db.execute("SELECT trigram, ids FROM postings"):
+            ids = array("I")
+            ids.frombytes(blob)
+            merged.setdefault(t, array("I")).extend(i for i in ids if i in live)
+
+        self._db.execute("DELETE FROM postings")
+        self._db.execute("DELETE FROM files WHERE live = 0")
+        self._write_segment({t: ids for t, ids in merged.items() if ids})
+        self._db.execute("VACUUM")
+
+    def _ids_with(self, trigram: str) -> Set[int]:
+        ids = array("I")
+        for blob, in self._db.execute("SELECT ids FROM postings WHERE trigram = ?", (trigram,)):
+            ids.frombytes(blob)
+        return set(ids)
+
+    def candidates(self, matches: List[str]) -> List[str]:
+        """
+        Gets the indexed files that may contain any of the matches:
+        the ones holding every trigram of at least one of them.
+        Matches shorter than 3 characters select every file.
+        :param matches: List of strings to look for.
+        :return: List of paths, sorted.
+        """
+        live = {row[0]: row[1] for row in self._db.execute("SELECT path, id FROM files WHERE live = 1")}
+        live_ids = set(live.values())
+
+        found = set()
+        for match in set(matches):
+            grams = trigrams(match)
+            if not grams:
+                found = live_ids
+                break
+
+            # Rarest trigrams first, so the set shrinks fast
+            posting_sets = sorted((self._ids_with(t) for t in grams), key=len)
+            ids = posting_sets[0]
+            for other in posting_sets[1:]:
+                if not ids:
+                    break
+                ids = ids & other
+            found |= ids & live_ids
+
+        return sorted(p for p, i in live.items() if i in found)
+
+    def close(self) -> NoReturn:
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()